@@ -5,6 +5,9 @@
 #include "DataFormats/HepMCCandidate/interface/GenParticleFwd.h"
 #include "DataFormats/HepMCCandidate/interface/GenParticle.h"
 
+#include <utility>
+#include <vector>
+
 #define IS_BHADRON_PDGID(id) (((abs(id) / 100) % 10 == 5) || (abs(id) >= 5000 && abs(id) <= 5999))
 #define IS_CHADRON_PDGID(id) (((abs(id) / 100) % 10 == 4) || (abs(id) >= 4000 && abs(id) <= 4999))
 #define IS_NEUTRINO_PDGID(id) ((abs(id) == 12) || (abs(id) == 14) || (abs(id) == 16))
@@ -23,4 +26,15 @@ struct JetFragInfo_t {
 
 JetFragInfo_t analyzeJet(const reco::GenJet &genJet, float tagScale = TAG_SCALE);
 
+// scratch storage for analyzeJetFast, to be kept across calls (e.g. one per module/stream) so that no memory
+// is allocated once it has grown to the largest number of semileptonic B decays in a jet
+struct JetFragScratch_t {
+  // B hadron mothers of the leptons in the jet, and whether the lepton is a tau or tau neutrino
+  std::vector<std::pair<const reco::Candidate *, bool>> semiLepMothers;
+};
+
+// same as analyzeJet, in a single pass over the constituents: the leading and subleading tags are tracked
+// on the fly instead of sorting all tags
+JetFragInfo_t analyzeJetFast(const reco::GenJet &genJet, JetFragScratch_t &scratch, float tagScale = TAG_SCALE);
+
 #endif
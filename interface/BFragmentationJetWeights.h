@@ -0,0 +1,39 @@
+#ifndef _BFragmentationJetWeights_h_
+#define _BFragmentationJetWeights_h_
+
+#include <string>
+#include <vector>
+
+#include "DataFormats/JetReco/interface/GenJetCollection.h"
+
+// Weights of all the variations for all the jets of a GenJet collection, as a single product (packed output of
+// BFragmentationWeightProducer): the variation names, and one contiguous block of weights per variation, in the order
+// of the jets of the collection
+class BFragmentationJetWeights {
+public:
+  BFragmentationJetWeights() : nJets_(0) {}
+  // weights: (variations, jets), i.e. the weights of all the jets for the first variation, then the second one, etc.
+  BFragmentationJetWeights(const reco::GenJetRefProd& jets,
+                           const std::vector<std::string>& names,
+                           std::vector<float> weights);
+
+  const reco::GenJetRefProd& jets() const { return jets_; }
+  const std::vector<std::string>& names() const { return names_; }
+  std::size_t nJets() const { return nJets_; }
+  std::size_t nVariations() const { return names_.size(); }
+  // index of a variation, throws if it is not available
+  std::size_t index(const std::string& name) const;
+  // weights of the i-th variation for all the jets
+  const float* variation(std::size_t iVar) const { return weights_.data() + iVar * nJets_; }
+  float weight(std::size_t iVar, std::size_t iJet) const { return weights_[iVar * nJets_ + iJet]; }
+  // weight of a jet, throws if it does not belong to the collection of the weights
+  float weight(std::size_t iVar, const reco::GenJetRef& jet) const;
+
+private:
+  reco::GenJetRefProd jets_;
+  std::vector<std::string> names_;
+  unsigned int nJets_;
+  std::vector<float> weights_;
+};
+
+#endif
@@ -0,0 +1,50 @@
+#ifndef _BFragmentationWeightTable_h_
+#define _BFragmentationWeightTable_h_
+
+#include <string>
+#include <vector>
+
+// Flat lookup tables for the fragmentation weights, as written by test/buildWeightFile.py (bfragweights_table.root):
+// - pt-dependent weights: one contiguous block per variation, laid out as the TH2 they are built from
+//   (uniform xb bins, pt bins, including under/overflows), such that the evaluation needs no search along xb
+// - pt-averaged weights: one block per variation with the values of the smoothed graph on a uniform xb grid,
+//   linearly interpolated (and extrapolated) as TGraph::Eval
+class BFragmentationWeightTable {
+public:
+  BFragmentationWeightTable(const std::string& path,
+                            const std::vector<std::string>& fragWeights,
+                            const std::vector<std::string>& fragWeightsVsPt);
+
+  // bins of the pt-dependent tables, same as TAxis::FindBin (0 = underflow, nbins + 1 = overflow)
+  int xbBin(float xb) const {
+    if (xb < xbMin_)
+      return 0;
+    if (xb >= xbMax_)
+      return nXb_ + 1;
+    int bin = 1 + static_cast<int>((xb - xbMin_) * xbScale_);
+    return bin > nXb_ ? nXb_ : bin;
+  }
+  int ptBin(double pt) const;
+  // global bin, shared by all the pt-dependent variations
+  int bin(float xb, double pt) const { return ptBin(pt) * (nXb_ + 2) + xbBin(xb); }
+  // weight of the i-th pt-dependent variation in a global bin
+  float vsPt(std::size_t iWgt, int bin) const { return vsPt_[iWgt * vsPtBlockSize_ + bin]; }
+  // weight of the i-th pt-averaged variation
+  float averaged(std::size_t iWgt, float xb) const;
+
+private:
+  int nXb_;
+  double xbMin_, xbMax_, xbScale_;
+  std::vector<double> ptEdges_;
+  std::size_t vsPtBlockSize_;
+  std::vector<float> vsPt_;
+  struct Grid {
+    int n;  // number of intervals
+    double xMin, step;
+  };
+  std::vector<Grid> avgGrids_;
+  std::vector<std::size_t> avgOffsets_;
+  std::vector<float> avg_;
+};
+
+#endif
@@ -1,5 +1,5 @@
 #include "FWCore/Framework/interface/Frameworkfwd.h"
-#include "FWCore/Framework/interface/EDAnalyzer.h"
+#include "FWCore/Framework/interface/global/EDAnalyzer.h"
 #include "FWCore/Framework/interface/Event.h"
 #include "FWCore/Framework/interface/MakerMacros.h"
 #include "FWCore/ParameterSet/interface/ParameterSet.h"
@@ -7,46 +7,136 @@
 #include "CommonTools/UtilAlgos/interface/TFileService.h"
 #include "SimDataFormats/GeneratorProducts/interface/GenEventInfoProduct.h"
 
+#include "TDirectory.h"
 #include "TH1D.h"
 #include "TH2D.h"
+#include "TTree.h"
+#include <array>
 #include <iostream>
 #include <vector>
 #include <map>
+#include <memory>
+#include <mutex>
 #include <algorithm>
+#include <tuple>
 
 #include "TopQuarkAnalysis/BFragmentationAnalyzer/interface/BFragmentationAnalyzerUtils.h"
 
 using namespace std;
 
-class BFragmentationAnalyzer : public edm::EDAnalyzer {
+// histograms of event and tag counts, filled with unit weights at integer values: all the sums of their fills are exact,
+// so each stream fills its own copy (pointers resolved once by name), and the copies are added at the end of the job
+struct BFragCountHists_t {
+  enum { kSemilepbr, kSemilepbrinc, kSemilepbrNorm, kNbtags, kNctags, kNJets, kNorm, kNHists };
+  std::array<TH1*, kNHists> hists;
+};
+
+// histograms of the jet pt and xb, and the debug histograms: the rounding of their sums depends on the order of the fills,
+// so they are filled at the end of the job from the values recorded by all the streams, in the order of the events
+struct BFragOrderedHists_t {
+  enum { kLeadInc, kSubLeadInc, kLeadB, kSubLeadB, kNXbHists };
+  TH1* pt;
+  std::array<TH1*, kNXbHists> xb;
+  std::array<TH2*, kNXbHists> xbPt;
+  // histograms of each debug weight, in the order of the debug weight tokens
+  struct Debug_t {
+    TH1 *pt, *xb_lead_B, *nJets, *norm;
+    TH2* xb_pt_lead_B;
+  };
+  std::vector<Debug_t> debug;
+};
+
+// values filled for a jet with at least one B hadron
+struct BFragJetFills_t {
+  double pt;
+  float xb_lead, xb_subLead, xb_lead_B, xb_subLead_B;
+  bool leadIsB, subLeadIsB;  // whether the leading and subleading tag hadrons are B hadrons
+};
+
+// jets of an event in the values recorded by a stream
+struct BFragEventFills_t {
+  edm::EventID id;
+  std::size_t nGenJets;
+  std::size_t firstJet, nJets;
+};
+
+// values recorded by a stream, and its copies of the count histograms
+struct BFragStreamFills_t {
+  std::map<std::string, std::unique_ptr<TH1>> histos;
+  std::vector<BFragEventFills_t> events;
+  std::vector<BFragJetFills_t> jets;
+  std::vector<float> debugWeights;  // for each jet, the debug weights in the order of the debug weight tokens
+};
+
+// per-jet record of the optional ntuple, for jets with at least one B hadron
+struct BFragJetRecord_t {
+  ULong64_t event;
+  UChar_t nJets;  // number of jets in the event
+  Float_t xb_lead_B, pt;
+  Int_t leadTagId_B;
+  Bool_t hasSemiLepDecay, hasTauSemiLepDecay;
+};
+
+// state of a stream
+struct BFragStreamCache_t {
+  BFragStreamFills_t fills;
+  BFragCountHists_t hists;
+  JetFragScratch_t jetScratch;
+  // per-event buffers for the debug weights, reused across events
+  std::vector<edm::Handle<edm::ValueMap<float>>> debugHandles;
+  // ntuple records of the stream, written to the tree in blocks of whole events
+  std::vector<BFragJetRecord_t> ntupleRecords;
+};
+
+class BFragmentationAnalyzer : public edm::global::EDAnalyzer<edm::StreamCache<BFragStreamCache_t>> {
 public:
   explicit BFragmentationAnalyzer(const edm::ParameterSet&);
   ~BFragmentationAnalyzer();
   static void fillDescriptions(edm::ConfigurationDescriptions& descriptions);
-  virtual void endRun(const edm::Run&, const edm::EventSetup&);
 
 private:
   virtual void beginJob() override;
-  virtual void analyze(const edm::Event&, const edm::EventSetup&) override;
+  virtual std::unique_ptr<BFragStreamCache_t> beginStream(edm::StreamID) const override;
+  virtual void analyze(edm::StreamID, const edm::Event&, const edm::EventSetup&) const override;
+  virtual void endStream(edm::StreamID) const override;
   virtual void endJob() override;
+  void flushNtuple(std::vector<BFragJetRecord_t>& records) const;
+  void fillEvent(const BFragStreamFills_t& fills, const BFragEventFills_t& event, std::vector<float>& weightProducts);
 
   std::vector<int> hadronList_;
+  // output histograms: the copies of the count histograms filled by the streams are added to them at the end of the job,
+  // and the others are filled from the values recorded by the streams
   std::map<std::string, TH1*> histos_;
+  BFragOrderedHists_t orderedHists_;
   edm::Service<TFileService> fs;
   const edm::EDGetTokenT<std::vector<reco::GenJet> > genJetsToken_;
   std::map<std::string, edm::EDGetTokenT<edm::ValueMap<float>>> weightTokens_;
+  std::vector<edm::EDGetTokenT<edm::ValueMap<float>>> debugTokens_;  // same order as weightTokens_
   const edm::EDGetTokenT<GenEventInfoProduct> genTag_;
   // debugging: also filling histograms while applying weights derived from a previous round, for validation
   const bool debug_;
   std::vector<std::string> debugWeights_ { "fragCP5BL", "fragCP5BLdown", "fragCP5BLup", "fragCP5Peterson", "fragCP5Petersondown", "fragCP5Petersonup", "fragCUETP8M2T4BL", "fragCUETP8M2T4BLdefault", "fragCUETP8M2T4BLLHC", "fragCUETP8M2T4BLLHCdown", "fragCUETP8M2T4BLLHCup" };
+  // histograms and values of the streams that have ended, used at the end of the job
+  mutable std::mutex histosMutex_;  // guards the copies of histos_ at the beginning of the streams, and endedStreams_
+  mutable std::map<unsigned int, BFragStreamFills_t> endedStreams_;
+  // compact per-jet ntuple, for replaying the debug histograms with other weights offline (test/replayWeights.py)
+  const bool ntuple_;
+  static constexpr std::size_t ntupleBlockSize_ = 10000;
+  TTree* ntupleTree_;
+  mutable std::mutex ntupleMutex_;  // guards the tree and ntupleRecord_
+  mutable BFragJetRecord_t ntupleRecord_;
 };
 
+constexpr std::size_t BFragmentationAnalyzer::ntupleBlockSize_;
+
 //
 BFragmentationAnalyzer::BFragmentationAnalyzer(const edm::ParameterSet& iConfig)
     : hadronList_(iConfig.getParameter<std::vector<int> >("hadronList")),
       genJetsToken_(consumes<std::vector<reco::GenJet> >(edm::InputTag("particleLevel:jets"))),
       genTag_(consumes<GenEventInfoProduct>(edm::InputTag("generator"))),
-      debug_(iConfig.getUntrackedParameter<bool>("debug", false)) {
+      debug_(iConfig.getUntrackedParameter<bool>("debug", false)),
+      ntuple_(iConfig.getUntrackedParameter<bool>("ntuple", false)),
+      ntupleTree_(nullptr) {
   // hardcoded xb and pt binnings...
   float xb_binning[124] = {0.0,  0.02,  0.04, 0.06,  0.08, 0.1,   0.12, 0.14,  0.16, 0.18,  0.2,  0.22,  0.24, 0.26,
                            0.28, 0.3,   0.32, 0.34,  0.36, 0.38,  0.4,  0.41,  0.42, 0.43,  0.44, 0.45,  0.46, 0.47,
@@ -142,25 +232,80 @@ BFragmentationAnalyzer::BFragmentationAnalyzer(const edm::ParameterSet& iConfig)
   for (auto it: histos_) {
     it.second->Sumw2();
   }
+
+  for (const auto& nm : weightTokens_) {
+    debugTokens_.push_back(nm.second);
+  }
+
+  // the histograms filled at the end of the job
+  orderedHists_.pt = histos_["pt"];
+  const std::array<std::string, BFragOrderedHists_t::kNXbHists> xbNames{{"lead_inc", "subLead_inc", "lead_B", "subLead_B"}};
+  for (std::size_t i = 0; i < BFragOrderedHists_t::kNXbHists; i++) {
+    orderedHists_.xb[i] = histos_["xb_" + xbNames[i]];
+    orderedHists_.xbPt[i] = static_cast<TH2*>(histos_["xb_pt_" + xbNames[i]]);
+  }
+  for (const auto& nm : weightTokens_) {
+    orderedHists_.debug.push_back({histos_["debug_pt_" + nm.first],
+                                   histos_["debug_xb_lead_B_" + nm.first],
+                                   histos_["debug_nJets_" + nm.first],
+                                   histos_["debug_norm_" + nm.first],
+                                   static_cast<TH2*>(histos_["debug_xb_pt_lead_B_" + nm.first])});
+  }
+
+  if (ntuple_) {
+    ntupleTree_ = fs->make<TTree>("jets", "jets with at least one B hadron");
+    ntupleTree_->Branch("event", &ntupleRecord_.event, "event/l");
+    ntupleTree_->Branch("nJets", &ntupleRecord_.nJets, "nJets/b");
+    ntupleTree_->Branch("xb_lead_B", &ntupleRecord_.xb_lead_B, "xb_lead_B/F");
+    ntupleTree_->Branch("pt", &ntupleRecord_.pt, "pt/F");
+    ntupleTree_->Branch("leadTagId_B", &ntupleRecord_.leadTagId_B, "leadTagId_B/I");
+    ntupleTree_->Branch("hasSemiLepDecay", &ntupleRecord_.hasSemiLepDecay, "hasSemiLepDecay/O");
+    ntupleTree_->Branch("hasTauSemiLepDecay", &ntupleRecord_.hasTauSemiLepDecay, "hasTauSemiLepDecay/O");
+  }
 }
 
 //
 BFragmentationAnalyzer::~BFragmentationAnalyzer() {}
 
 //
-void BFragmentationAnalyzer::analyze(const edm::Event& iEvent, const edm::EventSetup& iSetup) {
+std::unique_ptr<BFragStreamCache_t> BFragmentationAnalyzer::beginStream(edm::StreamID) const {
+  auto cache = std::make_unique<BFragStreamCache_t>();
+  // same order as BFragCountHists_t
+  const std::array<std::string, BFragCountHists_t::kNHists> countNames{
+      {"semilepbr", "semilepbrinc", "semilepbr_norm", "nbtags", "nctags", "nJets", "norm"}};
+  {
+    // the copies are owned by the stream, not by the output file
+    std::lock_guard<std::mutex> lock(histosMutex_);
+    TDirectory::TContext context(nullptr);
+    for (const auto& name : countNames) {
+      TH1* hist = static_cast<TH1*>(histos_.at(name)->Clone());
+      hist->SetDirectory(nullptr);
+      cache->fills.histos[name].reset(hist);
+    }
+  }
+  // resolve the histograms once, such that no lookups by name are needed in the event loop
+  for (std::size_t i = 0; i < BFragCountHists_t::kNHists; i++) {
+    cache->hists.hists[i] = cache->fills.histos.at(countNames[i]).get();
+  }
+  cache->debugHandles.resize(debugTokens_.size());
+  if (ntuple_) {
+    cache->ntupleRecords.reserve(ntupleBlockSize_ + 32);
+  }
+  return cache;
+}
+
+//
+void BFragmentationAnalyzer::analyze(edm::StreamID streamID, const edm::Event& iEvent, const edm::EventSetup& iSetup) const {
+  BFragStreamCache_t& cache = *streamCache(streamID);
+  const BFragCountHists_t& hists = cache.hists;
+  BFragStreamFills_t& fills = cache.fills;
   //
   edm::Handle<std::vector<reco::GenJet> > genJets;
   iEvent.getByToken(genJetsToken_, genJets);
 
   // debugging: for retrieving weights from a previous round
-  std::map<std::string, float> debugWeightProducts;
-  std::map<std::string, edm::Handle<edm::ValueMap<float>>> weightHandles;
-  for (auto& wgt_token : weightTokens_) {
-    edm::Handle<edm::ValueMap<float>> handle;
-    iEvent.getByToken(wgt_token.second, handle);
-    weightHandles.emplace(wgt_token.first, handle);
-    debugWeightProducts.emplace(wgt_token.first, 1.);
+  for (std::size_t i = 0; i < debugTokens_.size(); i++) {
+    iEvent.getByToken(debugTokens_[i], cache.debugHandles[i]);
   }
 
   edm::Handle<GenEventInfoProduct> genInfo;
@@ -168,93 +313,206 @@ void BFragmentationAnalyzer::analyze(const edm::Event& iEvent, const edm::EventS
   // double weight = genInfo->weight(); // event weight: not used...
   
   std::size_t nJets = genJets->size();
-  histos_["nJets"]->Fill(nJets);
-  histos_["norm"]->Fill(0.);
+  hists.hists[BFragCountHists_t::kNJets]->Fill(nJets);
+  hists.hists[BFragCountHists_t::kNorm]->Fill(0.);
+
+  // the pt, xb and debug weights of the jets are recorded, and filled at the end of the job in the order of the events
+  BFragEventFills_t event{iEvent.id(), nJets, fills.jets.size(), 0};
 
   for (std::size_t iJet=0; iJet < nJets; iJet++) {
-    const reco::GenJet genJet = genJets->at(iJet);
+    const reco::GenJet& genJet = (*genJets)[iJet];
     // analyze the "tag" gen particles which are clustered in this jet
-    JetFragInfo_t jinfo = analyzeJet(genJet);
+    JetFragInfo_t jinfo = analyzeJetFast(genJet, cache.jetScratch);
 
-    histos_["nbtags"]->Fill(jinfo.nbtags);
-    histos_["nctags"]->Fill(jinfo.nctags);
+    hists.hists[BFragCountHists_t::kNbtags]->Fill(jinfo.nbtags);
+    hists.hists[BFragCountHists_t::kNctags]->Fill(jinfo.nctags);
 
     if (jinfo.nbtags == 0) {
       continue;
     }
 
-    histos_["pt"]->Fill(genJet.pt());
-
-    // fill only if leading tag hadron is a B hadron
-    if (IS_BHADRON_PDGID(abs(jinfo.leadTagId))) {
-      histos_["xb_lead_inc"]->Fill(jinfo.xb_lead);
-      static_cast<TH2*>(histos_["xb_pt_lead_inc"])->Fill(jinfo.xb_lead, genJet.pt());
-    }
-    // fill only if sub-leading tag hadron is a B hadron
-    if (IS_BHADRON_PDGID(abs(jinfo.subLeadTagId))) {
-      histos_["xb_subLead_inc"]->Fill(jinfo.xb_subLead);
-      static_cast<TH2*>(histos_["xb_pt_subLead_inc"])->Fill(jinfo.xb_subLead, genJet.pt());
-    }
-    // fill with leading tag B hadron (might not exist)
-    histos_["xb_lead_B"]->Fill(jinfo.xb_lead_B);
-    static_cast<TH2*>(histos_["xb_pt_lead_B"])->Fill(jinfo.xb_lead_B, genJet.pt());
-    // fill with subleading tag B hadron (might not exist)
-    histos_["xb_subLead_B"]->Fill(jinfo.xb_subLead_B);
-    static_cast<TH2*>(histos_["xb_pt_subLead_B"])->Fill(jinfo.xb_subLead_B, genJet.pt());
+    const double pt = genJet.pt();
+    fills.jets.push_back({pt,
+                          jinfo.xb_lead,
+                          jinfo.xb_subLead,
+                          jinfo.xb_lead_B,
+                          jinfo.xb_subLead_B,
+                          IS_BHADRON_PDGID(abs(jinfo.leadTagId)),
+                          IS_BHADRON_PDGID(abs(jinfo.subLeadTagId))});
+    event.nJets++;
 
     int absid = abs(jinfo.leadTagId_B);
     //exclusive histograms
-    std::vector<int>::iterator hit = std::find(hadronList_.begin(), hadronList_.end(), absid);
-    histos_["semilepbr_norm"]->Fill(0);
+    auto hit = std::find(hadronList_.begin(), hadronList_.end(), absid);
+    hists.hists[BFragCountHists_t::kSemilepbrNorm]->Fill(0);
     if (hit != hadronList_.end()) {
-      histos_["semilepbr_norm"]->Fill(1 + hit - hadronList_.begin());
+      hists.hists[BFragCountHists_t::kSemilepbrNorm]->Fill(1 + hit - hadronList_.begin());
     }
     if (jinfo.hasSemiLepDecay) {
       //inclusive histos
       if (!jinfo.hasTauSemiLepDecay) {
-        histos_["semilepbr"]->Fill(0);
+        hists.hists[BFragCountHists_t::kSemilepbr]->Fill(0);
       }
-      histos_["semilepbrinc"]->Fill(0);
+      hists.hists[BFragCountHists_t::kSemilepbrinc]->Fill(0);
 
       if (hit != hadronList_.end()) {
         if (!jinfo.hasTauSemiLepDecay) {
-          histos_["semilepbr"]->Fill(1 + hit - hadronList_.begin());
+          hists.hists[BFragCountHists_t::kSemilepbr]->Fill(1 + hit - hadronList_.begin());
         }
-        histos_["semilepbrinc"]->Fill(1 + hit - hadronList_.begin());
+        hists.hists[BFragCountHists_t::kSemilepbrinc]->Fill(1 + hit - hadronList_.begin());
       }
     }
 
+    if (ntuple_) {
+      cache.ntupleRecords.push_back({iEvent.id().event(),
+                                     static_cast<UChar_t>(std::min<std::size_t>(nJets, 255)),
+                                     jinfo.xb_lead_B,
+                                     static_cast<Float_t>(pt),
+                                     jinfo.leadTagId_B,
+                                     jinfo.hasSemiLepDecay,
+                                     jinfo.hasTauSemiLepDecay});
+    }
+
+    if (debug_) {
+        for (std::size_t i = 0; i < cache.debugHandles.size(); i++) {
+            fills.debugWeights.push_back(cache.debugHandles[i]->get(genJets.id(), iJet));
+        }
+    }
+  }
+
+  // the debug histograms of the number of jets are filled for all events
+  if (event.nJets > 0 || debug_) {
+    fills.events.push_back(event);
+  }
+
+  if (ntuple_ && cache.ntupleRecords.size() >= ntupleBlockSize_) {
+    flushNtuple(cache.ntupleRecords);
+  }
+}
+
+//
+void BFragmentationAnalyzer::fillEvent(const BFragStreamFills_t& fills,
+                                       const BFragEventFills_t& event,
+                                       std::vector<float>& weightProducts) {
+  const BFragOrderedHists_t& hists = orderedHists_;
+  std::fill(weightProducts.begin(), weightProducts.end(), 1.);
+
+  for (std::size_t iJet = event.firstJet; iJet < event.firstJet + event.nJets; iJet++) {
+    const BFragJetFills_t& jet = fills.jets[iJet];
+    hists.pt->Fill(jet.pt);
+
+    // fill only if leading tag hadron is a B hadron
+    if (jet.leadIsB) {
+      hists.xb[BFragOrderedHists_t::kLeadInc]->Fill(jet.xb_lead);
+      hists.xbPt[BFragOrderedHists_t::kLeadInc]->Fill(jet.xb_lead, jet.pt);
+    }
+    // fill only if sub-leading tag hadron is a B hadron
+    if (jet.subLeadIsB) {
+      hists.xb[BFragOrderedHists_t::kSubLeadInc]->Fill(jet.xb_subLead);
+      hists.xbPt[BFragOrderedHists_t::kSubLeadInc]->Fill(jet.xb_subLead, jet.pt);
+    }
+    // fill with leading tag B hadron (might not exist)
+    hists.xb[BFragOrderedHists_t::kLeadB]->Fill(jet.xb_lead_B);
+    hists.xbPt[BFragOrderedHists_t::kLeadB]->Fill(jet.xb_lead_B, jet.pt);
+    // fill with subleading tag B hadron (might not exist)
+    hists.xb[BFragOrderedHists_t::kSubLeadB]->Fill(jet.xb_subLead_B);
+    hists.xbPt[BFragOrderedHists_t::kSubLeadB]->Fill(jet.xb_subLead_B, jet.pt);
+
     if (debug_) {
         // jet histograms are filled per jet: for each jet, use the weight computing using this jet
         // note: this is different from an analysis where the weights for all jets are multiplied as an event weight
-        edm::Ref<std::vector<reco::GenJet>> genJetRef(genJets, iJet);
-        for (auto& wgt_handle: weightHandles) {
-            double fragWeight = (*(wgt_handle.second))[genJetRef];
-            histos_["debug_pt_" + wgt_handle.first]->Fill(genJet.pt(), fragWeight);
-            histos_["debug_xb_lead_B_" + wgt_handle.first]->Fill(jinfo.xb_lead_B, fragWeight);
-            static_cast<TH2*>(histos_["debug_xb_pt_lead_B_" + wgt_handle.first])->Fill(jinfo.xb_lead_B, genJet.pt(), fragWeight);
-            debugWeightProducts[wgt_handle.first] *= fragWeight;
+        const float* jetWeights = &fills.debugWeights[iJet * hists.debug.size()];
+        for (std::size_t i = 0; i < hists.debug.size(); i++) {
+            const BFragOrderedHists_t::Debug_t& slot = hists.debug[i];
+            double fragWeight = jetWeights[i];
+            slot.pt->Fill(jet.pt, fragWeight);
+            slot.xb_lead_B->Fill(jet.xb_lead_B, fragWeight);
+            slot.xb_pt_lead_B->Fill(jet.xb_lead_B, jet.pt, fragWeight);
+            weightProducts[i] *= fragWeight;
         }
     }
   }
 
   if (debug_) {
       // here we use the product of the weights for all jets (histograms filled per event)
-      for (auto& nm_wgtProd: debugWeightProducts) {
-          histos_["debug_nJets_" + nm_wgtProd.first]->Fill(nJets, nm_wgtProd.second);
-          histos_["debug_norm_" + nm_wgtProd.first]->Fill(0., nm_wgtProd.second);
+      for (std::size_t i = 0; i < hists.debug.size(); i++) {
+          hists.debug[i].nJets->Fill(event.nGenJets, weightProducts[i]);
+          hists.debug[i].norm->Fill(0., weightProducts[i]);
       }
   }
 }
 
+//
+void BFragmentationAnalyzer::flushNtuple(std::vector<BFragJetRecord_t>& records) const {
+  std::lock_guard<std::mutex> lock(ntupleMutex_);
+  for (const auto& record : records) {
+    ntupleRecord_ = record;
+    ntupleTree_->Fill();
+  }
+  records.clear();
+}
+
 //
 void BFragmentationAnalyzer::beginJob() {}
 
 //
-void BFragmentationAnalyzer::endRun(const edm::Run& iRun, const edm::EventSetup& iSetup) {}
+void BFragmentationAnalyzer::endStream(edm::StreamID streamID) const {
+  if (ntuple_) {
+    flushNtuple(streamCache(streamID)->ntupleRecords);
+  }
+  std::lock_guard<std::mutex> lock(histosMutex_);
+  endedStreams_[streamID.value()] = std::move(streamCache(streamID)->fills);
+}
 
 //
-void BFragmentationAnalyzer::endJob() {}
+void BFragmentationAnalyzer::endJob() {
+  // the count histograms of the streams are exact, so they can be added in any order
+  std::vector<std::pair<const BFragStreamFills_t*, const BFragEventFills_t*>> events;
+  for (const auto& stream : endedStreams_) {
+    for (const auto& it : stream.second.histos) {
+      histos_[it.first]->Add(it.second.get());
+    }
+    for (const auto& event : stream.second.events) {
+      events.emplace_back(&stream.second, &event);
+    }
+  }
+
+  // the other histograms are filled in the order of the events, as in a single-stream job on the same events, such that
+  // the output does not depend on the assignment of the events to the streams; events with the same ID (e.g. from
+  // several input files) are ordered by their recorded values
+  auto jetBefore = [](const BFragJetFills_t& a, const BFragJetFills_t& b) {
+    return std::tie(a.pt, a.xb_lead, a.xb_subLead, a.xb_lead_B, a.xb_subLead_B, a.leadIsB, a.subLeadIsB) <
+           std::tie(b.pt, b.xb_lead, b.xb_subLead, b.xb_lead_B, b.xb_subLead_B, b.leadIsB, b.subLeadIsB);
+  };
+  const std::size_t nDebug = orderedHists_.debug.size();
+  auto eventBefore = [&jetBefore, nDebug](const std::pair<const BFragStreamFills_t*, const BFragEventFills_t*>& a,
+                                          const std::pair<const BFragStreamFills_t*, const BFragEventFills_t*>& b) {
+    const BFragEventFills_t &ea = *a.second, &eb = *b.second;
+    if (ea.id != eb.id) {
+      return ea.id < eb.id;
+    }
+    if (ea.nGenJets != eb.nGenJets || ea.nJets != eb.nJets) {
+      return std::tie(ea.nGenJets, ea.nJets) < std::tie(eb.nGenJets, eb.nJets);
+    }
+    auto jetsA = a.first->jets.begin() + ea.firstJet, jetsB = b.first->jets.begin() + eb.firstJet;
+    if (std::lexicographical_compare(jetsA, jetsA + ea.nJets, jetsB, jetsB + eb.nJets, jetBefore)) {
+      return true;
+    }
+    if (std::lexicographical_compare(jetsB, jetsB + eb.nJets, jetsA, jetsA + ea.nJets, jetBefore)) {
+      return false;
+    }
+    auto weightsA = a.first->debugWeights.begin() + ea.firstJet * nDebug;
+    auto weightsB = b.first->debugWeights.begin() + eb.firstJet * nDebug;
+    return std::lexicographical_compare(weightsA, weightsA + ea.nJets * nDebug, weightsB, weightsB + eb.nJets * nDebug);
+  };
+  std::sort(events.begin(), events.end(), eventBefore);
+
+  std::vector<float> weightProducts(nDebug);
+  for (const auto& event : events) {
+    fillEvent(*event.first, *event.second, weightProducts);
+  }
+  endedStreams_.clear();
+}
 
 //
 void BFragmentationAnalyzer::fillDescriptions(edm::ConfigurationDescriptions& descriptions) {
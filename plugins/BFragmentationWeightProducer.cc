@@ -1,12 +1,17 @@
+#include <algorithm>
+#include <array>
+#include <atomic>
+#include <chrono>
 #include <memory>
 #include <string>
-#include <map>
+#include <vector>
 
 #include "FWCore/Framework/interface/Frameworkfwd.h"
 #include "FWCore/Framework/interface/stream/EDProducer.h"
 
 #include "FWCore/Framework/interface/Event.h"
 #include "FWCore/Framework/interface/MakerMacros.h"
+#include "FWCore/MessageLogger/interface/MessageLogger.h"
 
 #include "FWCore/ParameterSet/interface/FileInPath.h"
 
@@ -17,6 +22,8 @@
 #include "DataFormats/Common/interface/ValueMap.h"
 
 #include "TopQuarkAnalysis/BFragmentationAnalyzer/interface/BFragmentationAnalyzerUtils.h"
+#include "TopQuarkAnalysis/BFragmentationAnalyzer/interface/BFragmentationJetWeights.h"
+#include "TopQuarkAnalysis/BFragmentationAnalyzer/interface/BFragmentationWeightTable.h"
 
 #include "TFile.h"
 #include "TGraph.h"
@@ -24,11 +31,29 @@
 
 using namespace std;
 
-class BFragmentationWeightProducer : public edm::stream::EDProducer<> {
+// B hadrons for which BR weights are available
+constexpr std::array<int, 4> bfragBrHadrons{{511, 521, 531, 5122}};
+
+// weights of all the variations, read once per job and shared (read-only) by all the streams;
+// the per-variation containers are indexed as the configured lists of weights
+struct BFragmentationWeights {
+  // BR weights are stored as graphs, which are only evaluated at the (signed) hadron IDs: tabulated per variation,
+  // for each hadron in bfragBrHadrons without and with semileptonic decay
+  std::vector<std::array<float, 2 * bfragBrHadrons.size()>> brWgt;
+  std::vector<std::unique_ptr<const TH2>> fragWgtPtHist;  // frag weights vs. pt are stored as histograms
+  std::vector<std::unique_ptr<const TGraph>> fragWgtGr;   // pt-averaged frag weights are stored as graphs
+  // flat lookup tables for the frag weights, used instead of the graphs and histograms if a table file is given
+  std::unique_ptr<const BFragmentationWeightTable> weightTable;
+  mutable std::atomic<unsigned int> nStreams{0};
+};
+
+class BFragmentationWeightProducer : public edm::stream::EDProducer<edm::GlobalCache<BFragmentationWeights>> {
 public:
-  explicit BFragmentationWeightProducer(const edm::ParameterSet&);
+  explicit BFragmentationWeightProducer(const edm::ParameterSet&, const BFragmentationWeights*);
   ~BFragmentationWeightProducer();
 
+  static std::unique_ptr<BFragmentationWeights> initializeGlobalCache(const edm::ParameterSet&);
+  static void globalEndJob(const BFragmentationWeights*);
   static void fillDescriptions(edm::ConfigurationDescriptions& descriptions);
 
 private:
@@ -40,59 +65,125 @@ private:
   const std::vector<std::string> br_weights_;
   const std::vector<std::string> frag_weights_;
   const std::vector<std::string> frag_weights_vs_pt_;
-  std::map<std::string, TGraph*> brWgtGr_;     // BR weights are stored as graphs
-  std::map<std::string, TH2*> fragWgtPtHist_;  // frag weights vs. pt are stored as histograms
-  std::map<std::string, TGraph*> fragWgtGr_;   // pt-averaged frag weights are stored as graphs
+  // all the per-variation containers below are indexed by slot: BR weights, then frag weights, then frag weights vs. pt
+  std::size_t fragSlot_, fragVsPtSlot_;
+  std::vector<std::string> names_;  // names of the variations (and of the ValueMaps)
+  // put all the variations in a single BFragmentationJetWeights product instead of one ValueMap per variation
+  const bool packed_;
+  std::vector<edm::EDPutTokenT<edm::ValueMap<float>>> putTokens_;
+  edm::EDPutTokenT<BFragmentationJetWeights> packedToken_;
+  std::vector<std::vector<float>> jetWeights_;  // per-variation buffers, reused across events
+  JetFragScratch_t jetScratch_;
+  // report the time spent per event at the end of the job
+  const bool reportTiming_;
+  std::size_t nEvents_, nJets_;
+  std::chrono::steady_clock::duration time_;
 };
 
 //
-BFragmentationWeightProducer::BFragmentationWeightProducer(const edm::ParameterSet& iConfig)
+BFragmentationWeightProducer::BFragmentationWeightProducer(const edm::ParameterSet& iConfig,
+                                                           const BFragmentationWeights* weights)
     : genJetsToken_(consumes<std::vector<reco::GenJet>>(iConfig.getParameter<edm::InputTag>("src"))),
       br_weights_(iConfig.getParameter<std::vector<std::string>>("br_weights")),
       frag_weights_(iConfig.getParameter<std::vector<std::string>>("frag_weights")),
-      frag_weights_vs_pt_(iConfig.getParameter<std::vector<std::string>>("frag_weights_vs_pt")) {
-  //readout weights from file and declare them for the producer
+      frag_weights_vs_pt_(iConfig.getParameter<std::vector<std::string>>("frag_weights_vs_pt")),
+      fragSlot_(br_weights_.size()),
+      fragVsPtSlot_(br_weights_.size() + frag_weights_.size()),
+      packed_(iConfig.exists("packed") && iConfig.getParameter<bool>("packed")),
+      reportTiming_(iConfig.getUntrackedParameter<bool>("reportTiming", false)),
+      nEvents_(0),
+      nJets_(0),
+      time_(0) {
+  //declare the weights for the producer
+  names_.insert(names_.end(), br_weights_.begin(), br_weights_.end());
+  names_.insert(names_.end(), frag_weights_.begin(), frag_weights_.end());
+  for (const auto& wgt : frag_weights_vs_pt_) {
+    names_.push_back(wgt + "VsPt");
+  }
+  if (packed_) {
+    packedToken_ = produces<BFragmentationJetWeights>();
+  } else {
+    for (const auto& name : names_) {
+      putTokens_.push_back(produces<edm::ValueMap<float>>(name));
+    }
+  }
+  jetWeights_.resize(names_.size());
+  weights->nStreams++;
+}
 
-  edm::FileInPath fp = iConfig.getParameter<edm::FileInPath>("br_weight_file");
-  TFile* fIn = TFile::Open(fp.fullPath().c_str());
-  for (const auto& wgt : br_weights_) {
-    produces<edm::ValueMap<float>>(wgt);
-    TGraph* gr = static_cast<TGraph*>(fIn->Get(wgt.c_str()));
-    if (!gr) {
+namespace {
+  TFile* openWeightFile(const edm::FileInPath& fp) {
+    TFile* fIn = TFile::Open(fp.fullPath().c_str());
+    if (!fIn || fIn->IsZombie()) {
+      throw cms::Exception("FileOpenError") << "Could not open weight file " << fp.fullPath() << std::endl;
+    }
+    return fIn;
+  }
+
+  template <typename T>
+  std::unique_ptr<T> getWeightObject(TFile* fIn, const edm::FileInPath& fp, const std::string& name) {
+    std::unique_ptr<T> obj(static_cast<T*>(fIn->Get(name.c_str())));
+    if (!obj) {
       throw cms::Exception("ObjectNotFound")
-          << "Could not load object " << wgt << " from " << fp.fullPath() << std::endl;
+          << "Could not load object " << name << " from " << fp.fullPath() << std::endl;
     }
-    brWgtGr_[wgt] = gr;
+    return obj;
+  }
+}  // namespace
+
+//
+std::unique_ptr<BFragmentationWeights> BFragmentationWeightProducer::initializeGlobalCache(
+    const edm::ParameterSet& iConfig) {
+  auto weights = std::make_unique<BFragmentationWeights>();
+
+  //readout weights from file
+  edm::FileInPath fp = iConfig.getParameter<edm::FileInPath>("br_weight_file");
+  TFile* fIn = openWeightFile(fp);
+  for (const auto& wgt : iConfig.getParameter<std::vector<std::string>>("br_weights")) {
+    auto gr = getWeightObject<TGraph>(fIn, fp, wgt);
+    std::array<float, 2 * bfragBrHadrons.size()> values;
+    for (std::size_t i = 0; i < bfragBrHadrons.size(); i++) {
+      values[2 * i] = gr->Eval(-bfragBrHadrons[i]);
+      values[2 * i + 1] = gr->Eval(bfragBrHadrons[i]);
+    }
+    weights->brWgt.push_back(values);
   }
   fIn->Close();
+  delete fIn;
+
+  const auto fragWeights = iConfig.getParameter<std::vector<std::string>>("frag_weights");
+  const auto fragWeightsVsPt = iConfig.getParameter<std::vector<std::string>>("frag_weights_vs_pt");
+  if (iConfig.exists("weight_table_file")) {
+    fp = iConfig.getParameter<edm::FileInPath>("weight_table_file");
+    weights->weightTable = std::make_unique<BFragmentationWeightTable>(fp.fullPath(), fragWeights, fragWeightsVsPt);
+    return weights;
+  }
 
   fp = iConfig.getParameter<edm::FileInPath>("frag_weight_file");
-  fIn = TFile::Open(fp.fullPath().c_str());
-  for (const auto& wgt : frag_weights_) {
-    produces<edm::ValueMap<float>>(wgt);
-    std::string grName = wgt + "_smooth";
-    TGraph* gr = static_cast<TGraph*>(fIn->Get(grName.c_str()));
-    if (!gr) {
-      throw cms::Exception("ObjectNotFound")
-          << "Could not load object " << grName << " from " << fp.fullPath() << std::endl;
-    }
-    fragWgtGr_[wgt] = gr;
+  fIn = openWeightFile(fp);
+  for (const auto& wgt : fragWeights) {
+    weights->fragWgtGr.push_back(getWeightObject<TGraph>(fIn, fp, wgt + "_smooth"));
   }
   fIn->Close();
+  delete fIn;
 
   fp = iConfig.getParameter<edm::FileInPath>("frag_weight_vs_pt_file");
-  fIn = TFile::Open(fp.fullPath().c_str());
-  for (const auto& wgt : frag_weights_vs_pt_) {
-    produces<edm::ValueMap<float>>(wgt + "VsPt");
-    std::string histName = wgt + "_smooth";
-    TH2* hist = static_cast<TH2*>(fIn->Get(histName.c_str()));
-    if (!hist) {
-      throw cms::Exception("ObjectNotFound")
-          << "Could not load object " << histName << " from " << fp.fullPath() << std::endl;
-    }
-    fragWgtPtHist_[wgt] = hist;
+  fIn = openWeightFile(fp);
+  for (const auto& wgt : fragWeightsVsPt) {
+    auto hist = getWeightObject<TH2>(fIn, fp, wgt + "_smooth");
+    // detach from the file, which would otherwise delete the histogram when closed
+    hist->SetDirectory(nullptr);
+    weights->fragWgtPtHist.push_back(std::move(hist));
   }
   fIn->Close();
+  delete fIn;
+
+  return weights;
+}
+
+//
+void BFragmentationWeightProducer::globalEndJob(const BFragmentationWeights* weights) {
+  edm::LogInfo("BFragmentationWeightProducer") << "Weights loaded once and shared by " << weights->nStreams << " streams";
 }
 
 //
@@ -101,75 +192,84 @@ BFragmentationWeightProducer::~BFragmentationWeightProducer() {}
 //
 void BFragmentationWeightProducer::produce(edm::Event& iEvent, const edm::EventSetup& iSetup) {
   using namespace edm;
+  const auto start = std::chrono::steady_clock::now();
+
+  const BFragmentationWeights& weights = *globalCache();
   edm::Handle<std::vector<reco::GenJet>> genJets;
   iEvent.getByToken(genJetsToken_, genJets);
-  std::map<std::string, std::vector<float>> jetWeights;
-  for (const auto& wgt: br_weights_) {
-    jetWeights[wgt] = std::vector<float>();
-  }
-  for (const auto& wgt: frag_weights_) {
-    jetWeights[wgt] = std::vector<float>();
-  }
-  for (const auto& wgt: frag_weights_vs_pt_) {
-    jetWeights[wgt + "VsPt"] = std::vector<float>();
+  const std::size_t nJets = genJets->size();
+  for (auto& values : jetWeights_) {
+    values.resize(nJets);
   }
 
-  for (auto genJet : *genJets) {
+  for (std::size_t iJet = 0; iJet < nJets; iJet++) {
+    const reco::GenJet& genJet = (*genJets)[iJet];
     //map the gen particles which are clustered in this jet
-    JetFragInfo_t jinfo = analyzeJet(genJet);
+    JetFragInfo_t jinfo = analyzeJetFast(genJet, jetScratch_);
+    const bool hasB = jinfo.leadTagId_B != 0;
+    // pt-dependent weights: always use weight=1 if xb>1 or if outside of pT range
+    const bool inPtRange = hasB && jinfo.xb_lead_B < 1 && genJet.pt() >= 30;
 
-    //evaluate the weight to an alternative fragmentation model (if a tag id is available)
-    for (const auto& wgt: frag_weights_) {
-      if (jinfo.leadTagId_B != 0) {
+    if (weights.weightTable) {
+      // flat tables: the xb and pt bins are found only once for all the pt-dependent variations
+      for (std::size_t i = 0; i < frag_weights_.size(); i++) {
+        jetWeights_[fragSlot_ + i][iJet] = hasB ? weights.weightTable->averaged(i, jinfo.xb_lead_B) : 1.;
+      }
+      const int bin = inPtRange ? weights.weightTable->bin(jinfo.xb_lead_B, genJet.pt()) : -1;
+      for (std::size_t i = 0; i < frag_weights_vs_pt_.size(); i++) {
+        jetWeights_[fragVsPtSlot_ + i][iJet] = inPtRange ? weights.weightTable->vsPt(i, bin) : 1.;
+      }
+    } else {
+      //evaluate the weight to an alternative fragmentation model (if a tag id is available)
+      for (std::size_t i = 0; i < frag_weights_.size(); i++) {
         // here we can use the bins above xb=1
-        jetWeights[wgt].push_back(fragWgtGr_[wgt]->Eval(jinfo.xb_lead_B));
-      } else {
-        jetWeights[wgt].push_back(1.);
+        jetWeights_[fragSlot_ + i][iJet] = hasB ? weights.fragWgtGr[i]->Eval(jinfo.xb_lead_B) : 1.;
       }
-    }
 
-    for (const auto& wgt: frag_weights_vs_pt_) {
-      // here always use weight=1 if xb>1 or if outside of pT range
-      if (jinfo.leadTagId_B != 0 && jinfo.xb_lead_B < 1 && genJet.pt() >= 30) {
-        TH2* hist = fragWgtPtHist_[wgt];
-        size_t xb_bin = hist->GetXaxis()->FindBin(jinfo.xb_lead_B);
-        size_t pt_bin = hist->GetYaxis()->FindBin(genJet.pt());
-        float weight = hist->GetBinContent(xb_bin, pt_bin);
-        jetWeights[wgt + "VsPt"].push_back(weight);
-      } else {
-        jetWeights[wgt + "VsPt"].push_back(1.);
+      for (std::size_t i = 0; i < frag_weights_vs_pt_.size(); i++) {
+        float weight(1.0);
+        if (inPtRange) {
+          // FindFixBin: same as FindBin for these axes, without modifying the shared histogram
+          const TH2* hist = weights.fragWgtPtHist[i].get();
+          size_t xb_bin = hist->GetXaxis()->FindFixBin(jinfo.xb_lead_B);
+          size_t pt_bin = hist->GetYaxis()->FindFixBin(genJet.pt());
+          weight = hist->GetBinContent(xb_bin, pt_bin);
+        }
+        jetWeights_[fragVsPtSlot_ + i][iJet] = weight;
       }
     }
 
-    for (const auto& wgt: br_weights_) {
-      float weight(1.0);
-      int absBid(abs(jinfo.leadTagId_B));
-      if (absBid == 511 || absBid == 521 || absBid == 531 || absBid == 5122) {
-        int bid(jinfo.hasSemiLepDecay ? absBid : -absBid);
-        weight = brWgtGr_[wgt]->Eval(bid);
-      }
-      jetWeights[wgt].push_back(weight);
+    // BR weights, only for the hadrons in the list
+    const int absBid(abs(jinfo.leadTagId_B));
+    const auto hadron = std::find(bfragBrHadrons.begin(), bfragBrHadrons.end(), absBid);
+    for (std::size_t i = 0; i < br_weights_.size(); i++) {
+      jetWeights_[i][iJet] = hadron != bfragBrHadrons.end()
+                                 ? weights.brWgt[i][2 * (hadron - bfragBrHadrons.begin()) + jinfo.hasSemiLepDecay]
+                                 : 1.;
     }
-
-    /*
-       if(IS_BHADRON_PDGID(absBid))
-	 cout << genJet.pt()       << " GeV jet matched with " << absBid 
-	      << " upFrag: "       << wgtGr_["upFrag"]->Eval(jinfo.xb)
-	      << " centralFrag: "  << wgtGr_["centralFrag"]->Eval(jinfo.xb)
-	      << " downFrag: "     << wgtGr_["downFrag"]->Eval(jinfo.xb)
-	      << " PetersonFrag: " << wgtGr_["PetersonFrag"]->Eval(jinfo.xb)
-	      << " semilep+: "     << semilepbrUp 
-	      << " semilep-: "     << semilepbrDown << endl;
-       */
   }
 
   //put in event
-  for (auto it : jetWeights) {
+  if (packed_) {
+    std::vector<float> block;
+    block.reserve(jetWeights_.size() * nJets);
+    for (const auto& values : jetWeights_) {
+      block.insert(block.end(), values.begin(), values.end());
+    }
+    iEvent.emplace(packedToken_, reco::GenJetRefProd(genJets), names_, std::move(block));
+  }
+  for (std::size_t i = 0; i < putTokens_.size(); i++) {
     auto valMap = std::make_unique<ValueMap<float>>();
     edm::ValueMap<float>::Filler filler(*valMap);
-    filler.insert(genJets, it.second.begin(), it.second.end());
+    filler.insert(genJets, jetWeights_[i].begin(), jetWeights_[i].end());
     filler.fill();
-    iEvent.put(std::move(valMap), it.first);
+    iEvent.put(putTokens_[i], std::move(valMap));
+  }
+
+  if (reportTiming_) {
+    time_ += std::chrono::steady_clock::now() - start;
+    nEvents_++;
+    nJets_ += nJets;
   }
 }
 
@@ -177,7 +277,14 @@ void BFragmentationWeightProducer::produce(edm::Event& iEvent, const edm::EventS
 void BFragmentationWeightProducer::beginStream(edm::StreamID) {}
 
 //
-void BFragmentationWeightProducer::endStream() {}
+void BFragmentationWeightProducer::endStream() {
+  if (reportTiming_ && nEvents_ > 0) {
+    const double us = std::chrono::duration<double, std::micro>(time_).count();
+    edm::LogPrint("BFragmentationWeightProducer")
+        << "Processed " << nEvents_ << " events and " << nJets_ << " jets in " << us / 1000. << " ms: " << us / nEvents_
+        << " us per event, " << (nJets_ > 0 ? 1000. * us / nJets_ : 0.) << " ns per jet (including jet analysis)";
+  }
+}
 
 //
 void BFragmentationWeightProducer::fillDescriptions(edm::ConfigurationDescriptions& descriptions) {
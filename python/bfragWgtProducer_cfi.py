@@ -2,6 +2,8 @@ import FWCore.ParameterSet.Config as cms
 
 bfragWgtProducer = cms.EDProducer('BFragmentationWeightProducer',
                                   src = cms.InputTag("particleLevel:jets"),
+                                  # put all the weights in a single BFragmentationJetWeights product instead of one ValueMap per variation
+                                  packed = cms.bool(False),
                                   br_weight_file = cms.FileInPath('TopQuarkAnalysis/BFragmentationAnalyzer/data/bdecayweights.root'),
                                   br_weights = cms.vstring(["semilepbrup", "semilepbrdown"]),
                                   frag_weight_file = cms.FileInPath('TopQuarkAnalysis/BFragmentationAnalyzer/data/bfragweights.root'),
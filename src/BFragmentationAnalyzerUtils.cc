@@ -1,5 +1,7 @@
 #include "TopQuarkAnalysis/BFragmentationAnalyzer/interface/BFragmentationAnalyzerUtils.h"
 
+#include <algorithm>
+
 //
 JetFragInfo_t analyzeJet(const reco::GenJet& genJet, float tagScale) {
   //loop over the constituents to analyze the jet leading pT tag and the neutrinos
@@ -91,3 +93,98 @@ JetFragInfo_t analyzeJet(const reco::GenJet& genJet, float tagScale) {
 
   return jinfo;
 }
+
+namespace {
+  // keep track of the two highest-pt candidates
+  struct TopTwo {
+    const reco::Candidate *lead = nullptr, *subLead = nullptr;
+    double leadPt = 0, subLeadPt = 0;
+    void add(const reco::Candidate* c, double pt) {
+      if (!lead || pt > leadPt) {
+        subLead = lead;
+        subLeadPt = leadPt;
+        lead = c;
+        leadPt = pt;
+      } else if (!subLead || pt > subLeadPt) {
+        subLead = c;
+        subLeadPt = pt;
+      }
+    }
+  };
+}  // namespace
+
+//
+JetFragInfo_t analyzeJetFast(const reco::GenJet& genJet, JetFragScratch_t& scratch, float tagScale) {
+  TopTwo tags, tags_B;
+  int nbtags(0), nctags(0);
+  scratch.semiLepMothers.clear();
+
+  // iterate over the daughters once: GenJet::getGenConstituent(i) walks the daughters from the first one on every call
+  for (auto constituent = genJet.begin(); constituent != genJet.end(); ++constituent) {
+    const reco::GenParticle* par = reco::GenJet::genParticle(&*constituent);
+    if (!par) {
+      continue;
+    }
+    const int status = par->status();
+    if (status != 1 && status != 2) {
+      continue;
+    }
+    int absid = abs(par->pdgId());
+
+    // semileptonic B decays: neutrinos or charged leptons with a status-2 B hadron as a parent
+    if (IS_NEUTRINO_PDGID(absid) || IS_CHLEPTON_PDGID(absid)) {
+      const reco::Candidate* leptonMother = par->mother();
+      if (!leptonMother) {
+        continue;
+      }
+      if (leptonMother->status() != 2 || !IS_BHADRON_PDGID(leptonMother->pdgId())) {
+        continue;
+      }
+      scratch.semiLepMothers.emplace_back(leptonMother, absid == 16 || absid == 15);
+    }
+
+    if (status != 2) {
+      continue;
+    }
+
+    const double pt = par->pt();
+    tags.add(par, pt);
+    if (IS_BHADRON_PDGID(absid)) {
+      nbtags++;
+      tags_B.add(par, pt);
+    }
+    if (IS_CHADRON_PDGID(absid)) {
+      nctags++;
+    }
+  }
+
+  // fill the jet info, as in analyzeJet
+  JetFragInfo_t jinfo;
+  const double jetPt = genJet.p4().pt();
+
+  jinfo.xb_lead = tags.lead ? (tags.leadPt * tagScale) / jetPt : -1;
+  jinfo.leadTagId = tags.lead ? tags.lead->pdgId() : 0;
+  jinfo.xb_subLead = tags.subLead ? (tags.subLeadPt * tagScale) / jetPt : -1;
+  jinfo.subLeadTagId = tags.subLead ? tags.subLead->pdgId() : 0;
+
+  jinfo.xb_lead_B = tags_B.lead ? (tags_B.leadPt * tagScale) / jetPt : -1;
+  jinfo.leadTagId_B = tags_B.lead ? tags_B.lead->pdgId() : 0;
+  jinfo.xb_subLead_B = tags_B.subLead ? (tags_B.subLeadPt * tagScale) / jetPt : -1;
+  jinfo.subLeadTagId_B = tags_B.subLead ? tags_B.subLead->pdgId() : 0;
+
+  jinfo.hasSemiLepDecay = false;
+  jinfo.hasTauSemiLepDecay = false;
+  if (tags_B.lead) {
+    for (const auto& mother : scratch.semiLepMothers) {
+      if (mother.first == tags_B.lead) {
+        jinfo.hasSemiLepDecay = true;
+        jinfo.hasTauSemiLepDecay |= mother.second;
+      }
+    }
+  }
+
+  jinfo.nbtags = nbtags;
+  jinfo.nctags = nctags;
+
+  return jinfo;
+}
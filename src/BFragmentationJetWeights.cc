@@ -0,0 +1,32 @@
+#include "TopQuarkAnalysis/BFragmentationAnalyzer/interface/BFragmentationJetWeights.h"
+
+#include <algorithm>
+
+#include "FWCore/Utilities/interface/Exception.h"
+
+BFragmentationJetWeights::BFragmentationJetWeights(const reco::GenJetRefProd& jets,
+                                                   const std::vector<std::string>& names,
+                                                   std::vector<float> weights)
+    : jets_(jets), names_(names), nJets_(jets->size()), weights_(std::move(weights)) {
+  if (weights_.size() != names_.size() * nJets_) {
+    throw cms::Exception("LogicError") << "Got " << weights_.size() << " weights for " << names_.size()
+                                       << " variations and " << nJets_ << " jets" << std::endl;
+  }
+}
+
+std::size_t BFragmentationJetWeights::index(const std::string& name) const {
+  const auto it = std::find(names_.begin(), names_.end(), name);
+  if (it == names_.end()) {
+    throw cms::Exception("ProductNotFound") << "No weights for variation " << name << std::endl;
+  }
+  return it - names_.begin();
+}
+
+float BFragmentationJetWeights::weight(std::size_t iVar, const reco::GenJetRef& jet) const {
+  if (jet.id() != jets_.id()) {
+    throw cms::Exception("InvalidReference")
+        << "Jet " << jet.id() << ":" << jet.key() << " is not in the collection of the weights (" << jets_.id() << ")"
+        << std::endl;
+  }
+  return weight(iVar, jet.key());
+}
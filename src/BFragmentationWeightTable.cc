@@ -0,0 +1,86 @@
+#include "TopQuarkAnalysis/BFragmentationAnalyzer/interface/BFragmentationWeightTable.h"
+
+#include <algorithm>
+#include <cmath>
+#include <memory>
+
+#include "FWCore/Utilities/interface/Exception.h"
+
+#include "TFile.h"
+#include "TVectorD.h"
+#include "TVectorF.h"
+
+namespace {
+  // the objects read from the file are owned by the caller (vectors are not attached to the directory)
+  template <typename T>
+  std::unique_ptr<T> getObject(TFile* fIn, const std::string& path, const std::string& name) {
+    std::unique_ptr<T> obj(static_cast<T*>(fIn->Get(name.c_str())));
+    if (!obj) {
+      throw cms::Exception("ObjectNotFound") << "Could not load object " << name << " from " << path << std::endl;
+    }
+    return obj;
+  }
+}  // namespace
+
+//
+BFragmentationWeightTable::BFragmentationWeightTable(const std::string& path,
+                                                     const std::vector<std::string>& fragWeights,
+                                                     const std::vector<std::string>& fragWeightsVsPt) {
+  // closed and deleted when leaving the constructor, also if a malformed table throws
+  std::unique_ptr<TFile> fIn(TFile::Open(path.c_str()));
+  if (!fIn || fIn->IsZombie()) {
+    throw cms::Exception("FileOpenError") << "Could not open weight table " << path << std::endl;
+  }
+
+  // pt-dependent weights: common binning for all variations
+  const auto xbGrid = getObject<TVectorD>(fIn.get(), path, "xb_grid");
+  nXb_ = static_cast<int>((*xbGrid)[0]);
+  xbMin_ = (*xbGrid)[1];
+  xbMax_ = (*xbGrid)[2];
+  xbScale_ = nXb_ / (xbMax_ - xbMin_);
+  const auto ptEdges = getObject<TVectorD>(fIn.get(), path, "pt_edges");
+  ptEdges_.assign(ptEdges->GetMatrixArray(), ptEdges->GetMatrixArray() + ptEdges->GetNrows());
+  vsPtBlockSize_ = (nXb_ + 2) * (ptEdges_.size() + 1);
+
+  vsPt_.reserve(vsPtBlockSize_ * fragWeightsVsPt.size());
+  for (const auto& wgt : fragWeightsVsPt) {
+    const auto block = getObject<TVectorF>(fIn.get(), path, wgt + "_vsPt");
+    if (static_cast<std::size_t>(block->GetNrows()) != vsPtBlockSize_) {
+      throw cms::Exception("InvalidWeightTable")
+          << "Weight table " << wgt << "_vsPt in " << path << " has " << block->GetNrows() << " entries, expected "
+          << vsPtBlockSize_ << std::endl;
+    }
+    vsPt_.insert(vsPt_.end(), block->GetMatrixArray(), block->GetMatrixArray() + block->GetNrows());
+  }
+
+  // pt-averaged weights: each variation has its own grid
+  for (const auto& wgt : fragWeights) {
+    const auto grid = getObject<TVectorD>(fIn.get(), path, wgt + "_avg_grid");
+    const auto block = getObject<TVectorF>(fIn.get(), path, wgt + "_avg");
+    Grid g{static_cast<int>((*grid)[0]), (*grid)[1], (*grid)[2]};
+    if (block->GetNrows() != g.n + 1 || g.n < 1) {
+      throw cms::Exception("InvalidWeightTable")
+          << "Weight table " << wgt << "_avg in " << path << " does not match its grid" << std::endl;
+    }
+    avgGrids_.push_back(g);
+    avgOffsets_.push_back(avg_.size());
+    avg_.insert(avg_.end(), block->GetMatrixArray(), block->GetMatrixArray() + block->GetNrows());
+  }
+
+  fIn->Close();
+}
+
+//
+int BFragmentationWeightTable::ptBin(double pt) const {
+  return std::upper_bound(ptEdges_.begin(), ptEdges_.end(), pt) - ptEdges_.begin();
+}
+
+//
+float BFragmentationWeightTable::averaged(std::size_t iWgt, float xb) const {
+  const Grid& g = avgGrids_[iWgt];
+  const float* y = &avg_[avgOffsets_[iWgt]];
+  // linear interpolation between the grid points, extrapolation from the first/last interval outside of the grid
+  double u = (xb - g.xMin) / g.step;
+  int i = std::min(std::max(static_cast<int>(std::floor(u)), 0), g.n - 1);
+  return y[i] + (y[i + 1] - y[i]) * (u - i);
+}
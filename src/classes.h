@@ -0,0 +1,2 @@
+#include "DataFormats/Common/interface/Wrapper.h"
+#include "TopQuarkAnalysis/BFragmentationAnalyzer/interface/BFragmentationJetWeights.h"
@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+
+"""
+Lightweight histograms backed by NumPy arrays, for the weight derivation without ROOT objects in the inner loops.
+
+An ArrayHist holds the bin edges, the sum of weights and the sum of squared weights of a TH1 or TH2, including the
+under/overflows and in the layout of ROOT ([x] or [y,x]). The operations of the helpers of buildWeightFile.py are
+vectorised and return new histograms, such that
+
+    hist = ArrayHist.fromROOT(fIn.Get("bfragAnalysis/xb_pt_lead_B"))
+    density = hist.projectionX(2, 2).rebinRange(2, 0., THRES).mergeAbove(THRES).toDensity()
+    ratio = density.smooth(2, 0., THRES).divide(refDensity.smooth(2, 0., THRES))
+
+gives the same contents and errors as the ROOT versions. ROOT is only needed by fromROOT and toROOT, which are exact
+(the contents keep their single or double precision); fromArrays and toArrays convert from and to the histogram
+arrays of mergeOutputs.readHists.
+"""
+
+import numpy as np
+
+from weightEvaluator import bufferToArray, bufferView
+import smoothing
+
+class ArrayHist(object):
+    """1D or 2D histogram stored as NumPy arrays, with under/overflows, in the layout of ROOT ([x] or [y,x])"""
+
+    __slots__ = ("name", "titles", "edges", "sumw", "sumw2", "entries")
+
+    def __init__(self, name, edges, sumw=None, sumw2=None, entries=0., titles=None, dtype=np.float64):
+        self.name = name
+        self.edges = [ np.asarray(e, dtype=np.float64) for e in edges ]
+        shape = tuple(len(e) + 1 for e in reversed(self.edges))
+        self.sumw = np.zeros(shape, dtype=dtype) if sumw is None else np.asarray(sumw).reshape(shape)
+        self.sumw2 = np.zeros(shape) if sumw2 is None else np.asarray(sumw2, dtype=np.float64).reshape(shape)
+        self.entries = float(entries)
+        self.titles = list(titles) if titles else [ "" ] * (len(self.edges) + 1)
+
+    def copy(self, name=None, sumw=None, sumw2=None, edges=None):
+        """New histogram with the same name, titles and entries, and the given contents and edges (default: copies of these ones)"""
+        return ArrayHist(name if name else self.name, self.edges if edges is None else edges,
+                         np.copy(self.sumw) if sumw is None else sumw, np.copy(self.sumw2) if sumw2 is None else sumw2,
+                         self.entries, self.titles, self.sumw.dtype)
+
+    @property
+    def dimension(self):
+        return len(self.edges)
+
+    @property
+    def errors(self):
+        return np.sqrt(self.sumw2)
+
+    def widths(self):
+        return np.diff(self.edges[0])
+
+    def centers(self):
+        return 0.5 * (self.edges[0][:-1] + self.edges[0][1:])
+
+    def integral(self):
+        """Sum of the in-range contents, as TH1::Integral()"""
+        return float(self.sumw[(slice(1, -1),) * self.dimension].sum(dtype=np.float64))
+
+    def scale(self, factor):
+        """Same as TH1::Scale, return a new histogram"""
+        return self.copy(sumw=(self.sumw.astype(np.float64) * factor).astype(self.sumw.dtype), sumw2=self.sumw2 * factor**2)
+
+    def toDensity(self):
+        """Same as buildWeightFile.toDensity for a 1D histogram: divide by the bin widths and normalize to 1, return a new histogram"""
+        widths = self.widths()
+        sumw = np.array(self.sumw, dtype=np.float64)
+        sumw2 = np.copy(self.sumw2)
+        sumw[1:-1] /= widths
+        sumw2[1:-1] /= widths**2
+        density = self.copy(sumw=sumw.astype(self.sumw.dtype), sumw2=sumw2)
+        integral = density.integral()
+        return density.scale(1. / integral) if integral > 0 else density
+
+    def rebin(self, newEdges, name=None):
+        """Same as TH1::Rebin(n, name, newEdges) for a 1D histogram (the new edges being a subset of the old ones), return a new histogram"""
+        edges = self.edges[0]
+        newEdges = np.asarray(newEdges, dtype=np.float64)
+        if not np.all(np.isin(newEdges, edges)):
+            raise ValueError("The new edges of {} are not a subset of the old ones".format(self.name))
+        # new bin of every old cell, including the under/overflows
+        cells = np.concatenate(([ 0 ], np.searchsorted(newEdges, edges[:-1], side="right"), [ len(newEdges) ]))
+        sumw = np.bincount(cells, self.sumw.astype(np.float64), len(newEdges) + 1).astype(self.sumw.dtype)
+        sumw2 = np.bincount(cells, self.sumw2, len(newEdges) + 1)
+        return self.copy(name, sumw, sumw2, [ newEdges ])
+
+    def rebinRange(self, nTimes, xMin, xMax, name=None):
+        """Same as buildWeightFile.th1RebinRange: merge nTimes bins together within [xMin,xMax], return a new histogram"""
+        edges = self.edges[0]
+        inRange = edges[(edges >= xMin) & (edges <= xMax)]
+        if (len(inRange) - 1) % nTimes != 0:
+            raise RuntimeError("Histogram {} has {} bins within range, cannot be rebinned {} times".format(self.name, len(inRange) - 1, nTimes))
+        return self.rebin(rangeRebinEdges(edges, nTimes, xMin, xMax), name)
+
+    def mergeAbove(self, thres, name=None):
+        """Same as buildWeightFile.mergeBinsAbove: merge all bins above thres into one, return a new histogram"""
+        edges = self.edges[0]
+        return self.rebin(np.concatenate((edges[edges <= thres], edges[-1:])), name)
+
+    def divide(self, other, name=None):
+        """Same as TH1::Divide(other) for the contents and errors (0 where other is 0), return a new histogram"""
+        if any(a.shape != b.shape or not np.array_equal(a, b) for a, b in zip(self.edges, other.edges)):
+            raise ValueError("Cannot divide {} by {} with a different binning".format(self.name, other.name))
+        c0, c1 = self.sumw.astype(np.float64), other.sumw.astype(np.float64)
+        nonZero = c1 != 0
+        safe = np.where(nonZero, c1, 1.)
+        sumw = np.where(nonZero, c0 / safe, 0.)
+        sumw2 = np.where(nonZero, (self.sumw2 * c1**2 + other.sumw2 * c0**2) / safe**4, 0.)
+        return self.copy(name, sumw.astype(self.sumw.dtype), sumw2)
+
+    def smooth(self, nTimes, xMin, xMax, name=None):
+        """Same as buildWeightFile.th1SmoothRange for a 1D histogram (errors unchanged), return a new histogram"""
+        sumw = np.copy(self.sumw)
+        sumw[1:-1] = smoothing.smoothRange(sumw[1:-1], self.edges[0], nTimes, xMin, xMax)
+        return self.copy(name, sumw)
+
+    def projectionX(self, first=0, last=-1, name=None):
+        """Same as TH2::ProjectionX(name, first, last, "e"): sum of the y bins first to last (default: all, including under/overflows)"""
+        return self._project(0, first, last, name if name else self.name + "_px")
+
+    def projectionY(self, first=0, last=-1, name=None):
+        """Same as TH2::ProjectionY(name, first, last, "e"): sum of the x bins first to last (default: all, including under/overflows)"""
+        return self._project(1, first, last, name if name else self.name + "_py")
+
+    def _project(self, axis, first, last, name):
+        if self.dimension != 2:
+            raise ValueError("{} is not a 2D histogram".format(self.name))
+        other = self.edges[1 - axis]
+        if last < first:
+            first, last = 0, len(other)
+        cells = slice(first, last + 1)
+        # ROOT layout is [y,x]: projecting on x sums over the rows
+        sumw = self.sumw[cells,:].sum(axis=0) if axis == 0 else self.sumw[:,cells].sum(axis=1)
+        sumw2 = self.sumw2[cells,:].sum(axis=0) if axis == 0 else self.sumw2[:,cells].sum(axis=1)
+        return ArrayHist(name, [ self.edges[axis] ], sumw, sumw2, float(sumw.sum()), [ self.titles[0], self.titles[1 + axis], "" ], self.sumw.dtype)
+
+    @classmethod
+    def fromArrays(cls, arrays, name=None):
+        """From the histogram arrays of mergeOutputs.readHists (or histCache.histToDict, with errors)"""
+        edges = [ arrays[label + "edges"] for label in "xy" if label + "edges" in arrays ]
+        sumw2 = arrays["sumw2"] if "sumw2" in arrays else np.asarray(arrays["errors"])**2
+        titles = [ str(t) for t in arrays["titles"] ] if "titles" in arrays else None
+        return cls(name if name else str(arrays.get("name", "")), edges, np.array(arrays["contents"], dtype=np.float64), np.array(sumw2, dtype=np.float64), float(arrays.get("entries", 0.)), titles)
+
+    def toArrays(self):
+        """Histogram arrays as returned by mergeOutputs.readHists"""
+        arrays = {
+            "contents": self.sumw.astype(np.float64).ravel(),
+            "sumw2": self.sumw2.ravel(),
+            "entries": np.array(self.entries),
+            "name": np.array(self.name),
+            "titles": np.array(self.titles),
+        }
+        for label, edges in zip("xy", self.edges):
+            arrays[label + "edges"] = np.copy(edges)
+        return arrays
+
+    @classmethod
+    def fromROOT(cls, hist):
+        """Exact copy of a TH1 or TH2 (single or double precision)"""
+        nCells = hist.GetNcells()
+        dtype = np.float32 if hist.InheritsFrom("TArrayF") else np.float64
+        sumw = bufferToArray(hist.GetArray(), nCells, dtype)
+        # without Sumw2, ROOT uses the contents as squared errors
+        sumw2 = bufferToArray(hist.GetSumw2().GetArray(), nCells) if hist.GetSumw2N() else np.abs(sumw.astype(np.float64))
+        axes = [ hist.GetXaxis(), hist.GetYaxis() ][:hist.GetDimension()]
+        edges = [ [ ax.GetBinLowEdge(i) for i in range(1, ax.GetNbins() + 2) ] for ax in axes ]
+        titles = [ hist.GetTitle() ] + [ ax.GetTitle() for ax in axes ]
+        return cls(hist.GetName(), edges, sumw, sumw2, hist.GetEntries(), titles, dtype)
+
+    def toROOT(self, name=None):
+        """TH1F/TH1D/TH2F/TH2D (following the precision of the contents) with the same contents, not attached to any directory"""
+        import ROOT
+        name = name if name else self.name
+        precision = "F" if self.sumw.dtype == np.float32 else "D"
+        args = [ name, self.titles[0] ]
+        for edges in self.edges:
+            args += [ len(edges) - 1, edges ]
+        hist = getattr(ROOT, "TH{}{}".format(self.dimension, precision))(*args)
+        hist.SetDirectory(0)
+        hist.Sumw2()
+        for ax, title in zip([ hist.GetXaxis(), hist.GetYaxis() ], self.titles[1:]):
+            ax.SetTitle(title)
+        nCells = hist.GetNcells()
+        bufferView(hist.GetArray(), nCells, self.sumw.dtype)[:] = self.sumw.ravel()
+        bufferView(hist.GetSumw2().GetArray(), nCells)[:] = self.sumw2.ravel()
+        hist.SetEntries(self.entries)
+        return hist
+
+def rangeRebinEdges(edges, nTimes, xMin, xMax):
+    """Edges after merging nTimes bins together within [xMin,xMax], as in buildWeightFile.th1RebinRange"""
+    newBins = []
+    for x in edges:
+        if x <= xMin or x > xMax or len(newBins[-1]) == nTimes:
+            newBins.append([ x ])
+        else:
+            newBins[-1].append(x)
+    return np.array([ b[0] for b in newBins ])
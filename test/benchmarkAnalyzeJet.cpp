@@ -0,0 +1,156 @@
+// Standalone benchmark of analyzeJet vs. analyzeJetFast on synthetic generator-level jets.
+//
+// Each jet contains final-state particles, ghost B and C hadrons (status 2, with the pt scaled down by TAG_SCALE
+// as in the particle-level producer) and leptons from semileptonic B decays. Both versions are checked to give
+// identical results on all jets before timing them:
+//
+//    benchmarkAnalyzeJet [nJets=2000] [repeat=20] [nConstituents=25,50,100,200,400]
+
+#include "TopQuarkAnalysis/BFragmentationAnalyzer/interface/BFragmentationAnalyzerUtils.h"
+
+#include "DataFormats/Common/interface/TestHandle.h"
+#include "DataFormats/HepMCCandidate/interface/GenParticleFwd.h"
+
+#include <algorithm>
+#include <chrono>
+#include <cstdlib>
+#include <iomanip>
+#include <iostream>
+#include <random>
+#include <sstream>
+#include <string>
+#include <vector>
+
+namespace {
+  // all the particles of the generated jets, and the jets themselves
+  struct Sample {
+    reco::GenParticleCollection particles;
+    std::vector<reco::GenJet> jets;
+  };
+
+  reco::GenParticle makeParticle(std::mt19937& rng, int pdgId, int status, double pt) {
+    std::uniform_real_distribution<double> eta(-0.4, 0.4), phi(-0.4, 0.4);
+    reco::Particle::PolarLorentzVector p4(pt, eta(rng), phi(rng), 0.);
+    return reco::GenParticle(0, reco::Particle::LorentzVector(p4), reco::Particle::Point(), pdgId, status, true);
+  }
+
+  void makeSample(Sample& sample, std::size_t nJets, std::size_t nConst, unsigned seed) {
+    std::mt19937 rng(seed);
+    std::exponential_distribution<double> ptDist(1. / 5.);
+    std::uniform_int_distribution<int> nTags(0, 4), tagType(0, 3), nLeptons(0, 2);
+    const int bHadrons[] = {511, -521, 531, -5122};
+    const int cHadrons[] = {411, -421, 431, -4122};
+    const int leptons[] = {11, -12, 13, -14, 15, -16};
+
+    // first generate all the particles and record the jet memberships and mothers by index,
+    // the references can only be built once the collection does not move anymore
+    std::vector<std::vector<std::size_t>> jetConst(nJets);
+    std::vector<std::pair<std::size_t, std::size_t>> mothers;  // (daughter, mother)
+    for (std::size_t iJet = 0; iJet < nJets; iJet++) {
+      const int nHadrons = nTags(rng);
+      std::size_t nTagConst = 0;
+      for (int iTag = 0; iTag < nHadrons; iTag++) {
+        const bool isB = tagType(rng) > 0;
+        const int id = isB ? bHadrons[tagType(rng)] : cHadrons[tagType(rng)];
+        const std::size_t iHad = sample.particles.size();
+        sample.particles.push_back(makeParticle(rng, id, 2, (5. + ptDist(rng)) / TAG_SCALE));
+        jetConst[iJet].push_back(iHad);
+        nTagConst++;
+        if (!isB) {
+          continue;
+        }
+        const int nLep = nLeptons(rng);
+        for (int iLep = 0; iLep < nLep; iLep++) {
+          const int id = leptons[rng() % 6];
+          const int status = abs(id) == 15 ? 2 : 1;
+          mothers.emplace_back(sample.particles.size(), iHad);
+          jetConst[iJet].push_back(sample.particles.size());
+          sample.particles.push_back(makeParticle(rng, id, status, ptDist(rng)));
+          nTagConst++;
+        }
+      }
+      for (std::size_t i = nTagConst; i < nConst; i++) {
+        jetConst[iJet].push_back(sample.particles.size());
+        sample.particles.push_back(makeParticle(rng, i % 3 ? 211 : 22, 1, ptDist(rng)));
+      }
+      std::shuffle(jetConst[iJet].begin(), jetConst[iJet].end(), rng);
+    }
+
+    edm::TestHandle<reco::GenParticleCollection> handle(&sample.particles, edm::ProductID(1, 1));
+    for (const auto& dm : mothers) {
+      sample.particles[dm.first].addMother(reco::GenParticleRef(handle, dm.second));
+    }
+    for (const auto& indices : jetConst) {
+      reco::Jet::Constituents constituents;
+      reco::Particle::LorentzVector p4;
+      for (std::size_t i : indices) {
+        constituents.push_back(reco::CandidatePtr(handle, i));
+        p4 += sample.particles[i].p4();
+      }
+      sample.jets.emplace_back(p4, reco::Particle::Point(), reco::GenJet::Specific(), constituents);
+    }
+  }
+
+  bool sameInfo(const JetFragInfo_t& a, const JetFragInfo_t& b) {
+    return a.xb_lead == b.xb_lead && a.xb_subLead == b.xb_subLead && a.leadTagId == b.leadTagId &&
+           a.subLeadTagId == b.subLeadTagId && a.xb_lead_B == b.xb_lead_B && a.xb_subLead_B == b.xb_subLead_B &&
+           a.leadTagId_B == b.leadTagId_B && a.subLeadTagId_B == b.subLeadTagId_B &&
+           a.hasSemiLepDecay == b.hasSemiLepDecay && a.hasTauSemiLepDecay == b.hasTauSemiLepDecay &&
+           a.nbtags == b.nbtags && a.nctags == b.nctags;
+  }
+
+  // best time per jet (in ns) over `repeat` passes on all the jets
+  template <typename F>
+  double timePerJet(const std::vector<reco::GenJet>& jets, int repeat, F&& func) {
+    double best = -1;
+    int sink = 0;
+    for (int i = 0; i < repeat; i++) {
+      const auto start = std::chrono::steady_clock::now();
+      for (const auto& jet : jets) {
+        sink += func(jet).nbtags;
+      }
+      const double ns = std::chrono::duration<double, std::nano>(std::chrono::steady_clock::now() - start).count();
+      best = (best < 0 || ns < best) ? ns : best;
+    }
+    if (sink < 0) {
+      std::cout << sink;  // keep the calls from being optimised away
+    }
+    return best / jets.size();
+  }
+}  // namespace
+
+int main(int argc, char** argv) {
+  const std::size_t nJets = argc > 1 ? std::atoi(argv[1]) : 2000;
+  const int repeat = argc > 2 ? std::atoi(argv[2]) : 20;
+  std::vector<std::size_t> nConsts{25, 50, 100, 200, 400};
+  if (argc > 3) {
+    nConsts.clear();
+    std::stringstream ss(argv[3]);
+    std::string item;
+    while (std::getline(ss, item, ',')) {
+      nConsts.push_back(std::atoi(item.c_str()));
+    }
+  }
+
+  std::cout << std::setw(14) << "constituents" << std::setw(16) << "analyzeJet [ns]" << std::setw(20)
+            << "analyzeJetFast [ns]" << std::setw(10) << "speedup" << std::endl;
+  for (std::size_t nConst : nConsts) {
+    Sample sample;
+    makeSample(sample, nJets, nConst, 42 + nConst);
+
+    JetFragScratch_t scratch;
+    for (const auto& jet : sample.jets) {
+      if (!sameInfo(analyzeJet(jet), analyzeJetFast(jet, scratch))) {
+        std::cerr << "analyzeJet and analyzeJetFast differ for a jet with " << nConst << " constituents" << std::endl;
+        return 1;
+      }
+    }
+
+    const double tRef = timePerJet(sample.jets, repeat, [](const reco::GenJet& jet) { return analyzeJet(jet); });
+    const double tFast = timePerJet(
+        sample.jets, repeat, [&scratch](const reco::GenJet& jet) { return analyzeJetFast(jet, scratch); });
+    std::cout << std::setw(14) << nConst << std::setw(16) << std::fixed << std::setprecision(1) << tRef
+              << std::setw(20) << tFast << std::setw(10) << std::setprecision(2) << tRef / tFast << std::endl;
+  }
+  return 0;
+}
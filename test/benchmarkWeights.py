@@ -0,0 +1,301 @@
+#!/usr/bin/env python
+
+"""
+Micro-benchmarks of the weight-building helpers and of the full weight-building stages.
+
+Synthetic histograms are generated with the same xb and pT binnings as BFragmentationAnalyzer,
+and the timings are saved as JSON so that different runs can be compared:
+
+    ./benchmarkWeights.py -o before.json
+    ./benchmarkWeights.py -o after.json --compare before.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+import timeit
+import numpy as np
+
+import ROOT
+ROOT.gROOT.SetBatch()
+ROOT.gErrorIgnoreLevel = ROOT.kWarning
+
+import bfragConfig
+import buildWeightFile as bwf
+import fixWeightNormalization as fwn
+import smoothing
+from arrayHist import ArrayHist
+from histCache import histToDict
+from weightEvaluator import graphToArrays
+
+XB_BINNING = np.array(bfragConfig.XB_BINNING)
+PT_BINNING = np.array(bfragConfig.PT_BINNING)
+# largest difference allowed between the batched smoothing of smoothing.py and the ROOT/SciPy one
+SMOOTHING_TOLERANCE = 1e-9
+# largest relative difference allowed between the ArrayHist operations and the ROOT helpers
+ARRAYHIST_TOLERANCE = 1e-9
+
+def sampleJets(rng, nJets, shape):
+    """Random (xb, pt) values roughly following the simulated distributions, `shape` changing the hardness of the fragmentation"""
+    xb = np.minimum(rng.beta(shape, 1.5, nJets) * 1.05, 1.49)
+    pt = 20. + rng.exponential(70., nJets)
+    return xb, pt
+
+def makeHists(rng, name, nJets, shape):
+    """Return synthetic xb and xb/pT histograms filled with nJets"""
+    xb, pt = sampleJets(rng, nJets, shape)
+    h1 = ROOT.TH1D(name, "B;x_{b}=p_{T}(B)/p_{T}(jet); Jets", len(XB_BINNING) - 1, XB_BINNING)
+    h2 = ROOT.TH2D(name + "_pt", "B;x_{b}=p_{T}(B)/p_{T}(jet);p_{T}(jet);Jets", len(XB_BINNING) - 1, XB_BINNING, len(PT_BINNING) - 1, PT_BINNING)
+    for h in h1, h2:
+        h.SetDirectory(0)
+        h.Sumw2()
+    weights = np.ones(nJets)
+    h1.FillN(nJets, xb, weights)
+    h2.FillN(nJets, xb, pt, weights)
+    return h1, h2
+
+def makeInputs(outDir, nJets, seed=42):
+    """Write synthetic merged analyzer outputs (xb_{TAG}.root) for all tunes, and a debug output for the normalization fix"""
+    rng = np.random.default_rng(seed)
+    shapes = dict((tag, 6. + 0.2 * i) for i,tag in enumerate(bwf.TUNES))
+    shapes[bwf.REF] = 6.5
+    for tag, shape in shapes.items():
+        h1, h2 = makeHists(rng, tag, nJets, shape)
+        fOut = ROOT.TFile.Open(os.path.join(outDir, "xb_{}.root".format(tag)), "recreate")
+        d = fOut.mkdir("bfragAnalysis")
+        d.cd()
+        h1.Write("xb_lead_B")
+        h2.Write("xb_pt_lead_B")
+        fOut.Close()
+
+    # debug run: nominal sample with the weights applied
+    debugPath = os.path.join(outDir, "xb_{}_debug.root".format(bwf.REF))
+    fOut = ROOT.TFile.Open(debugPath, "recreate")
+    d = fOut.mkdir("bfragAnalysis")
+    d.cd()
+    h1, h2 = makeHists(rng, "ref", nJets, shapes[bwf.REF])
+    h2.Write("xb_pt_lead_B")
+    norm = ROOT.TH1D("norm", "", 1, 0, 1)
+    norm.SetBinContent(1, nJets)
+    norm.Write()
+    for tag in bwf.TUNES:
+        h1, h2 = makeHists(rng, tag + "_debug", nJets, shapes[tag])
+        h2.Write("debug_xb_pt_lead_B_frag{}VsPt".format(tag))
+        norm.SetBinContent(1, nJets * (1. + 0.01 * rng.normal()))
+        norm.Write("debug_norm_frag{}".format(tag))
+    fOut.Close()
+    return debugPath
+
+def checkSmoothing(density, refDensity):
+    """Largest absolute differences between smoothing.py and th1SmoothRange/smoothWeightsAkima for synthetic densities"""
+    def clone(h, name):
+        c = h.Clone(name)
+        c.SetDirectory(0)
+        return c
+    smooth, refSmooth = clone(density, "check_smooth"), clone(refDensity, "check_ref_smooth")
+    bwf.th1SmoothRange(smooth, 2, 0., bwf.THRES)
+    bwf.th1SmoothRange(refSmooth, 2, 0., bwf.THRES)
+    ratio = clone(smooth, "check_ratio")
+    ratio.Divide(refSmooth)
+    gx, gy = graphToArrays(bwf.smoothWeightsAkima(ratio, refDensity))
+
+    contents = np.array([ histToDict(h)["contents"][1:-1] for h in (density, refDensity) ])
+    smoothed = smoothing.smoothRange(contents, XB_BINNING, 2, 0., bwf.THRES)
+    x, y = smoothing.smoothedWeights(contents[0], contents[1], XB_BINNING)
+    if not np.array_equal(x, gx):
+        raise RuntimeError("smoothedWeights and smoothWeightsAkima give different points")
+    return {
+        "smoothRange": float(np.max(np.abs(smoothed[0] - histToDict(smooth)["contents"][1:-1]))),
+        "smoothedWeights": float(np.max(np.abs(y - gy))),
+    }
+
+def checkArrayHist(hist2D, refHist2D, ptBin=2):
+    """Largest relative differences of the contents and errors between the ArrayHist operations and the ROOT helpers,
+    for each step of the derivation of the weights in a pT slice (as in splitPtSlices and derive2DWeights)"""
+    def compare(arrayHist, hist):
+        arrays = histToDict(hist)
+        scale = max(np.max(np.abs(arrays["contents"])), 1e-300)
+        errScale = max(np.max(arrays["errors"]), 1e-300)
+        return max(float(np.max(np.abs(arrayHist.sumw.ravel() - arrays["contents"]))) / scale,
+                   float(np.max(np.abs(arrayHist.errors.ravel() - arrays["errors"]))) / errScale)
+
+    diffs = {}
+    steps = {}
+    for label, h2 in ("", hist2D), ("ref_", refHist2D):
+        proj = h2.ProjectionX("check_{}proj".format(label), ptBin, ptBin, "e")
+        proj.SetDirectory(0)
+        rebinned = bwf.th1RebinRange(proj, 2, 0., bwf.THRES)
+        merged = bwf.mergeBinsAbove(rebinned, bwf.THRES, "check_{}merged".format(label))
+        merged.SetDirectory(0)
+        density = merged.Clone("check_{}density".format(label))
+        density.SetDirectory(0)
+        bwf.toDensity(density)
+        smooth = density.Clone("check_{}smooth".format(label))
+        smooth.SetDirectory(0)
+        bwf.th1SmoothRange(smooth, 2, 0., bwf.THRES)
+
+        aProj = ArrayHist.fromROOT(h2).projectionX(ptBin, ptBin)
+        aRebinned = aProj.rebinRange(2, 0., bwf.THRES)
+        aMerged = aRebinned.mergeAbove(bwf.THRES)
+        aDensity = aMerged.toDensity()
+        aSmooth = aDensity.smooth(2, 0., bwf.THRES)
+        for name, a, h in [ ("projectionX", aProj, proj), ("rebinRange", aRebinned, rebinned), ("mergeAbove", aMerged, merged),
+                            ("toDensity", aDensity, density), ("smooth", aSmooth, smooth) ]:
+            diffs[name] = max(diffs.get(name, 0.), compare(a, h))
+        steps[label] = (aSmooth, smooth)
+
+    ratio = steps[""][1].Clone("check_ratio")
+    ratio.SetDirectory(0)
+    ratio.Divide(steps["ref_"][1])
+    diffs["divide"] = compare(steps[""][0].divide(steps["ref_"][0]), ratio)
+    return diffs
+
+def timeCall(func, setup=None, repeat=5):
+    """Time func(*setup()) `repeat` times (setup is not timed), return summary dictionary in seconds"""
+    times = []
+    for _ in range(repeat):
+        args = setup() if setup else ()
+        start = timeit.default_timer()
+        func(*args)
+        times.append(timeit.default_timer() - start)
+    return { "repeat": repeat, "min": min(times), "mean": float(np.mean(times)), "median": float(np.median(times)) }
+
+def runBenchmarks(workDir, nJets, repeat, stageRepeat):
+    """Return dictionary: benchmark name->timing summary"""
+    rng = np.random.default_rng(1)
+    h1, h2 = makeHists(rng, "bench", nJets, 6.5)
+    ref1, ref2 = makeHists(rng, "bench_ref", nJets, 6.)
+    density = h1.Clone("bench_density")
+    density.SetDirectory(0)
+    bwf.toDensity(density)
+    refDensity = ref1.Clone("bench_ref_density")
+    refDensity.SetDirectory(0)
+    bwf.toDensity(refDensity)
+    ratio = density.Clone("bench_ratio")
+    ratio.SetDirectory(0)
+    ratio.Divide(refDensity)
+
+    def clone(h):
+        c = h.Clone()
+        c.SetDirectory(0)
+        return (c,)
+
+    benchmarks = [
+        ("toDensity", bwf.toDensity, lambda: clone(h1)),
+        ("th1SmoothRange", lambda h: bwf.th1SmoothRange(h, 2, 0., bwf.THRES), lambda: clone(density)),
+        ("th1RebinRange", lambda h: bwf.th1RebinRange(h, 2, 0., bwf.THRES), lambda: clone(h1)),
+        ("mergeBinsAbove", lambda h: bwf.mergeBinsAbove(h, bwf.THRES, h.GetName() + "_merged"), lambda: clone(h1)),
+        ("smoothWeights", lambda h: bwf.smoothWeights(h, refDensity), lambda: clone(ratio)),
+        ("smoothWeightsAkima", lambda h: bwf.smoothWeightsAkima(h, refDensity), lambda: clone(ratio)),
+    ]
+    # batched smoothing of the densities of all tunes in all pT slices at once
+    stack = np.tile(histToDict(density)["contents"][1:-1], (len(bwf.TUNES), len(PT_BINNING) - 1, 1))
+    refStack = np.tile(histToDict(refDensity)["contents"][1:-1], (len(PT_BINNING) - 1, 1))
+    benchmarks.append(("smoothedWeightsBatch", lambda: smoothing.smoothedWeights(stack, refStack, XB_BINNING), None))
+
+    results = {}
+    for name, func, setup in benchmarks:
+        print("Timing {}".format(name))
+        try:
+            results[name] = timeCall(func, setup, repeat)
+        except Exception as e: # e.g. helpers relying on features missing in this ROOT version
+            results[name] = { "error": str(e) }
+
+    print("Comparing the batched smoothing to ROOT/SciPy")
+    try:
+        check = checkSmoothing(density, refDensity)
+        check["passed"] = max(check.values()) < SMOOTHING_TOLERANCE
+    except Exception as e: # e.g. SciPy missing
+        check = { "error": str(e), "passed": False }
+    print("  {}".format(check))
+    results["smoothingCheck"] = check
+
+    print("Comparing the ArrayHist operations to the ROOT helpers")
+    try:
+        check = checkArrayHist(h2, ref2)
+        check["passed"] = max(check.values()) < ARRAYHIST_TOLERANCE
+    except Exception as e:
+        check = { "error": str(e), "passed": False }
+    print("  {}".format(check))
+    results["arrayHistCheck"] = check
+
+    inDir = os.path.join(workDir, "inputs")
+    outDir = os.path.join(workDir, "outputs")
+    fixDir = os.path.join(workDir, "fixNorm")
+    for d in inDir, outDir, fixDir:
+        # the --keep folder may hold a previous run, whose files are overwritten
+        if not os.path.isdir(d):
+            os.makedirs(d)
+    print("Generating synthetic inputs with {} jets per tune".format(nJets))
+    debugPath = makeInputs(inDir, nJets)
+
+    stages = [
+        ("buildAndWriteWeights", lambda: bwf.buildAndWriteWeights(inDir, outDir)),
+        ("buildAndWrite2DWeights", lambda: bwf.buildAndWrite2DWeights(inDir, outDir)),
+        ("fix1Dnorm", lambda: fwn.fix1Dnorm(os.path.join(outDir, "bfragweights.root"), os.path.join(fixDir, "bfragweights.root"), debugPath)),
+        ("fix2Dnorm", lambda: fwn.fix2Dnorm(os.path.join(outDir, "bfragweights_vs_pt.root"), os.path.join(fixDir, "bfragweights_vs_pt.root"), debugPath)),
+    ]
+    for name, func in stages:
+        print("Timing {}".format(name))
+        results[name] = timeCall(func, repeat=stageRepeat)
+    return results
+
+def compare(results, refResults):
+    """Print the ratio of the median timings to those of a reference run"""
+    print("{:<25} {:>12} {:>12} {:>8}".format("benchmark", "ref [ms]", "new [ms]", "ratio"))
+    for name in sorted(results):
+        new, ref = results[name], refResults.get(name, {})
+        if "median" not in new or "median" not in ref:
+            continue
+        print("{:<25} {:>12.3f} {:>12.3f} {:>8.3f}".format(name, 1e3 * ref["median"], 1e3 * new["median"], new["median"] / ref["median"]))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Benchmark the weight-building helpers on synthetic histograms')
+    parser.add_argument('-o', '--output', default='benchmark.json', help='Output JSON file with the timings')
+    parser.add_argument('-n', '--nJets', type=int, default=1000000, help='Number of jets per synthetic histogram')
+    parser.add_argument('-r', '--repeat', type=int, default=20, help='Number of repetitions for each helper')
+    parser.add_argument('--stageRepeat', type=int, default=3, help='Number of repetitions for each full stage')
+    parser.add_argument('--compare', help='JSON file from a previous run to compare to')
+    parser.add_argument('--keep', help='Keep the synthetic inputs and outputs in this folder instead of a temporary one')
+    args = parser.parse_args()
+
+    workDir = args.keep if args.keep else tempfile.mkdtemp(prefix="bfragBench")
+    try:
+        results = runBenchmarks(workDir, args.nJets, args.repeat, args.stageRepeat)
+    finally:
+        if not args.keep:
+            shutil.rmtree(workDir)
+
+    report = {
+        "meta": {
+            "time": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "host": platform.node(),
+            "python": sys.version.split()[0],
+            "root": ROOT.gROOT.GetVersion(),
+            "numpy": np.__version__,
+            "nJets": args.nJets,
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2, sort_keys=True)
+    print("Timings saved to {}".format(args.output))
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f)["results"])
+
+    failed = False
+    if not results["smoothingCheck"]["passed"]:
+        print("The batched smoothing differs from the ROOT/SciPy one by more than {}".format(SMOOTHING_TOLERANCE))
+        failed = True
+    if not results["arrayHistCheck"]["passed"]:
+        print("The ArrayHist operations differ from the ROOT helpers by more than {} (relative)".format(ARRAYHIST_TOLERANCE))
+        failed = True
+    if failed:
+        sys.exit(1)
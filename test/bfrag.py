@@ -0,0 +1,148 @@
+#!/usr/bin/env python
+
+"""
+Single entry point for the scripts deriving and checking the weights.
+
+The configuration commands (tunes, validate) only need the standard library and return immediately; the other commands
+run the corresponding script with the remaining arguments, and only then load ROOT, NumPy or SciPy:
+
+    ./bfrag.py tunes
+    ./bfrag.py validate
+    ./bfrag.py build -i results -o results --jobs 8
+    ./bfrag.py plot --help
+"""
+
+import argparse
+import os
+import re
+import runpy
+import sys
+
+import bfragConfig
+from campaign import readSubmitFile
+
+TEST_DIR = os.path.dirname(os.path.abspath(__file__))
+PACKAGE_DIR = os.path.dirname(TEST_DIR)
+SUBMIT_FILE = os.path.join(TEST_DIR, "condor.sub")
+PRODUCER_CFI = os.path.join(PACKAGE_DIR, "python", "bfragWgtProducer_cfi.py")
+ANALYZER = os.path.join(PACKAGE_DIR, "plugins", "BFragmentationAnalyzer.cc")
+
+# command, script module, description
+SCRIPTS = [
+    ("merge", "mergeOutputs", "Merge the outputs of the analyzer jobs per tag"),
+    ("build", "buildWeightFile", "Derive the fragmentation weights from the merged outputs"),
+    ("build-br", "buildBRweights", "Derive the semileptonic branching ratio weights"),
+    ("fix-norm", "fixWeightNormalization", "Correct the normalisation of the weights from a debug run"),
+    ("replay", "replayWeights", "Replay the debug histograms from the per-jet ntuples"),
+    ("plot", "plotResults", "Draw the validation plots"),
+    ("draw-brs", "drawBrs", "Draw the semileptonic branching ratios and their uncertainties"),
+    ("plan", "planCampaign", "Plan the number of jobs per tune from a pilot campaign"),
+    ("run", "runCampaign", "Run the jobs of a submission file locally"),
+    ("monitor", "monitorCampaign", "Monitor a running campaign and stop the converged tunes"),
+    ("benchmark", "benchmarkWeights", "Time the weight-building helpers and stages"),
+    ("event-weights", "eventWeights", "Compute the per-event weights of all variations from per-jet columns"),
+    ("export", "weightArchive", "Export weight files to ROOT-free archives, or list the contents of archives"),
+    ("check-memory", "checkProducerMemory", "Check that the memory of the weight producer does not grow with the number of streams"),
+]
+
+def listTunes(submitFile):
+    """Print the tunes, with their generator settings from the submission file if available"""
+    settings = {}
+    if submitFile and os.path.isfile(submitFile):
+        settings = dict((sc["tag"], sc) for sc in readSubmitFile(submitFile)[2])
+    print("{:<22}{:<12}{:<6}{:<10}{:<6}{}".format("tag", "tune", "frag", "param", "jobs", "notes"))
+    for tag in [ bfragConfig.REF ] + bfragConfig.TUNES:
+        sc = settings.get(tag, {})
+        notes = []
+        if tag == bfragConfig.REF:
+            notes.append("reference")
+        if tag in bfragConfig.DEBUG_TUNES:
+            notes.append("debug")
+        if "frag" + tag in bfragConfig.FRAG_WEIGHTS_VS_PT + bfragConfig.FRAG_WEIGHTS:
+            notes.append("produced by default")
+        print("{:<22}{:<12}{:<6}{:<10}{:<6}{}".format(tag, sc.get("tune", "-"), sc.get("frag", "-"), sc.get("param", "-"), sc.get("jobs", "-"), ", ".join(notes)))
+
+def stripComments(text, marker):
+    """Remove the comments starting with marker from each line"""
+    return "\n".join(line.split(marker)[0] for line in text.split("\n"))
+
+def cfiWeights(path, parameter):
+    """Names of the weights listed (and not commented out) for a parameter of the producer configuration"""
+    text = stripComments(open(path).read(), "#")
+    match = re.search(parameter + r"\s*=\s*cms\.vstring\(\[(.*?)\]\)", text, re.DOTALL)
+    if not match:
+        raise ValueError("No {} in {}".format(parameter, path))
+    return re.findall(r"[\"']([^\"']+)[\"']", match.group(1))
+
+def analyzerArray(text, name):
+    """Contents of a C++ array initializer in the analyzer"""
+    match = re.search(name + r"[^{]*\{([^}]*)\}", text)
+    if not match:
+        raise ValueError("No {} in {}".format(name, ANALYZER))
+    return [ item.strip().strip('"') for item in match.group(1).split(",") if item.strip() ]
+
+def validate(submitFile):
+    """Check the configuration and its consistency with the submission file, producer configuration and analyzer, return the list of problems"""
+    problems = bfragConfig.checkConfig()
+    tags = [ bfragConfig.REF ] + bfragConfig.TUNES
+
+    if os.path.isfile(submitFile):
+        submitted = [ sc["tag"] for sc in readSubmitFile(submitFile)[2] ]
+        problems += [ "{} is not generated in {}".format(tag, submitFile) for tag in tags if tag not in submitted ]
+        problems += [ "{} in {} is not a known tune".format(tag, submitFile) for tag in submitted if tag not in tags ]
+    else:
+        problems.append("No submission file {}".format(submitFile))
+
+    if os.path.isfile(PRODUCER_CFI):
+        for parameter, expected in ("frag_weights_vs_pt", bfragConfig.FRAG_WEIGHTS_VS_PT), ("frag_weights", bfragConfig.FRAG_WEIGHTS), ("br_weights", bfragConfig.BR_WEIGHTS):
+            if cfiWeights(PRODUCER_CFI, parameter) != expected:
+                problems.append("{} in {} differs from the defaults in bfragConfig.py".format(parameter, PRODUCER_CFI))
+
+    if os.path.isfile(ANALYZER):
+        text = stripComments(open(ANALYZER).read(), "//")
+        if [ float(x) for x in analyzerArray(text, "xb_binning") ] != bfragConfig.XB_BINNING:
+            problems.append("XB_BINNING differs from xb_binning in {}".format(ANALYZER))
+        if [ float(x) for x in analyzerArray(text, "pt_binning") ] != bfragConfig.PT_BINNING:
+            problems.append("PT_BINNING differs from pt_binning in {}".format(ANALYZER))
+        if sorted(analyzerArray(text, "debugWeights_")) != sorted("frag" + t for t in bfragConfig.DEBUG_TUNES):
+            problems.append("DEBUG_TUNES differs from the debug weights in {}".format(ANALYZER))
+    return problems
+
+def runScript(module, args):
+    """Run a script as if called from the command line with args"""
+    sys.argv = [ os.path.join(TEST_DIR, module + ".py") ] + args
+    runpy.run_module(module, run_name="__main__", alter_sys=True)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Derive, check and validate the b fragmentation and decay weights')
+    commands = parser.add_subparsers(dest="command", metavar="command")
+    tunes = commands.add_parser("tunes", help="List the tunes and their generator settings")
+    tunes.add_argument('-s', '--submitFile', default=SUBMIT_FILE, help='Submission file with the generator settings')
+    check = commands.add_parser("validate", help="Check the configuration against the submission file, the producer configuration and the analyzer")
+    check.add_argument('-s', '--submitFile', default=SUBMIT_FILE, help='Submission file to check')
+    for name, module, description in SCRIPTS:
+        commands.add_parser(name, help="{} ({}.py, see {} --help)".format(description, module, name), add_help=False)
+
+    args, rest = parser.parse_known_args(argv)
+    if args.command is None:
+        parser.print_help()
+        return 1
+    scripts = dict((name, module) for name, module, _ in SCRIPTS)
+    if args.command in scripts:
+        runScript(scripts[args.command], rest)
+        return 0
+    if rest:
+        parser.error("unrecognized arguments: {}".format(" ".join(rest)))
+    if args.command == "tunes":
+        listTunes(args.submitFile)
+    elif args.command == "validate":
+        problems = validate(args.submitFile)
+        for problem in problems:
+            print(problem)
+        if problems:
+            return 1
+        print("Configuration is consistent")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+
+"""
+Configuration shared by the weight-building, campaign and plotting scripts: tunes, branching ratios and binnings.
+
+This module only uses the standard library, such that it can be imported (e.g. to list the tunes or check the
+configuration with bfrag.py) without loading ROOT, SciPy or NumPy.
+"""
+
+# tunes for which weights are derived
+TUNES = [
+    'CP5BLup', 'CP5BL', 'CP5BLdown',
+    'CP5Peterson', 'CP5Petersonup', 'CP5Petersondown',
+    'CUETP8M2T4BL', 'CUETP8M2T4BLdefault',
+    'CUETP8M2T4BLLHC', 'CUETP8M2T4BLLHCup', 'CUETP8M2T4BLLHCdown',
+]
+# all ratios will be computed with the following as reference
+REF = 'CP5BLdefault'
+# weights applied in the debug histograms of BFragmentationAnalyzer
+DEBUG_TUNES = [
+    "CP5BL", "CP5BLdown", "CP5BLup", "CP5Peterson", "CP5Petersondown", "CP5Petersonup",
+    "CUETP8M2T4BL", "CUETP8M2T4BLdefault", "CUETP8M2T4BLLHC", "CUETP8M2T4BLLHCdown", "CUETP8M2T4BLLHCup",
+]
+
+# above that xb value, will apply different treatment
+THRES = 1.
+# upper edge along xb axis
+MAX = 1.5
+# pt-dependent weights are only applied above that jet pt
+MIN_PT = 30.
+
+# same binnings as in plugins/BFragmentationAnalyzer.cc
+XB_BINNING = [0.0,  0.02,  0.04, 0.06,  0.08, 0.1,   0.12, 0.14,  0.16, 0.18,  0.2,  0.22,  0.24, 0.26,
+              0.28, 0.3,   0.32, 0.34,  0.36, 0.38,  0.4,  0.41,  0.42, 0.43,  0.44, 0.45,  0.46, 0.47,
+              0.48, 0.49,  0.5,  0.51,  0.52, 0.53,  0.54, 0.55,  0.56, 0.57,  0.58, 0.59,  0.6,  0.605,
+              0.61, 0.615, 0.62, 0.625, 0.63, 0.635, 0.64, 0.645, 0.65, 0.655, 0.66, 0.665, 0.67, 0.675,
+              0.68, 0.685, 0.69, 0.695, 0.7,  0.705, 0.71, 0.715, 0.72, 0.725, 0.73, 0.735, 0.74, 0.745,
+              0.75, 0.755, 0.76, 0.765, 0.77, 0.775, 0.78, 0.785, 0.79, 0.795, 0.8,  0.805, 0.81, 0.815,
+              0.82, 0.825, 0.83, 0.835, 0.84, 0.845, 0.85, 0.855, 0.86, 0.865, 0.87, 0.875, 0.88, 0.885,
+              0.89, 0.895, 0.9,  0.905, 0.91, 0.915, 0.92, 0.925, 0.93, 0.935, 0.94, 0.945, 0.95, 0.955,
+              0.96, 0.965, 0.97, 0.975, 0.98, 0.985, 0.99, 0.995, 1.0,  1.05,  1.1,  1.5]
+PT_BINNING = [20., 40., 60., 100., 150., 200., 350., 500., 5000.]
+# number of xb bins below THRES merged together in each pT slice (named as in buildWeightFile.ptRangeName), 1 if not listed
+PT_SLICE_REBIN = { "pT20To40": 2, "pT40To60": 2, "pT150To200": 2, "pT200To350": 3, "pT350To500": 4, "pT500": 5 }
+
+BRs = [
+    #   PDGID, name,          py8_incl,py8_excl, pdg,    pdgUnc
+        (511,  'B^{0}',       0.23845, 0.1043,   0.1033, 0.0028),
+        (521,  'B^{+}',       0.25579, 0.1129,   0.1099, 0.0028),
+        (531,  'B^{0}_{s}',   0.21920, 0.0930,   0.0960, 0.008),
+        (5122, '#Lambda_{b}', 0.17870, 0.0770,   0.109,  0.022)
+    ]
+# where
+# py8_incl = sum(BR(H -> l nu X)) over lepton flavours, including tau
+# py8_excl = BR(H -> l nu X) for l = e or mu
+# pdg is excl
+
+# B hadrons for which BR weights are available
+BR_HADRONS = [ entry[0] for entry in BRs ]
+
+# same defaults as python/bfragWgtProducer_cfi.py
+FRAG_WEIGHTS_VS_PT = [ "fragCP5BL", "fragCP5BLdown", "fragCP5BLup", "fragCP5Peterson", "fragCP5Petersondown", "fragCP5Petersonup" ]
+FRAG_WEIGHTS = []
+BR_WEIGHTS = [ "semilepbrup", "semilepbrdown" ]
+
+def checkConfig():
+    """Return the list of inconsistencies between the settings above"""
+    problems = []
+    if REF in TUNES:
+        problems.append("reference {} is also in TUNES".format(REF))
+    if len(set(TUNES)) != len(TUNES):
+        problems.append("duplicate entries in TUNES")
+    for tune in DEBUG_TUNES:
+        if tune not in TUNES:
+            problems.append("debug tune {} is not in TUNES".format(tune))
+    for wgt in FRAG_WEIGHTS + FRAG_WEIGHTS_VS_PT:
+        if not wgt.startswith("frag") or wgt[len("frag"):] not in TUNES:
+            problems.append("default weight {} does not correspond to any tune".format(wgt))
+    for name, edges in ("XB_BINNING", XB_BINNING), ("PT_BINNING", PT_BINNING):
+        if any(b <= a for a, b in zip(edges[:-1], edges[1:])):
+            problems.append("{} is not strictly increasing".format(name))
+    if not 0. < THRES < MAX:
+        problems.append("THRES ({}) should be between 0 and MAX ({})".format(THRES, MAX))
+    if THRES not in XB_BINNING:
+        problems.append("THRES ({}) is not a bin edge of XB_BINNING".format(THRES))
+    slices = [ "pT{:.0f}To{:.0f}".format(a, b) for a, b in zip(PT_BINNING[:-2], PT_BINNING[1:-1]) ] + [ "pT{:.0f}".format(PT_BINNING[-2]) ]
+    nXb = len([ x for x in XB_BINNING if x <= THRES ]) - 1
+    for name, nTimes in PT_SLICE_REBIN.items():
+        if name not in slices:
+            problems.append("PT_SLICE_REBIN entry {} is not a pT slice of PT_BINNING".format(name))
+        if nTimes < 1 or nXb % nTimes != 0:
+            problems.append("the {} xb bins below THRES cannot be rebinned {} times for {}".format(nXb, nTimes, name))
+    if not PT_BINNING[0] <= MIN_PT < PT_BINNING[-1]:
+        problems.append("MIN_PT ({}) is outside of PT_BINNING".format(MIN_PT))
+    for pid, name, py8inc, py8exc, pdg, pdgUnc in BRs:
+        if not 0. < py8exc < py8inc < 1.:
+            problems.append("inconsistent Pythia8 branching ratios for {}".format(pid))
+        if not 0. < pdgUnc < pdg < 1.:
+            problems.append("inconsistent PDG branching ratio for {}".format(pid))
+    return problems
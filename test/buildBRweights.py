@@ -5,17 +5,8 @@ import os
 
 import ROOT
 
-BRs = [
-    #   PDGID, name,          py8_incl,py8_excl, pdg,    pdgUnc
-        (511,  'B^{0}',       0.23845, 0.1043,   0.1033, 0.0028),
-        (521,  'B^{+}',       0.25579, 0.1129,   0.1099, 0.0028),
-        (531,  'B^{0}_{s}',   0.21920, 0.0930,   0.0960, 0.008),
-        (5122, '#Lambda_{b}', 0.17870, 0.0770,   0.109,  0.022)
-    ]
-# where
-# py8_incl = sum(BR(H -> l nu X)) over lepton flavours, including tau
-# py8_excl = BR(H -> l nu X) for l = e or mu
-# pdg is excl
+from bfragConfig import BRs
+from weightArchive import exportRootFile
 
 def main(inPath, outPath):
     fIn = ROOT.TFile.Open(inPath)
@@ -64,6 +55,7 @@ def main(inPath, outPath):
 
     fOut.Close()
     print('Fragmentation been saved to {}'.format(outPath))
+    print('ROOT-free copy saved to {}'.format(exportRootFile(outPath, provenance={ "input": os.path.abspath(inPath), "BRs": BRs })))
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
@@ -2,24 +2,18 @@
 
 import argparse
 import os
+import multiprocessing
 import numpy as np
-from scipy import interpolate
 
 import ROOT
 
-TUNES = [
-    'CP5BLup', 'CP5BL', 'CP5BLdown',
-    'CP5Peterson', 'CP5Petersonup', 'CP5Petersondown',
-    'CUETP8M2T4BL', 'CUETP8M2T4BLdefault',
-    'CUETP8M2T4BLLHC', 'CUETP8M2T4BLLHCup', 'CUETP8M2T4BLLHCdown',
-]
-# all ratios will be computed with the following as reference
-REF = 'CP5BLdefault'
+from bfragConfig import TUNES, REF, THRES, MAX, MIN_PT, PT_SLICE_REBIN
+from weightEvaluator import graphToArrays, evalGraph, evalGraphs
+from histCache import HistCache, makeKey, histToDict, dictToHist, graphToDict, dictToGraph
+from weightArchive import exportRootFile
 
-# above that xb value, will apply different treatment
-THRES = 1.
-# upper edge along xb axis
-MAX = 1.5
+# change this when modifying the way the weights are derived, to invalidate the cached products
+CACHE_VERSION = 2
 
 from contextlib import contextmanager
 @contextmanager
@@ -80,6 +74,8 @@ def smoothWeights(ratio, ref, to1AboveThres=False):
 def smoothWeightsAkima(ratio, ref, to1AboveThres=False, numPoints=300):
     """ Derive the weights based on Akima sub-spline below the threshold, keep original ratios above (or set to 1 if to1AboveThres is True) """
 
+    from scipy import interpolate
+
     x_hist = [ ratio.GetXaxis().GetBinCenter(i) for i in range(1, ratio.GetXaxis().GetNbins() + 1) ]
     x_hist_below = [x for x in x_hist if x < THRES ]
     x = np.array([0.] + x_hist_below + [THRES])
@@ -154,123 +150,253 @@ def mergeBinsAbove(hist, thres, newName):
 
     return hist.Rebin(len(edges) - 1, newName, edges)
 
-def loadAllHists(inDir, name):
-    """Return dictionary: tunes->histogram (with name `name`) from all inDir/xb_{TAG}.root files"""
-    xb = {}
-    for tag in TUNES + [REF]:
-        with returnToDirectory():
-            fName = os.path.join(inDir, 'xb_{}.root'.format(tag))
-            fIn = ROOT.TFile.Open(fName)
-            xb[tag] = fIn.Get(name).Clone("xb_" + tag)
-            xb[tag].SetDirectory(0)
-            fIn.Close()
-    return xb
-
-def buildAndWriteWeights(inDir, outDir):
-    fOut = ROOT.TFile.Open(os.path.join(outDir, "bfragweights.root"), 'recreate')
-
-    xb = loadAllHists(inDir, "bfragAnalysis/xb_lead_B")
+def ptRangeName(ptBins, i):
+    """Name of the i-th pT slice, the last one being open-ended"""
+    if i == len(ptBins) - 2:
+        return "pT{:.0f}".format(ptBins[i])
+    return "pT{:.0f}To{:.0f}".format(ptBins[i], ptBins[i+1])
+
+def setTH2Contents(hist, values):
+    """Set all the (in-range) bin contents of a TH2 from an array indexed as [y,x], in a single call"""
+    contents = np.zeros((hist.GetNbinsY() + 2, hist.GetNbinsX() + 2), dtype=np.float64)
+    contents[1:-1,1:-1] = values
+    hist.SetContent(contents.ravel())
+
+def inputPath(inDir, tag):
+    return os.path.join(inDir, 'xb_{}.root'.format(tag))
+
+def loadHist(inDir, tag, name, newName, cache=None):
+    """Return histogram `name` from inDir/xb_{TAG}.root, renamed to newName (read through cache if given)"""
+    fName = inputPath(inDir, tag)
+    if cache:
+        return cache.loadHist(fName, name, newName)
+    with returnToDirectory():
+        fIn = ROOT.TFile.Open(fName)
+        hist = fIn.Get(name).Clone(newName)
+        hist.SetDirectory(0)
+        fIn.Close()
+    return hist
+
+def loadAllHists(inDir, name, cache=None):
+    """Return dictionary: tunes->histogram (with name `name`) from all inDir/xb_{TAG}.root files (read through cache if given)"""
+    return dict((tag, loadHist(inDir, tag, name, "xb_" + tag, cache)) for tag in TUNES + [REF])
+
+def mapJobs(func, args, jobs=1):
+    """Return [func(a) for a in args], computed by `jobs` worker processes if jobs > 1 (func and args must be picklable)"""
+    if jobs <= 1 or len(args) <= 1:
+        return [ func(a) for a in args ]
+    pool = multiprocessing.Pool(min(jobs, len(args)))
+    try:
+        return pool.map(func, args, chunksize=1)
+    finally:
+        pool.close()
+        pool.join()
+
+def cachedMapJobs(func, args, keys, jobs=1, cache=None):
+    """Same as mapJobs for functions returning tuples of graphs, but reuse the results stored in cache under keys and only compute the missing ones"""
+    if cache is None:
+        return mapJobs(func, args, jobs)
+    results = [ cache.load(key) for key in keys ]
+    results = [ tuple(dictToGraph(d) for d in res) if res is not None else None for res in results ]
+    missing = [ i for i,res in enumerate(results) if res is None ]
+    print("Reusing {} cached results, computing {}".format(len(results) - len(missing), len(missing)))
+    for i,res in zip(missing, mapJobs(func, [ args[i] for i in missing ], jobs)):
+        cache.store(keys[i], [ graphToDict(gr) for gr in res ])
+        results[i] = res
+    return results
+
+def productKey(cache, inDir, stage, *tags):
+    """Cache key for a product of `stage` derived from the inputs of tags"""
+    return makeKey(CACHE_VERSION, THRES, MAX, stage, *(list(tags) + [ cache.inputKey(inputPath(inDir, tag)) for tag in tags ]))
+
+def binOverlaps(edges, gridEdges):
+    """Fraction of each bin of `edges` covered by each bin of `gridEdges`, as a (bins, grid bins) matrix"""
+    low = np.maximum(edges[:-1,None], gridEdges[None,:-1])
+    high = np.minimum(edges[1:,None], gridEdges[None,1:])
+    return np.clip(high - low, 0., None) / np.diff(edges)[:,None]
+
+def foldWeights(counts, overlaps, weights):
+    """
+    Expected weighted yield of a histogram (in-range bin contents `counts`) for weights given per grid bin (1 outside of the grid),
+    assuming the entries are uniformly distributed within each bin.
+    Return (yield, bound): since the grid bins don't match the histogram bins, the actual yield can be anywhere between those
+    obtained with the smallest and largest weights overlapping each bin, bound is the largest deviation from the uniform assumption.
+    """
+    outside = np.clip(1. - overlaps.sum(axis=1), 0., None)
+    mean = overlaps.dot(weights) + outside
+    covered = overlaps > 0
+    wMin = np.where(covered, weights[None,:], np.inf).min(axis=1)
+    wMax = np.where(covered, weights[None,:], -np.inf).max(axis=1)
+    wMin = np.where(outside > 0, np.minimum(wMin, 1.), wMin)
+    wMax = np.where(outside > 0, np.maximum(wMax, 1.), wMax)
+    return np.sum(counts * mean), np.sum(counts * np.maximum(wMax - mean, mean - wMin))
+
+def analytic2DNorm(ref, ptRef, weights, xbBins):
+    """
+    Per-pT normalisation factors (and relative error bounds) of the pt-dependent weights: fold the weight maps
+    (array [tunes, pT slices, xb grid bins] on the xbBins grid) over the unweighted REF xb/pT distribution (dictionary from histToDict),
+    following the rules of the producer (weight 1 for xb >= 1 and jet pT < MIN_PT), such that the weighted number of jets
+    in each pT slice is unchanged; ptRef is the finely binned REF jet pT distribution, used for the slice containing MIN_PT.
+    Same factors as obtained by fixWeightNormalization.py from a debug run, without the statistical fluctuations of that run.
+    """
+    xEdges, ptEdges = ref["xedges"], ref["yedges"]
+    counts = ref["contents"].reshape(len(ptEdges) + 1, len(xEdges) + 1)
+    overlaps = binOverlaps(xEdges, xbBins)
+    # fraction of the jets of each pT slice below MIN_PT, where no weight is applied: the fine pT bins are split between
+    # the slices, and below/above MIN_PT, assuming uniformly distributed jets within each bin
+    fineEdges, fineCounts = ptRef["xedges"], ptRef["contents"]
+    inSlices = fineCounts[1:-1].dot(binOverlaps(fineEdges, ptEdges))
+    belowMin = fineCounts[1:-1].dot(binOverlaps(fineEdges, np.minimum(ptEdges, MIN_PT)))
+    # the overflow is above MIN_PT, in the slice of the upper edge of the fine binning (the last slice includes the pT overflow)
+    inSlices[np.clip(np.searchsorted(ptEdges, fineEdges[-1], side="right") - 1, 0, len(ptEdges) - 2)] += fineCounts[-1]
+    lowPt = np.where(inSlices > 0, belowMin / np.where(inSlices > 0, inSlices, 1.), 0.)
+
+    factors = np.ones(weights.shape[:2])
+    bounds = np.zeros(weights.shape[:2])
+    for j in range(len(ptEdges) - 1):
+        row = counts[j+1]
+        nJets = np.sum(row)
+        if nJets <= 0:
+            continue
+        for i in range(weights.shape[0]):
+            yld, bound = foldWeights(row[1:-1], overlaps, weights[i,j])
+            yld += row[0] + row[-1]
+            yld = (1. - lowPt[j]) * yld + lowPt[j] * nJets
+            factors[i,j] = nJets / yld
+            bounds[i,j] = (1. - lowPt[j]) * bound / yld
+    return factors, bounds
+
+def deriveWeights(args):
+    """Derive the raw and smoothed pt-averaged weight graphs for one tune (can run in a worker process)"""
+    tag, hist, ref, ref_smoothed = args
+    toDensity(hist)
+    ratio = hist.Clone(hist.GetName() + "_ratio")
+    ratio.Divide(ref)
+    raw_gr = ROOT.TGraphErrors(ratio)
+    raw_gr.SetMarkerStyle(20)
+    raw_gr.SetName("frag{}".format(tag))
+    raw_gr.SetLineColor(ROOT.kBlue)
+
+    th1SmoothRange(hist, 2, 0., THRES)
+    hist.Divide(ref_smoothed)
+    # sgr = smoothWeights(hist, ref)
+    sgr = smoothWeightsAkima(hist, ref) # interpolate using Akima subspline, set weight to 1 above xb=1
+    sgr.SetName("frag{}_smooth".format(tag))
+    sgr.SetLineColor(ROOT.kRed)
+    return raw_gr, sgr
+
+def derive2DWeights(args):
+    """Derive the raw and smoothed weight graphs for one tune and pT slice (can run in a worker process)"""
+    tag, ptRange, hist, ref, ref_smooth = args
+    ratio = hist.Clone(hist.GetName() + "_ratio")
+    ratio.Divide(ref)
+    raw_gr = ROOT.TGraphErrors(ratio)
+    raw_gr.SetMarkerStyle(20)
+    raw_gr.SetName("frag{}_{}".format(tag, ptRange))
+    raw_gr.SetLineColor(ROOT.kBlue)
+
+    hist = hist.Clone(hist.GetName() + "_smooth") # leave the input density untouched
+    th1SmoothRange(hist, 2, 0., THRES) # smooth target hists between 0 and 1 before dividing
+    hist.Divide(ref_smooth)
+    raw_sgr = ROOT.TGraphErrors(hist)
+    raw_sgr.SetMarkerStyle(20)
+    raw_sgr.SetName("frag{}_{}_rawSmooth".format(tag, ptRange)) # "rawSmooth" = only histogram smoothing, no spline
+    raw_sgr.SetLineColor(ROOT.kGreen)
+    sgr = smoothWeightsAkima(hist, ref_smooth) # interpolate using Akima subspline
+    sgr.SetName("frag{}_{}_smooth".format(tag, ptRange))
+    sgr.SetLineColor(ROOT.kRed)
+    return raw_gr, raw_sgr, sgr
+
+def buildAndWriteWeights(inDir, outDir, jobs=1, cache=None):
+    xb = loadAllHists(inDir, "bfragAnalysis/xb_lead_B", cache)
 
     toDensity(xb[REF])
-    #save to file
     ref_smoothed = xb[REF].Clone(xb[REF].GetName() + "_smooth")
     th1SmoothRange(ref_smoothed, 2, 0., THRES)
-    for tag in TUNES:
-        toDensity(xb[tag])
-        ratio = xb[tag].Clone(xb[tag].GetName() + "_ratio")
-        ratio.Divide(xb[REF])
-        raw_gr = ROOT.TGraphErrors(ratio)
-        raw_gr.SetMarkerStyle(20)
-        raw_gr.SetName("frag{}".format(tag))
-        raw_gr.SetLineColor(ROOT.kBlue)
-        raw_gr.Write()
+    # the tunes are independent: derive their weights in parallel, only open the output file afterwards
+    keys = [ productKey(cache, inDir, "xb_lead_B", tag, REF) for tag in TUNES ] if cache else None
+    graphs = cachedMapJobs(deriveWeights, [ (tag, xb[tag], xb[REF], ref_smoothed) for tag in TUNES ], keys, jobs, cache)
 
-        th1SmoothRange(xb[tag], 2, 0., THRES)
-        xb[tag].Divide(ref_smoothed)
-        # sgr = smoothWeights(xb[tag], xb[REF])
-        sgr = smoothWeightsAkima(xb[tag], xb[REF]) # interpolate using Akima subspline, set weight to 1 above xb=1
-        sgr.SetName("frag{}_smooth".format(tag))
-        sgr.SetLineColor(ROOT.kRed)
+    #save to file
+    fOut = ROOT.TFile.Open(os.path.join(outDir, "bfragweights.root"), 'recreate')
+    for raw_gr, sgr in graphs:
+        raw_gr.Write()
         sgr.Write()
 
     fOut.Close()
 
-def buildAndWrite2DWeights(inDir, outDir):
-    fOut = ROOT.TFile.Open(os.path.join(outDir, "bfragweights_vs_pt_debug.root"), 'recreate')
-    
-    xb = loadAllHists(inDir, "bfragAnalysis/xb_pt_lead_B")
+def splitPtSlices(hist, ptBins, ptProjName):
+    """Extract the 1D xb densities in all pT slices of a 2D xb/pT hist, return dictionary: pT slice->density, and the pT projection"""
+    hists = {}
+    yaxis = hist.GetYaxis()
+    for i in range(1, yaxis.GetNbins() + 1):
+        ptRange = ptRangeName(ptBins, i - 1)
+        if i < yaxis.GetNbins():
+            proj = hist.ProjectionX(hist.GetName() + "_" + ptRange, i, i, "e")
+        else:
+            # last slice includes the overflow
+            proj = hist.ProjectionX(hist.GetName() + "_" + ptRange, i, yaxis.GetNbins() + 1, "e")
+        hists[ptRange] = proj
+    # ad-hoc rebinnings
+    for ptRange, nTimes in PT_SLICE_REBIN.items():
+        if nTimes > 1 and ptRange in hists:
+            hists[ptRange] = th1RebinRange(hists[ptRange], nTimes, 0., THRES, suffix="")
+    for pt in hists.keys():
+        proj = hists[pt]
+        name = proj.GetName()
+        proj.SetName(name + "_beforeMerge")
+        # keep only 1 bin above 1 (before normalizing into a pdf!!)
+        proj = mergeBinsAbove(proj, THRES, name)
+        # transform count histograms into p.d.f's
+        toDensity(proj)
+        hists[pt] = proj
+    return hists, hist.ProjectionY(ptProjName, 0, -1, "e")
+
+def buildAndWrite2DWeights(inDir, outDir, jobs=1, cache=None, analyticNorm=False):
+    xb = loadAllHists(inDir, "bfragAnalysis/xb_pt_lead_B", cache)
 
     ptBins = [ xb[REF].GetYaxis().GetBinLowEdge(i) for i in range(1, xb[REF].GetYaxis().GetNbins() + 2) ]
     ptBins = np.array(ptBins)
 
     # extract all the 1D xb slices from the 2D xb/pT hists
     xb_split = {}
-    pt_proj = {} # pT projections for debugging
+    debug_hists = [] # projections, saved for debugging
     for tag,hist in xb.items():
-        hists = {}
-        yaxis = hist.GetYaxis()
-        for i in range(1, yaxis.GetNbins() + 1):
-            start,stop = yaxis.GetBinLowEdge(i),yaxis.GetBinUpEdge(i)
-            if start < ptBins[-2]:
-                ptRange = "pT{:.0f}To{:.0f}".format(start, stop)
-                proj = hist.ProjectionX(hist.GetName() + "_" + ptRange, i, i, "e")
-                hists[ptRange] = proj
-            else:
-                ptRange = "pT{:.0f}".format(start)
-                proj = hist.ProjectionX(hist.GetName() + "_" + ptRange, i, yaxis.GetNbins() + 1, "e")
-                hists[ptRange] = proj
-        # ad-hoc rebinnings
-        hists["pT20To40"] = th1RebinRange(hists["pT20To40"], 2, 0., THRES, suffix="")
-        hists["pT40To60"] = th1RebinRange(hists["pT40To60"], 2, 0., THRES, suffix="")
-        hists["pT150To200"] = th1RebinRange(hists["pT150To200"], 2, 0., THRES, suffix="")
-        hists["pT200To350"] = th1RebinRange(hists["pT200To350"], 3, 0., THRES, suffix="")
-        hists["pT350To500"] = th1RebinRange(hists["pT350To500"], 4, 0., THRES, suffix="")
-        hists["pT500"] = th1RebinRange(hists["pT500"], 5, 0., THRES, suffix="")
-        for pt in hists.keys():
-            proj = hists[pt]
-            name = proj.GetName()
-            proj.SetName(name + "_beforeMerge")
-            # keep only 1 bin above 1 (before normalizing into a pdf!!)
-            proj = mergeBinsAbove(proj, THRES, name)
-            # transform count histograms into p.d.f's
-            toDensity(proj)
-            proj.Write()
-            hists[pt] = proj
+        # the slices are stored with their pT range, as the order of the dictionary is arbitrary in Python 2
+        key = productKey(cache, inDir, "xb_pt_lead_B_slices", tag) if cache else None
+        items = cache.load(key) if cache else None
+        if items is None:
+            hists, pt_proj = splitPtSlices(hist, ptBins, "pt_" + tag)
+            if cache:
+                cache.store(key, [ dict(histToDict(h), ptRange=np.array(ptRange)) for ptRange,h in hists.items() ] + [ histToDict(pt_proj) ])
+        else:
+            hists = dict((str(item["ptRange"]), dictToHist(item)) for item in items[:-1])
+            pt_proj = dictToHist(items[-1])
+        debug_hists.extend(hists.values())
+        debug_hists.append(pt_proj)
         xb_split[tag] = hists
 
-        hist.ProjectionY("pt_" + tag, 0, -1, "e").Write()
-
     refs_smoothed = { ptRange: xb_split[REF][ptRange].Clone(xb_split[REF][ptRange].GetName() + "_smooth") for ptRange in xb_split[REF] }
     for hist in refs_smoothed.values():
         th1SmoothRange(hist, 2, 0., THRES) # smooth reference hists between 0 and 1
 
+    # the tunes and pT slices are independent: derive their weights in parallel
+    slices = [ (tag, ptRange) for tag in TUNES for ptRange in xb_split[tag] ]
+    keys = [ productKey(cache, inDir, "xb_pt_lead_B_" + ptRange, tag, REF) for tag,ptRange in slices ] if cache else None
+    results = cachedMapJobs(derive2DWeights, [ (tag, ptRange, xb_split[tag][ptRange], xb_split[REF][ptRange], refs_smoothed[ptRange]) for tag,ptRange in slices ], keys, jobs, cache)
+
     raw_graphs = { tag: {} for tag in TUNES }
     smooth_graphs = { tag: {} for tag in TUNES }
 
-    for tag in TUNES:
-        for ptRange,hist in xb_split[tag].items():
-            ratio = hist.Clone(hist.GetName() + "_ratio")
-            ratio.Divide(xb_split[REF][ptRange])
-            raw_gr = ROOT.TGraphErrors(ratio)
-            raw_gr.SetMarkerStyle(20)
-            raw_gr.SetName("frag{}_{}".format(tag, ptRange))
-            raw_gr.SetLineColor(ROOT.kBlue)
-            raw_gr.Write()
-            raw_graphs[tag][ptRange] = raw_gr
-
-            ref_smooth = refs_smoothed[ptRange]
-            th1SmoothRange(hist, 2, 0., THRES) # smooth target hists between 0 and 1 before dividing
-            hist.Divide(ref_smooth)
-            raw_sgr = ROOT.TGraphErrors(hist)
-            raw_sgr.SetMarkerStyle(20)
-            raw_sgr.SetName("frag{}_{}_rawSmooth".format(tag, ptRange)) # "rawSmooth" = only histogram smoothing, no spline
-            raw_sgr.SetLineColor(ROOT.kGreen)
-            raw_sgr.Write()
-            sgr = smoothWeightsAkima(hist, ref_smooth) # interpolate using Akima subspline
-            sgr.SetName("frag{}_{}_smooth".format(tag, ptRange))
-            sgr.SetLineColor(ROOT.kRed)
-            sgr.Write() # save intermediate graphs for debugging
-            smooth_graphs[tag][ptRange] = sgr
+    fOut = ROOT.TFile.Open(os.path.join(outDir, "bfragweights_vs_pt_debug.root"), 'recreate')
+    for hist in debug_hists:
+        hist.Write()
+    for (tag, ptRange), (raw_gr, raw_sgr, sgr) in zip(slices, results):
+        raw_gr.Write()
+        raw_sgr.Write()
+        sgr.Write() # save intermediate graphs for debugging
+        raw_graphs[tag][ptRange] = raw_gr
+        smooth_graphs[tag][ptRange] = sgr
 
     fOut.Close()
 
@@ -278,34 +404,92 @@ def buildAndWrite2DWeights(inDir, outDir):
 
     # create TH2's used to apply the weights
     xbBins = np.linspace(0, THRES, 300, endpoint=True)
-    for tag in TUNES:
+    ptRanges = [ ptRangeName(ptBins, i) for i in range(len(ptBins) - 1) ]
+    # evaluate all graphs on the xb bin edges at once, and average the two edges of each bin
+    graphs = [ graphToArrays(gr[tag][ptRange]) for gr in (raw_graphs, smooth_graphs) for tag in TUNES for ptRange in ptRanges ]
+    atEdges = evalGraphs(graphs, xbBins)
+    weights = (0.5 * (atEdges[:,:-1] + atEdges[:,1:])).reshape(2, len(TUNES), len(ptRanges), len(xbBins) - 1)
+    if analyticNorm:
+        # normalise the smoothed weights in each pT slice in the same pass
+        ptRef = histToDict(loadHist(inDir, REF, "bfragAnalysis/pt", "pt_ref", cache))
+        factors, bounds = analytic2DNorm(histToDict(xb[REF]), ptRef, weights[1], xbBins)
+        for i,tag in enumerate(TUNES):
+            print("")
+            for j in range(len(ptRanges)):
+                print("Rescaling {} in pT bin {} by {} (+- {:.2e} from the binning)".format(tag, j + 1, factors[i,j], bounds[i,j]))
+        weights[1] *= factors[:,:,None]
+    for i,tag in enumerate(TUNES):
         raw_th2 = ROOT.TH2F("frag{}".format(tag), "", len(xbBins) - 1, xbBins, len(ptBins) - 1, ptBins)
         smooth_th2 = ROOT.TH2F("frag{}_smooth".format(tag), "", len(xbBins) - 1, xbBins, len(ptBins) - 1, ptBins)
-        for i,pt in enumerate(ptBins[:-1]):
-            if pt == ptBins[-2]:
-                ptRange = "pT{:.0f}".format(pt)
-            else:
-                ptRange = "pT{:.0f}To{:.0f}".format(pt, ptBins[i+1])
-            raw_gr = raw_graphs[tag][ptRange]
-            smooth_gr = smooth_graphs[tag][ptRange]
-            for j in range(len(xbBins) - 1):
-                raw_th2.SetBinContent(j + 1, i + 1, (raw_gr.Eval(xbBins[j]) + raw_gr.Eval(xbBins[j+1]))/2.)
-                smooth_th2.SetBinContent(j + 1, i + 1, (smooth_gr.Eval(xbBins[j]) + smooth_gr.Eval(xbBins[j+1]))/2.)
+        setTH2Contents(raw_th2, weights[0,i])
+        setTH2Contents(smooth_th2, weights[1,i])
 
         raw_th2.Write()
         smooth_th2.Write()
 
     fOut.Close()
 
+def graphToGrid(gr, maxPoints=100000):
+    """Sample a graph on a uniform grid containing all its points, return (number of intervals, first point, step, values)"""
+    gx, gy = graphToArrays(gr)
+    minStep = np.min(np.diff(gx))
+    if minStep <= 0:
+        raise RuntimeError("Graph {} has several points with the same x".format(gr.GetName()))
+    n = int(round((gx[-1] - gx[0]) / minStep))
+    if n > maxPoints:
+        raise RuntimeError("Graph {} would need {} points on a uniform grid".format(gr.GetName(), n))
+    step = (gx[-1] - gx[0]) / n
+    # the lookup table only reproduces TGraph::Eval if all the points of the graph are on the grid
+    steps = (gx - gx[0]) / step
+    if not np.allclose(steps, np.round(steps)):
+        raise RuntimeError("The points of graph {} are not on a uniform grid with step {}".format(gr.GetName(), step))
+    return n, gx[0], step, evalGraph(gx, gy, gx[0] + step * np.arange(n + 1))
+
+def writeWeightTable(fragPath, fragVsPtPath, outPath):
+    """Write the smoothed weights of all tunes as flat lookup tables for BFragmentationWeightProducer (see interface/BFragmentationWeightTable.h)"""
+    fOut = ROOT.TFile.Open(outPath, 'recreate')
+
+    fIn = ROOT.TFile.Open(fragVsPtPath)
+    for i,tag in enumerate(TUNES):
+        hist = fIn.Get("frag{}_smooth".format(tag))
+        arrays = histToDict(hist)
+        if i == 0:
+            xEdges = arrays["xedges"]
+            if not np.allclose(np.diff(xEdges), xEdges[1] - xEdges[0]):
+                raise RuntimeError("The xb binning of {} is not uniform".format(hist.GetName()))
+            fOut.WriteTObject(ROOT.TVectorD(3, np.array([len(xEdges) - 1, xEdges[0], xEdges[-1]], dtype=np.float64)), "xb_grid")
+            fOut.WriteTObject(ROOT.TVectorD(len(arrays["yedges"]), arrays["yedges"].astype(np.float64)), "pt_edges")
+        # same layout as the TH2 contents: xb bins (with under/overflow) for each pt bin (with under/overflow)
+        block = arrays["contents"].astype(np.float32)
+        fOut.WriteTObject(ROOT.TVectorF(len(block), block), "frag{}_vsPt".format(tag))
+    fIn.Close()
+
+    fIn = ROOT.TFile.Open(fragPath)
+    for tag in TUNES:
+        n, xMin, step, values = graphToGrid(fIn.Get("frag{}_smooth".format(tag)))
+        fOut.WriteTObject(ROOT.TVectorD(3, np.array([n, xMin, step], dtype=np.float64)), "frag{}_avg_grid".format(tag))
+        fOut.WriteTObject(ROOT.TVectorF(len(values), values.astype(np.float32)), "frag{}_avg".format(tag))
+    fIn.Close()
+
+    fOut.Close()
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('-i', '--input', help='Input folder containing merged output ROOT files from condor jobs')
     parser.add_argument('-o', '--output', default=os.path.join(os.getenv("CMSSW_BASE"), "src/TopQuarkAnalysis/BFragmentationAnalyzer/data/"), help='Output folder')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of worker processes used to derive the weights of the different tunes')
+    parser.add_argument('-c', '--cache', help='Folder to cache input histograms and derived products in, to only recompute the tunes whose inputs changed')
+    parser.add_argument('--analyticNorm', action='store_true', help='Normalise the smoothed pt-dependent weights by folding them over the {} distribution, instead of using fixWeightNormalization.py with a debug run (the pt-averaged weights still need fixWeightNormalization.py --averagedOnly)'.format(REF))
     args = parser.parse_args()
 
     if not os.path.isdir(args.output):
         os.mkdir(args.output)
 
-    buildAndWriteWeights(args.input, args.output)
-    buildAndWrite2DWeights(args.input, args.output)
+    cache = HistCache(args.cache) if args.cache else None
+    buildAndWriteWeights(args.input, args.output, args.jobs, cache)
+    buildAndWrite2DWeights(args.input, args.output, args.jobs, cache, args.analyticNorm)
+    writeWeightTable(os.path.join(args.output, "bfragweights.root"), os.path.join(args.output, "bfragweights_vs_pt.root"), os.path.join(args.output, "bfragweights_table.root"))
+    # same weights for the frameworks reading them without ROOT
+    for fn in "bfragweights.root", "bfragweights_vs_pt.root":
+        exportRootFile(os.path.join(args.output, fn), provenance={ "input": os.path.abspath(args.input), "analyticNorm": args.analyticNorm })
     print('Fragmentation weights saved to {}'.format(args.output))
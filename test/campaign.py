@@ -0,0 +1,103 @@
+#!/usr/bin/env python
+
+"""
+Description of the generation campaigns, as given by the condor submission files (condor.sub, condor_fixNorm.sub):
+the macros (number of events per job, number of jobs, ...) and the table of (tune, fragmentation, parameter, tag) scenarios.
+
+Both the table form of condor.sub
+
+    queue $(repeat) arguments from (
+    $(initialArgs) cp5 BL 0.855 CP5BLdefault True
+    ...
+    )
+
+and one queue statement per scenario (as written by planCampaign.py) are understood:
+
+    arguments = $(initialArgs) cp5 BL 1.056 CP5BL
+    queue 12
+"""
+
+import re
+
+MACRO = re.compile(r"^\s*([A-Za-z_][A-Za-z0-9_.+]*)\s*=\s*(.*?)\s*$")
+QUEUE = re.compile(r"^\s*queue\b\s*(.*?)\s*$", re.IGNORECASE)
+QUEUE_FROM = re.compile(r"^(\S*)\s*arguments\s+from\s*\($", re.IGNORECASE)
+INITIAL_ARGS = "$(initialArgs)"
+
+def expandMacros(value, macros):
+    """Replace the $(NAME) references to the macros defined in the submission file"""
+    return re.sub(r"\$\(([A-Za-z_][A-Za-z0-9_]*)\)", lambda m: macros.get(m.group(1), m.group(0)), value)
+
+def parseScenario(line, nJobs):
+    """Scenario dictionary from the arguments after $(initialArgs): tune frag param tag [debug [ntuple]]"""
+    args = line.split()
+    if args and args[0] == INITIAL_ARGS:
+        args = args[1:]
+    if len(args) not in (4, 5, 6):
+        raise ValueError("Cannot parse scenario '{}', expected: tune frag param tag [debug [ntuple]]".format(line))
+    return {
+        "tune": args[0],
+        "frag": args[1],
+        "param": args[2],
+        "tag": args[3],
+        "debug": len(args) >= 5 and args[4].lower() == "true",
+        "ntuple": len(args) == 6 and args[5].lower() == "true",
+        "jobs": nJobs,
+    }
+
+def readSubmitFile(path):
+    """Return (header lines before the first queue statement, dictionary of macros, list of scenario dictionaries)"""
+    with open(path) as f:
+        lines = [ l.rstrip("\n") for l in f ]
+
+    header, macros, scenarios = [], {}, []
+    arguments = None
+    inTable, tableJobs = False, 0
+    for line in lines:
+        stripped = line.strip()
+        if inTable:
+            if stripped == ")":
+                inTable = False
+            elif stripped and not stripped.startswith("#"):
+                scenarios.append(parseScenario(stripped, tableJobs))
+            continue
+        queue = QUEUE.match(line)
+        if queue:
+            rest = expandMacros(queue.group(1), macros)
+            table = QUEUE_FROM.match(rest)
+            if table:
+                inTable, tableJobs = True, int(table.group(1) or 1)
+            else:
+                if arguments is None:
+                    raise ValueError("queue statement without arguments in {}".format(path))
+                scenarios.append(parseScenario(arguments, int(rest or 1)))
+            continue
+        macro = MACRO.match(line)
+        if macro and macro.group(1).lower() == "arguments":
+            arguments = macro.group(2)
+            continue
+        if not scenarios:
+            header.append(line)
+        if macro:
+            macros[macro.group(1)] = expandMacros(macro.group(2), macros)
+    return header, macros, scenarios
+
+def scenarioArguments(scenario):
+    """Arguments of condor_script.sh after $(initialArgs)"""
+    args = [ scenario["tune"], scenario["frag"], scenario["param"], scenario["tag"] ]
+    if scenario["debug"] or scenario.get("ntuple"):
+        args.append(str(scenario["debug"]))
+    if scenario.get("ntuple"):
+        args.append("True")
+    return " ".join(args)
+
+def writeSubmitFile(path, header, scenarios, comments=()):
+    """Write a submission file with the header lines, and one queue statement per scenario with its own number of jobs"""
+    with open(path, "w") as f:
+        for line in header:
+            f.write(line + "\n")
+        for comment in comments:
+            f.write("# {}\n".format(comment))
+        for scenario in scenarios:
+            f.write("arguments = {} {}\n".format(INITIAL_ARGS, scenarioArguments(scenario)))
+            f.write("queue {}\n".format(scenario["jobs"]))
@@ -0,0 +1,69 @@
+#!/usr/bin/env python
+
+"""
+Check that the memory used by BFragmentationWeightProducer does not grow with the number of streams.
+
+The weights are loaded once per job and shared by all the streams, so the memory attributed to the producer (the peak
+resident memory of a job with the producer, minus the one of the same job without it) should be the same for any
+number of streams. runBFragmentationWeightProducer_cfg.py is run with and without the producer for each number of
+streams, and the check fails if the memory of the producer grows by more than --tolerance MB per additional stream:
+
+    ./checkProducerMemory.py --streams 1 4 8 -n 500
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+CFG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "runBFragmentationWeightProducer_cfg.py")
+
+def peakMemory(args, workDir, logName):
+    """Run cmsRun in workDir, return its peak resident memory in MB"""
+    with open(os.path.join(workDir, logName), "w") as log:
+        proc = subprocess.Popen([ "cmsRun", CFG ] + args, cwd=workDir, stdout=log, stderr=subprocess.STDOUT)
+        # resource usage of this process only (ru_maxrss is in kB on Linux)
+        _, status, usage = os.wait4(proc.pid, 0)
+    if not os.WIFEXITED(status) or os.WEXITSTATUS(status) != 0:
+        raise RuntimeError("cmsRun {} failed, see {}".format(" ".join(args), os.path.join(workDir, logName)))
+    return usage.ru_maxrss / 1024.
+
+def producerMemory(streams, nEvents, inputFile=None, workDir=None):
+    """Return a list of (streams, peak memory without the producer, peak memory with it) in MB"""
+    results = []
+    for n in streams:
+        args = [ "nThreads={}".format(n), "maxEvents={}".format(nEvents) ]
+        if inputFile:
+            args.append("inputFile={}".format(inputFile))
+        without = peakMemory(args + [ "weights=False" ], workDir, "noWeights_{}streams.log".format(n))
+        withWeights = peakMemory(args + [ "weights=True" ], workDir, "weights_{}streams.log".format(n))
+        results.append((n, without, withWeights))
+        print("{:>8}{:>14.1f}{:>14.1f}{:>14.1f}".format(n, without, withWeights, withWeights - without))
+    return results
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Check that the memory used by the weight producer does not grow with the number of streams')
+    parser.add_argument('--streams', nargs='+', type=int, default=[ 1, 4, 8 ], help='Numbers of streams (and threads) to compare')
+    parser.add_argument('-n', '--maxEvents', type=int, default=500, help='Number of events per job')
+    parser.add_argument('-i', '--inputFile', help='Input MiniAOD file (default: the one of the cfg)')
+    parser.add_argument('--tolerance', type=float, default=1., help='Maximal growth of the producer memory per additional stream, in MB')
+    parser.add_argument('--workDir', help='Folder for the job outputs and logs (default: temporary, removed at the end)')
+    args = parser.parse_args()
+
+    workDir = args.workDir if args.workDir else tempfile.mkdtemp(prefix="bfragMemory")
+    if not os.path.isdir(workDir):
+        os.makedirs(workDir)
+    print("{:>8}{:>14}{:>14}{:>14}".format("streams", "without [MB]", "with [MB]", "producer [MB]"))
+    try:
+        results = producerMemory(sorted(args.streams), args.maxEvents, args.inputFile, workDir)
+    finally:
+        if not args.workDir:
+            shutil.rmtree(workDir)
+
+    (n0, without0, with0), (n1, without1, with1) = results[0], results[-1]
+    growth = ((with1 - without1) - (with0 - without0)) / (n1 - n0) if n1 > n0 else 0.
+    print("Producer memory growth: {:.2f} MB per additional stream (tolerance: {:.2f} MB)".format(growth, args.tolerance))
+    if growth > args.tolerance:
+        sys.exit(1)
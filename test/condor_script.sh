@@ -12,6 +12,8 @@ param=$7
 tag=$8
 seed=$((1000+${JOBID}))
 debug=${9:-False}
+ntuple=${10:-False}
+nThreads=${NTHREADS:-1}
 
 pushd ${CMSDIR}/src
 eval `scramv1 runtime -sh`
@@ -19,4 +21,4 @@ popd
 
 outFile=xb_${tag}_${JOBID}.root
 echo ${outFile}
-cmsRun ${CMSSW_BASE}/src/TopQuarkAnalysis/BFragmentationAnalyzer/test/runBFragmentationAnalyzer_cfg.py maxEvents=$maxEvents frag=$frag param=$param tune=$tune outputFile=${outFile} seed=${seed} debug=${debug}
+cmsRun ${CMSSW_BASE}/src/TopQuarkAnalysis/BFragmentationAnalyzer/test/runBFragmentationAnalyzer_cfg.py maxEvents=$maxEvents frag=$frag param=$param tune=$tune outputFile=${outFile} seed=${seed} debug=${debug} ntuple=${ntuple} nThreads=${nThreads}
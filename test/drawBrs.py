@@ -2,7 +2,7 @@
 
 import ROOT
 
-from buildBRweights import BRs
+from bfragConfig import BRs
 
 def getPythia8Envelope():
     ROOT.gROOT.SetBatch(True)
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+
+"""
+Per-event fragmentation and BR weights for all the variations at once, from per-jet columns of flat trees.
+
+The inputs are trees with one entry per event and jagged per-jet branches, e.g. NanoAOD-like skims with the jet
+count nGenJet and the branches GenJet_xb_lead_B, GenJet_pt, GenJet_leadTagId_B and GenJet_hasSemiLepDecay (with
+--collection GenJet). The events are read in chunks of bounded size, the jet weights of all the variations of
+bfragWgtProducer_cfi.py are evaluated with WeightEvaluator, and their products over the jets of each event are written
+as one row of a float32 matrix (events, variations). The matrix is a memory-mapped .npy file filled chunk by chunk, so
+the memory usage does not depend on the number of events; the variation names and inputs are listed in a JSON file
+next to it:
+
+    ./eventWeights.py skims/ -w ../data -o weights.npy -j 8
+    weights = np.load("weights.npy", mmap_mode="r") # rows in the order of the input files and entries
+
+The ROOT-free weight archives (.bfw, see weightArchive.py) are used when present in the weight folder.
+"""
+
+import argparse
+import json
+import os
+import multiprocessing
+import numpy as np
+
+from bfragConfig import FRAG_WEIGHTS_VS_PT, FRAG_WEIGHTS, BR_WEIGHTS
+from weightArchive import archivePath
+from weightEvaluator import WeightEvaluator, bufferToArray
+from replayWeights import findInputs
+
+WEIGHT_FILES = [ "bfragweights_vs_pt.root", "bfragweights.root", "bdecayweights.root" ]
+# per-jet columns, after the name of the jet collection
+COLUMNS = [ "xb_lead_B", "pt", "leadTagId_B", "hasSemiLepDecay" ]
+
+def weightFiles(weightDir):
+    """Weight files of a folder, preferring the exported archives to the ROOT files"""
+    paths = []
+    for fn in WEIGHT_FILES:
+        path = os.path.join(weightDir, fn)
+        paths.append(archivePath(path) if os.path.isfile(archivePath(path)) else path)
+    return paths
+
+def eventProducts(weights, counts):
+    """Products of the per-jet weights (array (jets, variations)) over the jets of each event, given the number of jets per event"""
+    products = np.ones((len(counts), weights.shape[1]), dtype=weights.dtype)
+    nonEmpty = counts > 0
+    if np.any(nonEmpty):
+        # reduceat does not handle empty segments: only reduce from the first jet of the events with jets
+        starts = (np.cumsum(counts) - counts)[nonEmpty]
+        products[nonEmpty] = np.multiply.reduceat(weights, starts, axis=0)
+    return products
+
+def chunkWeights(evaluator, counts, xb, pt, bId, semiLep):
+    """Event weights (events, variations) for a chunk of events, in the order of evaluator.names()"""
+    if np.sum(counts) != len(xb):
+        raise ValueError("The jet counts ({}) don't match the number of jets ({})".format(np.sum(counts), len(xb)))
+    names = evaluator.names()
+    if not names:
+        raise ValueError("The evaluator has no weight variations")
+    weights = evaluator.evaluate(xb, pt, bId, semiLep)
+    # single precision, as the products of weights in the analyzer
+    return eventProducts(np.stack([ weights[name] for name in names ], axis=1), counts)
+
+def readEvents(tree, collection, first, n):
+    """Return (number of jets per event, dictionary: column->array for all the jets) for n entries starting at first"""
+    tree.SetEstimate(n + 1)
+    nSel = tree.Draw("n" + collection, "", "goff", n, first)
+    if nSel < 0:
+        raise KeyError("Could not read the jet count n{} from {}".format(collection, tree.GetName()))
+    counts = bufferToArray(tree.GetV1(), nSel).astype(np.int64)
+    nJets = int(counts.sum())
+    columns = dict((name, np.zeros(0)) for name in COLUMNS)
+    if nJets:
+        tree.SetEstimate(nJets + 1)
+        nSel = tree.Draw(":".join("{}_{}".format(collection, name) for name in COLUMNS), "", "goff", n, first)
+        for i, name in enumerate(COLUMNS):
+            columns[name] = bufferToArray(getattr(tree, "GetV{}".format(i + 1))(), nSel)
+    return counts, columns
+
+def openTree(path, treeName):
+    import ROOT
+    fIn = ROOT.TFile.Open(path)
+    if not fIn or fIn.IsZombie():
+        raise IOError("Could not open {}".format(path))
+    tree = fIn.Get(treeName)
+    if not tree:
+        raise KeyError("No tree {} in {}".format(treeName, path))
+    return fIn, tree
+
+# evaluator and opened input of each worker process, such that the weight files are only read once per worker
+_worker = {}
+
+def initWorker(weightPaths, variations):
+    fragVsPtFile, fragFile, brFile = weightPaths
+    fragWeightsVsPt, fragWeights, brWeights = variations
+    _worker["evaluator"] = WeightEvaluator(fragVsPtFile, fragFile, brFile, fragWeightsVsPt, fragWeights, brWeights)
+    _worker["input"] = (None, None, None)
+
+def processChunk(args):
+    """Read a chunk of events and return their weights"""
+    path, treeName, collection, first, n = args
+    # keep the last input open, consecutive chunks mostly come from the same file
+    if _worker["input"][0] != path:
+        if _worker["input"][1]:
+            _worker["input"][1].Close()
+        fIn, tree = openTree(path, treeName)
+        _worker["input"] = (path, fIn, tree)
+    counts, columns = readEvents(_worker["input"][2], collection, first, n)
+    return chunkWeights(_worker["evaluator"], counts, *[ columns[name] for name in COLUMNS ])
+
+def eventWeights(inputs, weightPaths, outPath, treeName="Events", collection="GenJet", variations=(FRAG_WEIGHTS_VS_PT, FRAG_WEIGHTS, BR_WEIGHTS), jobs=1, chunkSize=1000000):
+    """Write the matrix of event weights (events, variations) for the trees of the inputs (files or folders) to outPath"""
+    if not any(variations):
+        raise ValueError("No weight variations selected: the pt-dependent, pt-averaged and BR weights are all empty")
+    paths = findInputs(inputs)
+    if not paths:
+        raise RuntimeError("No input files found in {}".format(", ".join(inputs)))
+
+    entries = []
+    for path in paths:
+        fIn, tree = openTree(path, treeName)
+        entries.append(int(tree.GetEntries()))
+        fIn.Close()
+    tasks = [ (path, treeName, collection, first, min(chunkSize, n - first)) for path, n in zip(paths, entries) for first in range(0, n, chunkSize) ]
+
+    initWorker(weightPaths, variations)
+    names = _worker["evaluator"].names()
+    out = np.lib.format.open_memmap(outPath, mode="w+", dtype=np.float32, shape=(sum(entries), len(names)))
+    if jobs > 1:
+        pool = multiprocessing.Pool(min(jobs, len(tasks)), initializer=initWorker, initargs=(weightPaths, variations))
+        results = pool.imap(processChunk, tasks)
+    else:
+        pool = None
+        results = (processChunk(task) for task in tasks)
+    try:
+        row = 0
+        for weights in results:
+            out[row:row + len(weights)] = weights
+            row += len(weights)
+            out.flush()
+    finally:
+        if pool:
+            pool.close()
+            pool.join()
+    del out
+
+    info = {
+        "variations": names,
+        "events": sum(entries),
+        "tree": treeName,
+        "collection": collection,
+        "weights": [ os.path.abspath(p) for p in weightPaths ],
+        "inputs": [ { "path": os.path.abspath(p), "entries": n } for p, n in zip(paths, entries) ],
+    }
+    with open(os.path.splitext(outPath)[0] + ".json", "w") as f:
+        json.dump(info, f, indent=1)
+    print("Wrote the weights of {} variations for {} events from {} files to {}".format(len(names), sum(entries), len(paths), outPath))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compute the per-event products of the fragmentation and BR weights for all variations, from per-jet columns')
+    parser.add_argument('input', nargs='+', help='Input files or folders')
+    parser.add_argument('-w', '--weights', default=os.path.join(os.getenv("CMSSW_BASE", ""), "src/TopQuarkAnalysis/BFragmentationAnalyzer/data/"), help='Folder containing the weight files ({})'.format(", ".join(WEIGHT_FILES)))
+    parser.add_argument('-o', '--output', default='event_weights.npy', help='Output .npy file, the variation names are written to the .json file of the same name')
+    parser.add_argument('-t', '--tree', default='Events', help='Name of the input trees')
+    parser.add_argument('-c', '--collection', default='GenJet', help='Jet collection: the jet count is n{{collection}}, the columns {{collection}}_{{column}} for the columns {}'.format(", ".join(COLUMNS)))
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of worker processes (one chunk of events per task)')
+    parser.add_argument('--chunk', type=int, default=1000000, help='Number of events read and evaluated at once')
+    parser.add_argument('--fragWeightsVsPt', nargs='*', default=FRAG_WEIGHTS_VS_PT, help='pt-dependent fragmentation weights (default: same as the producer)')
+    parser.add_argument('--fragWeights', nargs='*', default=FRAG_WEIGHTS, help='pt-averaged fragmentation weights (default: same as the producer)')
+    parser.add_argument('--brWeights', nargs='*', default=BR_WEIGHTS, help='BR weights (default: same as the producer)')
+    args = parser.parse_args()
+
+    eventWeights(args.input, weightFiles(args.weights), args.output, args.tree, args.collection, (args.fragWeightsVsPt, args.fragWeights, args.brWeights), args.jobs, args.chunk)
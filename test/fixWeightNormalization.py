@@ -2,67 +2,82 @@
 
 import argparse
 import os
+import shutil
 import numpy as np
 
 import ROOT
 
-from buildWeightFile import TUNES, REF
-
-def fix1Dnorm(inPath, outPath, normPath):
+from bfragConfig import TUNES, REF
+from buildWeightFile import writeWeightTable
+from histCache import histToDict
+from weightEvaluator import bufferView
+from weightArchive import exportRootFile
+
+def openOutput(outPath, inFile, tunes, names):
+    """Open the output file: if only some tunes are fixed, update it (the other tunes are copied from the input if it doesn't exist yet)"""
+    if set(tunes) == set(TUNES) or not os.path.isfile(outPath):
+        outFile = ROOT.TFile.Open(outPath, "recreate")
+        for tune in TUNES:
+            if tune not in tunes:
+                print("Copying {} from {} without fixing its normalization".format(tune, inFile.GetName()))
+                for name in names(tune):
+                    outFile.WriteTObject(inFile.Get(name), name)
+        return outFile
+    return ROOT.TFile.Open(outPath, "update")
+
+def fix1Dnorm(inPath, outPath, normPath, tunes=TUNES):
     inFile = ROOT.TFile.Open(inPath)
-    outFile = ROOT.TFile.Open(outPath, "recreate")
     normFile = ROOT.TFile.Open(normPath)
-
-    x,y = ROOT.Double(0), ROOT.Double(0)
+    outFile = openOutput(outPath, inFile, tunes, lambda tune: [ "frag{}".format(tune), "frag{}_smooth".format(tune) ])
 
     norm_ref = normFile.Get("bfragAnalysis/norm").GetBinContent(1)
+    norm_tunes = np.array([ normFile.Get("bfragAnalysis/debug_norm_frag{}".format(tune)).GetBinContent(1) for tune in tunes ])
+    ratios = norm_ref / norm_tunes
 
-    for tune in TUNES:
-        norm_tune = normFile.Get("bfragAnalysis/debug_norm_frag{}".format(tune)).GetBinContent(1)
-        ratio = norm_ref / norm_tune
+    for tune, ratio in zip(tunes, ratios):
         print("Rescaling {} by {}".format(tune, ratio))
 
         rawGr = inFile.Get("frag{}".format(tune))
-        outFile.cd()
-        rawGr.Write("frag{}".format(tune))
-
         smoothGr = inFile.Get("frag{}_smooth".format(tune))
-        for i in range(smoothGr.GetN()):
-            smoothGr.GetPoint(i, x, y)
-            smoothGr.SetPoint(i, x, y * ratio)
-        smoothGr.Write("frag{}_smooth".format(tune))
+        # scale the points in place
+        bufferView(smoothGr.GetY(), smoothGr.GetN())[:] *= ratio
+        outFile.WriteTObject(rawGr, "frag{}".format(tune), "overwrite")
+        outFile.WriteTObject(smoothGr, "frag{}_smooth".format(tune), "overwrite")
 
     inFile.Close()
     outFile.Close()
     normFile.Close()
 
-def fix2Dnorm(inPath, outPath, normPath):
+def ptYields(hist):
+    """Contents of the pT (y) projection of a xb/pT histogram, including the xb under/overflows, as ProjectionY(name, 0, -1)"""
+    arrays = histToDict(hist)
+    return arrays["contents"].reshape(len(arrays["yedges"]) + 1, len(arrays["xedges"]) + 1).sum(axis=1)
+
+def fix2Dnorm(inPath, outPath, normPath, tunes=TUNES):
     inFile = ROOT.TFile.Open(inPath)
-    outFile = ROOT.TFile.Open(outPath, "recreate")
     normFile = ROOT.TFile.Open(normPath)
+    outFile = openOutput(outPath, inFile, tunes, lambda tune: [ "frag" + tune, "frag" + tune + "_smooth" ])
 
-    xb_pt_ref = normFile.Get("bfragAnalysis/xb_pt_lead_B")
-    pt_ref = xb_pt_ref.ProjectionY("pt_ref", 0, -1, "e")
+    pt_ref = ptYields(normFile.Get("bfragAnalysis/xb_pt_lead_B"))
+    pt_tunes = np.array([ ptYields(normFile.Get("bfragAnalysis/debug_xb_pt_lead_B_frag{}VsPt".format(tune))) for tune in tunes ])
+    # one factor per tune and pT bin (the under/overflows are not rescaled)
+    ratios = pt_ref[1:-1] / pt_tunes[:,1:-1]
 
-    for tune in TUNES:
+    for tune, ratio in zip(tunes, ratios):
         print("")
-
-        xb_pt_tune = normFile.Get("bfragAnalysis/debug_xb_pt_lead_B_frag{}VsPt".format(tune))
-        pt_tune = xb_pt_tune.ProjectionY("pt_{}".format(tune), 0, -1, "e")
+        for ipt, r in enumerate(ratio):
+            print("Rescaling {} in pT bin {} by {}".format(tune, ipt + 1, r))
 
         weights_tune = inFile.Get("frag" + tune)
         weights_tune_smooth = inFile.Get("frag" + tune + "_smooth")
+        # scale the in-range xb bins of each pT row in place, the contents being stored as [y,x] with under/overflows
+        dtype = np.float32 if weights_tune_smooth.InheritsFrom("TArrayF") else np.float64
+        contents = bufferView(weights_tune_smooth.GetArray(), weights_tune_smooth.GetNcells(), dtype)
+        contents = contents.reshape(weights_tune_smooth.GetNbinsY() + 2, weights_tune_smooth.GetNbinsX() + 2)
+        contents[1:-1,1:-1] = contents[1:-1,1:-1] * ratio[:,None]
 
-        for ipt in range(1, pt_tune.GetNbinsX() + 1):
-            ratio = pt_ref.GetBinContent(ipt) / pt_tune.GetBinContent(ipt)
-            print("Rescaling {} in pT bin {} by {}".format(tune, ipt, ratio))
-            for jx in range(1, xb_pt_tune.GetNbinsX() + 1):
-                orig = weights_tune_smooth.GetBinContent(jx, ipt)
-                weights_tune_smooth.SetBinContent(jx, ipt, orig * ratio)
-
-        outFile.cd()
-        weights_tune.Write()
-        weights_tune_smooth.Write()
+        outFile.WriteTObject(weights_tune, weights_tune.GetName(), "overwrite")
+        outFile.WriteTObject(weights_tune_smooth, weights_tune_smooth.GetName(), "overwrite")
 
     inFile.Close()
     outFile.Close()
@@ -75,13 +90,24 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser()
     parser.add_argument('-i', '--input', help='Input folder containing {} and {} with weights to be re-normalized'.format(fn1, fn2))
     parser.add_argument('-d', '--debug', help='xb_{}.root from a debug run'.format(REF))
+    parser.add_argument('--tunes', nargs='+', default=TUNES, help='Tunes to fix, the others are left as they are in the output folder')
+    parser.add_argument('--averagedOnly', action='store_true', help='Only fix the pt-averaged weights, and copy {} as it is (e.g. normalised with buildWeightFile.py --analyticNorm)'.format(fn2))
     parser.add_argument('-o', '--output', default=os.path.join(os.getenv("CMSSW_BASE"), "src/TopQuarkAnalysis/BFragmentationAnalyzer/data/"), help='Output folder for new weight files')
     args = parser.parse_args()
+    # the input files are read while the output files are recreated or updated
+    if os.path.abspath(args.input) == os.path.abspath(args.output):
+        parser.error("the input and output folders must be different")
 
     if not os.path.isdir(args.output):
         os.mkdir(args.output)
 
-    fix1Dnorm(os.path.join(args.input, fn1), os.path.join(args.output, fn1), args.debug)
-    fix2Dnorm(os.path.join(args.input, fn2), os.path.join(args.output, fn2), args.debug)
+    fix1Dnorm(os.path.join(args.input, fn1), os.path.join(args.output, fn1), args.debug, args.tunes)
+    if not args.averagedOnly:
+        fix2Dnorm(os.path.join(args.input, fn2), os.path.join(args.output, fn2), args.debug, args.tunes)
+    else:
+        shutil.copyfile(os.path.join(args.input, fn2), os.path.join(args.output, fn2))
+    writeWeightTable(os.path.join(args.output, fn1), os.path.join(args.output, fn2), os.path.join(args.output, "bfragweights_table.root"))
+    for fn in fn1, fn2:
+        exportRootFile(os.path.join(args.output, fn), provenance={ "input": os.path.abspath(os.path.join(args.input, fn)), "normalization": os.path.abspath(args.debug) })
 
     print('New fragmentation weights saved to {}'.format(args.output))
@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+
+"""
+On-disk cache for the histograms read from the merged condor outputs, and for products derived from them.
+
+Histograms are stored as compact NumPy arrays (bin edges, contents and errors), keyed by the hash of the input file
+they were read from. The hash of each input file is only recomputed when its size or modification time changes.
+Derived products (densities, graphs) are stored under keys built from the hashes of all the inputs they depend on,
+such that only the products depending on a regenerated input are recomputed.
+"""
+
+import os
+import re
+import json
+import hashlib
+import numpy as np
+
+from weightEvaluator import bufferToArray
+
+def fileHash(path, blockSize=1 << 20):
+    """SHA1 of the contents of a file"""
+    sha = hashlib.sha1()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(blockSize), b""):
+            sha.update(block)
+    return sha.hexdigest()
+
+def makeKey(*parts):
+    """Combine (input hashes, names, settings) into a single key"""
+    return hashlib.sha1("|".join(str(p) for p in parts).encode("utf-8")).hexdigest()
+
+def histToDict(hist):
+    """Return dictionary with the class, edges, bin labels, contents and errors (including under/overflows) of a TH1 or TH2"""
+    nCells = hist.GetNcells()
+    dtype = np.float32 if hist.InheritsFrom("TArrayF") else np.float64
+    contents = bufferToArray(hist.GetArray(), nCells, dtype).astype(np.float64)
+    if hist.GetSumw2N():
+        errors = np.sqrt(bufferToArray(hist.GetSumw2().GetArray(), nCells))
+    else:
+        errors = np.sqrt(np.abs(contents))
+    axes = [ hist.GetXaxis(), hist.GetYaxis() ][:hist.GetDimension()]
+    arrays = {
+        "contents": contents,
+        "errors": errors,
+        "entries": np.array(hist.GetEntries()),
+        "name": np.array(hist.GetName()),
+        "class": np.array(hist.ClassName()),
+        "titles": np.array([ hist.GetTitle() ] + [ ax.GetTitle() for ax in axes ]),
+    }
+    for ax, label in zip(axes, "xy"):
+        arrays[label + "edges"] = np.array([ ax.GetBinLowEdge(i) for i in range(1, ax.GetNbins() + 2) ])
+        if ax.GetLabels():
+            arrays[label + "labels"] = np.array([ ax.GetBinLabel(i) for i in range(1, ax.GetNbins() + 1) ])
+    return arrays
+
+def dictToHist(arrays, name=None):
+    """
+    Create a histogram of the same class (TH1D or TH2D for other classes, or arrays stored without the class) from the
+    output of histToDict (not attached to any directory)
+    """
+    import ROOT
+    name = name if name else str(arrays["name"])
+    titles = [ str(t) for t in arrays["titles"] ]
+    xedges = np.asarray(arrays["xedges"], dtype=np.float64)
+    dim = 2 if "yedges" in arrays else 1
+    cls = str(arrays["class"]) if "class" in arrays else ""
+    if not re.match(r"^TH{}[CSIFD]$".format(dim), cls):
+        cls = "TH{}D".format(dim)
+    if dim == 2:
+        yedges = np.asarray(arrays["yedges"], dtype=np.float64)
+        hist = getattr(ROOT, cls)(name, titles[0], len(xedges) - 1, xedges, len(yedges) - 1, yedges)
+    else:
+        hist = getattr(ROOT, cls)(name, titles[0], len(xedges) - 1, xedges)
+    hist.SetDirectory(0)
+    for ax, title, label in zip([ hist.GetXaxis(), hist.GetYaxis() ], titles[1:], "xy"):
+        ax.SetTitle(title)
+        for i, binLabel in enumerate(arrays.get(label + "labels", [])):
+            ax.SetBinLabel(i + 1, str(binLabel))
+    hist.Sumw2()
+    hist.SetContent(np.ascontiguousarray(arrays["contents"], dtype=np.float64))
+    hist.SetError(np.ascontiguousarray(arrays["errors"], dtype=np.float64))
+    hist.SetEntries(float(arrays["entries"]))
+    return hist
+
+def graphToDict(gr):
+    """Return dictionary with the points (and errors, for TGraphErrors) and the style of a TGraph"""
+    n = gr.GetN()
+    arrays = {
+        "x": bufferToArray(gr.GetX(), n),
+        "y": bufferToArray(gr.GetY(), n),
+        "name": np.array(gr.GetName()),
+        "style": np.array([ gr.GetLineColor(), gr.GetMarkerStyle() ]),
+    }
+    if gr.InheritsFrom("TGraphErrors"):
+        arrays["ex"] = bufferToArray(gr.GetEX(), n)
+        arrays["ey"] = bufferToArray(gr.GetEY(), n)
+    return arrays
+
+def dictToGraph(arrays):
+    """Create a TGraph or TGraphErrors from the output of graphToDict"""
+    import ROOT
+    x, y = np.asarray(arrays["x"], dtype=np.float64), np.asarray(arrays["y"], dtype=np.float64)
+    if "ex" in arrays:
+        gr = ROOT.TGraphErrors(len(x), x, y, np.asarray(arrays["ex"], dtype=np.float64), np.asarray(arrays["ey"], dtype=np.float64))
+    else:
+        gr = ROOT.TGraph(len(x), x, y)
+    gr.SetName(str(arrays["name"]))
+    lineColor, markerStyle = arrays["style"]
+    gr.SetLineColor(int(lineColor))
+    gr.SetMarkerStyle(int(markerStyle))
+    return gr
+
+class HistCache(object):
+    """Cache of histograms and derived products, stored as .npz files in a directory"""
+
+    INDEX = "index.json"
+    # version of the histogram arrays, part of the keys of the cached histograms
+    FORMAT = 2
+
+    def __init__(self, cacheDir):
+        self.cacheDir = cacheDir
+        if not os.path.isdir(cacheDir):
+            os.makedirs(cacheDir)
+        self.indexPath = os.path.join(cacheDir, self.INDEX)
+        self.index = {}
+        if os.path.isfile(self.indexPath):
+            with open(self.indexPath) as f:
+                self.index = json.load(f)
+
+    def inputKey(self, path):
+        """Hash of an input file, only recomputed if its size or modification time changed"""
+        path = os.path.abspath(path)
+        stat = os.stat(path)
+        entry = self.index.get(path)
+        if entry is None or entry["mtime"] != stat.st_mtime or entry["size"] != stat.st_size:
+            entry = { "mtime": stat.st_mtime, "size": stat.st_size, "hash": fileHash(path) }
+            self.index[path] = entry
+            with open(self.indexPath, "w") as f:
+                json.dump(self.index, f, indent=1, sort_keys=True)
+        return entry["hash"]
+
+    def _path(self, key):
+        return os.path.join(self.cacheDir, key + ".npz")
+
+    def has(self, key):
+        return os.path.isfile(self._path(key))
+
+    def load(self, key):
+        """Return the list of array dictionaries stored under key, or None"""
+        if not self.has(key):
+            return None
+        with np.load(self._path(key)) as data:
+            nItems = int(data["nItems"])
+            items = [ {} for _ in range(nItems) ]
+            for name in data.files:
+                if name == "nItems":
+                    continue
+                i, field = name.split("/", 1)
+                items[int(i)][field] = data[name]
+        return items
+
+    def store(self, key, items):
+        """Store a list of array dictionaries under key"""
+        arrays = { "nItems": np.array(len(items)) }
+        for i, item in enumerate(items):
+            for field, value in item.items():
+                arrays["{}/{}".format(i, field)] = value
+        # write to a temporary file first so that interrupted runs don't leave corrupted entries
+        tmpPath = self._path(key + ".tmp")
+        with open(tmpPath, "wb") as f:
+            np.savez(f, **arrays)
+        os.rename(tmpPath, self._path(key))
+
+    def loadHist(self, path, name, newName):
+        """Return histogram `name` from ROOT file `path`, renamed to newName, reading it from the cache if possible"""
+        key = makeKey(self.FORMAT, self.inputKey(path), name)
+        items = self.load(key)
+        if items is None:
+            import ROOT
+            fIn = ROOT.TFile.Open(path)
+            hist = fIn.Get(name)
+            if not hist:
+                raise KeyError("Could not load {} from {}".format(name, path))
+            items = [ histToDict(hist) ]
+            fIn.Close()
+            self.store(key, items)
+        return dictToHist(items[0], newName)
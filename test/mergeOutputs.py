@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+
+"""
+Merge the outputs of the condor jobs: sum the histograms of all xb_{TAG}_{JOBID}*.root files into xb_{TAG}.root,
+and of all tags into xb_summedForBR.root.
+
+The files are read and summed as NumPy arrays by worker processes, each handling a chunk of files of a tag;
+the partial sums are then reduced pairwise, per tag and over all tags in the same pass.
+Files that cannot be read (zombie, truncated, missing histograms) are reported and left out of the merge.
+Only the histograms are merged: with --rm, the job outputs holding trees (the per-jet ntuples of the analyzer) are kept
+for replayWeights.py.
+"""
+
+import argparse
+import os
+import re
+import multiprocessing
+import numpy as np
+
+from histCache import histToDict, dictToHist
+
+JOB_OUTPUT = re.compile(r"^xb_(?P<tag>.+)_(?P<job>[0-9]+)(_numEvent[0-9]+)?\.root$")
+BR_OUTPUT = "xb_summedForBR.root"
+# directory of the analyzer histograms in the output files
+DIRECTORY = "bfragAnalysis"
+
+def findJobOutputs(inDir):
+    """Return dictionary: tag->sorted list of job output files in inDir"""
+    outputs = {}
+    for fName in sorted(os.listdir(inDir)):
+        match = JOB_OUTPUT.match(fName)
+        if match:
+            outputs.setdefault(match.group("tag"), []).append(os.path.join(inDir, fName))
+    return outputs
+
+def readHists(path):
+    """Return dictionary: histogram name->arrays (with sum of squared weights) for all histograms of a job output, raise IOError if the file is unusable"""
+    import ROOT
+    fIn = ROOT.TFile.Open(path)
+    if not fIn or fIn.IsZombie():
+        raise IOError("cannot be opened (zombie)")
+    try:
+        if fIn.TestBit(ROOT.TFile.kRecovered):
+            raise IOError("was not closed properly (truncated)")
+        directory = fIn.Get(DIRECTORY)
+        if not directory:
+            raise IOError("has no {} directory".format(DIRECTORY))
+        hists = {}
+        for key in directory.GetListOfKeys():
+            obj = key.ReadObj()
+            if obj.InheritsFrom("TH1"):
+                arrays = histToDict(obj)
+                arrays["sumw2"] = arrays.pop("errors")**2
+                hists[key.GetName()] = arrays
+        if not hists:
+            raise IOError("contains no histograms")
+        return hists
+    finally:
+        fIn.Close()
+
+def hasTrees(path):
+    """True if the analyzer directory of a job output holds a tree (e.g. the per-jet ntuple)"""
+    import ROOT
+    fIn = ROOT.TFile.Open(path)
+    if not fIn or fIn.IsZombie():
+        return False
+    try:
+        directory = fIn.Get(DIRECTORY)
+        return bool(directory) and any(key.GetClassName() == "TTree" for key in directory.GetListOfKeys())
+    finally:
+        fIn.Close()
+
+def addHists(total, other):
+    """Add the histograms of `other` into `total` (both as returned by readHists), raise ValueError if they don't match"""
+    if total is None:
+        return other
+    if other is None:
+        return total
+    if set(total) != set(other):
+        raise ValueError("different sets of histograms")
+    for name, arrays in total.items():
+        if arrays["contents"].shape != other[name]["contents"].shape or any(not np.array_equal(arrays[e], other[name][e]) for e in ("xedges", "yedges") if e in arrays):
+            raise ValueError("different binning for {}".format(name))
+        if str(arrays["class"]) != str(other[name]["class"]):
+            raise ValueError("different classes for {}".format(name))
+        arrays["contents"] = arrays["contents"] + other[name]["contents"]
+        arrays["sumw2"] = arrays["sumw2"] + other[name]["sumw2"]
+        arrays["entries"] = arrays["entries"] + other[name]["entries"]
+    return total
+
+def treeReduce(items):
+    """Sum a list of histogram dictionaries pairwise"""
+    items = [ it for it in items if it is not None ]
+    if not items:
+        return None
+    while len(items) > 1:
+        items = [ addHists(items[i], items[i+1]) if i + 1 < len(items) else items[i] for i in range(0, len(items), 2) ]
+    return items[0]
+
+def sumChunk(args):
+    """Sum the histograms of a chunk of job outputs of one tag, return (tag, sum, number of merged files, list of (file, problem))"""
+    tag, paths = args
+    total, nMerged, bad = None, 0, []
+    for path in paths:
+        try:
+            total = addHists(total, readHists(path))
+            nMerged += 1
+        except (IOError, ValueError) as e:
+            bad.append((path, str(e)))
+    return tag, total, nMerged, bad
+
+def writeHists(path, hists):
+    """Write the histograms (as returned by readHists) to a new file, in the analyzer directory"""
+    import ROOT
+    fOut = ROOT.TFile.Open(path, "recreate")
+    directory = fOut.mkdir(DIRECTORY)
+    directory.cd()
+    for name in sorted(hists):
+        arrays = dict(hists[name])
+        arrays["errors"] = np.sqrt(arrays.pop("sumw2"))
+        hist = dictToHist(arrays, name)
+        hist.Write()
+    fOut.Close()
+
+def mergeOutputs(inDir, outDir=None, jobs=1, chunkSize=10, remove=False):
+    """Merge all job outputs in inDir per tag and for all tags, return dictionary: tag->list of (file, problem) for the files left out"""
+    outDir = outDir if outDir else inDir
+    outputs = findJobOutputs(inDir)
+    if not outputs:
+        raise RuntimeError("No job outputs found in {}".format(inDir))
+
+    chunks = [ (tag, paths[i:i+chunkSize]) for tag, paths in sorted(outputs.items()) for i in range(0, len(paths), chunkSize) ]
+    if jobs > 1:
+        pool = multiprocessing.Pool(min(jobs, len(chunks)))
+        try:
+            results = list(pool.imap_unordered(sumChunk, chunks))
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [ sumChunk(chunk) for chunk in chunks ]
+
+    partials, merged, bad = {}, {}, {}
+    for tag, total, nMerged, badFiles in results:
+        partials.setdefault(tag, []).append(total)
+        merged[tag] = merged.get(tag, 0) + nMerged
+        bad.setdefault(tag, []).extend(badFiles)
+
+    tagSums = []
+    for tag in sorted(outputs):
+        total = treeReduce(partials[tag])
+        print("{}: merged {} of {} files".format(tag, merged[tag], len(outputs[tag])))
+        for path, problem in sorted(bad[tag]):
+            print("    skipped {}: {}".format(path, problem))
+        if total is None:
+            continue
+        writeHists(os.path.join(outDir, "xb_{}.root".format(tag)), total)
+        tagSums.append(dict((name, dict(arrays)) for name, arrays in total.items()))
+        if remove:
+            kept = 0
+            for path in outputs[tag]:
+                if path in dict(bad[tag]):
+                    continue
+                # the trees are not merged: keep them for replayWeights.py
+                if hasTrees(path):
+                    kept += 1
+                else:
+                    os.remove(path)
+            if kept:
+                print("    kept {} job outputs with per-jet ntuples".format(kept))
+
+    summed = treeReduce(tagSums)
+    if summed is not None:
+        writeHists(os.path.join(outDir, BR_OUTPUT), summed)
+    return bad
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Merge the xb_{TAG}_{JOBID}.root outputs of the condor jobs')
+    parser.add_argument('input', help='Folder containing the condor job outputs')
+    parser.add_argument('-o', '--output', help='Output folder (default: same as input)')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of worker processes reading the job outputs')
+    parser.add_argument('--chunk', type=int, default=10, help='Number of job outputs summed by each worker task')
+    parser.add_argument('--rm', action='store_true', help='Remove the job outputs that were merged successfully (except those holding trees)')
+    args = parser.parse_args()
+
+    bad = mergeOutputs(args.input, args.output, args.jobs, args.chunk, args.rm)
+    nBad = sum(len(b) for b in bad.values())
+    if nBad:
+        print("{} job outputs could not be merged, see above".format(nBad))
@@ -1,19 +1,10 @@
 #!/usr/bin/env bash
 
 if (( $# < 1 )); then
-    echo "Run as $0 condor_dir"
+    echo "Run as $0 condor_dir [number of parallel jobs]"
     exit 1
 fi
 
-pushd $1
-
-tags=$(ls -1 xb_*_*_*.root | sed -n 's/xb_\(.*\)_.*_.*\.root/\1/p' | sort | uniq)
-
-for tag in ${tags}; do
-    echo $tag
-    hadd -f xb_${tag}.root xb_${tag}_*_*.root && rm xb_${tag}_*_*.root
-done
-
-hadd xb_summedForBR.root *.root
-
-popd
+# sums xb_${tag}_*_*.root into xb_${tag}.root for each tag, and all tags into xb_summedForBR.root
+# job outputs that cannot be read or that hold per-jet ntuples are kept, the others are removed
+python $(dirname $0)/mergeOutputs.py $1 --rm --jobs ${2:-$(nproc)}
@@ -0,0 +1,250 @@
+#!/usr/bin/env python
+
+"""
+Monitor a running campaign, and signal when the weights of a tune are known precisely enough.
+
+The job outputs xb_{TAG}_{JOBID}.root which have appeared in a local folder (e.g. the condor output folder, or the one
+of runCampaign.py) are merged as they come (files still being written are retried at the next iteration). For every
+tune, the smoothed weight curves (pt-averaged, and in every pT slice) are derived as in buildWeightFile.py, together
+with their statistical uncertainty, estimated from the spread of the curves derived from replicas of the tune and
+reference histograms fluctuated within their uncertainties. Only the xb range holding the central `coverage` fraction
+of the reference jets is considered.
+
+When the largest relative uncertainty of a tune is below the tolerance, a stop signal {TAG}.stop is written in the
+stop folder (the reference is stopped once all the monitored tunes are), and the condor_rm commands cancelling the
+idle jobs of the converged tunes are written to cancel_converged.sh (executed with --cancel). The uncertainties of all
+iterations are kept in history.json:
+
+    ./monitorCampaign.py condor_output --tolerance 0.01 --interval 600 -j 8
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import time
+import numpy as np
+
+from bfragConfig import TUNES, REF, THRES
+from buildWeightFile import toDensity, th1SmoothRange, ptRangeName, splitPtSlices, deriveWeights, derive2DWeights, mapJobs
+from weightEvaluator import graphToArrays, evalGraph
+from histCache import dictToHist
+from mergeOutputs import findJobOutputs, sumChunk, addHists, writeHists
+
+# points where the smoothed weights are compared
+GRID = np.linspace(0., THRES, 101)
+CANCEL_SCRIPT = "cancel_converged.sh"
+HISTORY = "history.json"
+
+def toHist(arrays, name):
+    """Histogram from histogram arrays with sum of squared weights (see mergeOutputs.readHists)"""
+    arrays = dict(arrays)
+    arrays["errors"] = np.sqrt(arrays.pop("sumw2"))
+    return dictToHist(arrays, name)
+
+def fluctuate(arrays, rng):
+    """Copy of histogram arrays with the contents fluctuated (gaussian) within their statistical uncertainties"""
+    arrays = dict(arrays)
+    arrays["contents"] = np.maximum(arrays["contents"] + rng.standard_normal(arrays["contents"].shape) * np.sqrt(arrays["sumw2"]), 0.)
+    return arrays
+
+def centralMask(counts, edges, coverage):
+    """Mask of the GRID points within the xb range holding the central `coverage` fraction of the jets below THRES"""
+    nXb = np.count_nonzero(edges[1:] <= THRES)
+    c = counts[:nXb]
+    if c.sum() <= 0:
+        return np.zeros(len(GRID), dtype=bool)
+    upper = np.cumsum(c) / c.sum()
+    tail = 0.5 * (1. - coverage)
+    low = edges[np.searchsorted(upper, tail, side="right")]
+    high = edges[min(np.searchsorted(upper, 1. - tail, side="left") + 1, nXb)]
+    return (GRID >= low) & (GRID <= high)
+
+def avgCurves(tag, hist, ref, suffix):
+    """Smoothed pt-averaged weights of a tune on GRID (list with one array), from count histogram arrays"""
+    hist = toHist(hist, "xb_{}_{}".format(tag, suffix))
+    ref = toHist(ref, "xb_{}_{}_{}".format(REF, tag, suffix))
+    toDensity(ref)
+    refSmooth = ref.Clone(ref.GetName() + "_smooth")
+    th1SmoothRange(refSmooth, 2, 0., THRES)
+    _, sgr = deriveWeights((tag, hist, ref, refSmooth))
+    return [ evalGraph(*(graphToArrays(sgr) + (GRID,))) ]
+
+def vsPtCurves(tag, hist, ref, suffix):
+    """Smoothed weights of a tune in all pT slices on GRID (list of arrays), from count histogram arrays"""
+    ptBins = np.array(hist["yedges"])
+    hists, _ = splitPtSlices(toHist(hist, "xb_{}_{}".format(tag, suffix)), ptBins, "pt_{}_{}".format(tag, suffix))
+    refs, _ = splitPtSlices(toHist(ref, "xb_{}_{}_{}".format(REF, tag, suffix)), ptBins, "pt_{}_{}_{}".format(REF, tag, suffix))
+    curves = []
+    for i in range(len(ptBins) - 1):
+        ptRange = ptRangeName(ptBins, i)
+        refSmooth = refs[ptRange].Clone(refs[ptRange].GetName() + "_smooth")
+        th1SmoothRange(refSmooth, 2, 0., THRES)
+        _, _, sgr = derive2DWeights((tag, ptRange, hists[ptRange], refs[ptRange], refSmooth))
+        curves.append(evalGraph(*(graphToArrays(sgr) + (GRID,))))
+    return curves
+
+def centralMasks(ref, coverage):
+    """Masks of the GRID points considered for the pt-averaged weights and in every pT slice"""
+    xb, xbPt = ref["xb_lead_B"], ref["xb_pt_lead_B"]
+    masks = [ centralMask(xb["contents"][1:-1], xb["xedges"], coverage) ]
+    xEdges, ptEdges = xbPt["xedges"], xbPt["yedges"]
+    contents = xbPt["contents"].reshape(len(ptEdges) + 1, len(xEdges) + 1)
+    for i in range(1, len(ptEdges)):
+        # last slice includes the overflow, as in splitPtSlices
+        last = i + 1 if i < len(ptEdges) - 1 else len(ptEdges) + 1
+        masks.append(centralMask(contents[i:last, 1:-1].sum(axis=0), xEdges, coverage))
+    return masks
+
+def curveUncertainty(args):
+    """Return (tag, largest relative uncertainty of the smoothed weights for the pt-averaged weights and in every pT slice) (can run in a worker process)"""
+    tag, hists, ref, replicas, coverage, seed = args
+    rng = np.random.RandomState(seed)
+    masks = centralMasks(ref, coverage)
+
+    def curves(h, r, suffix):
+        return np.array(avgCurves(tag, h["xb_lead_B"], r["xb_lead_B"], suffix) + vsPtCurves(tag, h["xb_pt_lead_B"], r["xb_pt_lead_B"], suffix))
+
+    nominal = curves(hists, ref, "nominal")
+    spread = np.array([ curves(dict((k, fluctuate(v, rng)) for k, v in hists.items()), dict((k, fluctuate(v, rng)) for k, v in ref.items()), "rep{}".format(i))
+                        for i in range(replicas) ]).std(axis=0)
+    relative = np.where(np.abs(nominal) > 0, spread / np.where(np.abs(nominal) > 0, np.abs(nominal), 1.), np.inf)
+    return tag, [ float(np.max(rel[mask])) if np.any(mask) else float("inf") for rel, mask in zip(relative, masks) ]
+
+class CampaignMonitor(object):
+    """Running sums of the job outputs of a campaign, and the convergence status of its tunes"""
+    def __init__(self, inDir, stopDir, tunes=TUNES, tolerance=0.01, replicas=20, coverage=0.95, minJobs=2, outDir=None, jobs=1):
+        self.inDir, self.stopDir, self.outDir = inDir, stopDir, outDir
+        self.tunes = [ t for t in tunes if t != REF ]
+        self.tolerance, self.replicas, self.coverage, self.minJobs, self.jobs = tolerance, replicas, coverage, minJobs, jobs
+        self.sums = {}
+        self.merged = {}
+        self.uncertainties = {}
+        self.converged = set(t[:-len(".stop")] for t in os.listdir(stopDir) if t.endswith(".stop")) if os.path.isdir(stopDir) else set()
+        self.history = []
+
+    def update(self):
+        """Add the job outputs that appeared since the last call, return the set of tags with new outputs"""
+        updated = set()
+        for tag, paths in findJobOutputs(self.inDir).items():
+            if tag not in self.tunes and tag != REF:
+                continue
+            merged = self.merged.setdefault(tag, set())
+            new = [ p for p in paths if p not in merged ]
+            if not new:
+                continue
+            _, total, nMerged, bad = sumChunk((tag, new))
+            # files still being written are retried at the next update
+            merged.update(set(new) - set(p for p, _ in bad))
+            if nMerged:
+                self.sums[tag] = addHists(self.sums.get(tag), total)
+                updated.add(tag)
+        if self.outDir:
+            for tag in updated:
+                writeHists(os.path.join(self.outDir, "xb_{}.root".format(tag)), self.sums[tag])
+        return updated
+
+    def weightHists(self, tag):
+        """Summed histograms the weights are derived from"""
+        return dict((name, self.sums[tag][name]) for name in ("xb_lead_B", "xb_pt_lead_B"))
+
+    def evaluate(self, updated):
+        """Recompute the uncertainties of the tunes affected by the new outputs, return the list of newly converged tags"""
+        if REF not in self.sums:
+            return []
+        todo = [ tag for tag in self.tunes if tag in self.sums and tag not in self.converged and (tag in updated or REF in updated) ]
+        tasks = [ (tag, self.weightHists(tag), self.weightHists(REF), self.replicas, self.coverage, 1000 + i) for i, tag in enumerate(todo) ]
+        self.uncertainties.update(dict(mapJobs(curveUncertainty, tasks, self.jobs)))
+
+        newlyConverged = []
+        for tag in todo:
+            if len(self.merged[tag]) >= self.minJobs and max(self.uncertainties[tag]) <= self.tolerance:
+                newlyConverged.append(tag)
+        if REF not in self.converged and all(t in self.converged or t in newlyConverged for t in self.tunes):
+            newlyConverged.append(REF)
+        for tag in newlyConverged:
+            self.signal(tag)
+        return newlyConverged
+
+    def status(self, tag):
+        """Dictionary with the number of merged jobs and events, and the uncertainties of a tag"""
+        return {
+            "jobs": len(self.merged.get(tag, ())),
+            "events": float(self.sums[tag]["norm"]["entries"]) if tag in self.sums else 0.,
+            "uncertainty": self.uncertainties.get(tag),
+            "converged": tag in self.converged,
+        }
+
+    def signal(self, tag):
+        """Write the stop signal of a converged tag"""
+        self.converged.add(tag)
+        if not os.path.isdir(self.stopDir):
+            os.makedirs(self.stopDir)
+        with open(os.path.join(self.stopDir, "{}.stop".format(tag)), "w") as f:
+            json.dump(self.status(tag), f, indent=2)
+
+    def writeCancelScript(self, cluster=None):
+        """Write the condor_rm commands removing the idle jobs of the converged tags, return the path of the script"""
+        path = os.path.join(self.stopDir, CANCEL_SCRIPT)
+        with open(path, "w") as f:
+            f.write("#!/usr/bin/env bash\n")
+            for tag in sorted(self.converged):
+                constraint = 'JobStatus == 1 && regexp(" {}( |$)", Args)'.format(tag)
+                if cluster:
+                    constraint = "ClusterId == {} && {}".format(cluster, constraint)
+                f.write("condor_rm -constraint '{}'\n".format(constraint))
+        os.chmod(path, 0o755)
+        return path
+
+    def record(self):
+        """Append the current status of all tags to the history"""
+        self.history.append({ "time": time.time(), "tags": dict((tag, self.status(tag)) for tag in self.tunes + [ REF ]) })
+        with open(os.path.join(self.stopDir, HISTORY), "w") as f:
+            json.dump(self.history, f, indent=1)
+
+    def done(self):
+        return REF in self.converged
+
+def monitorCampaign(inDir, stopDir=None, tunes=TUNES, tolerance=0.01, interval=600, once=False, cancel=False, cluster=None, **kwargs):
+    """Merge and evaluate the outputs in inDir every `interval` seconds until all the tunes have converged"""
+    stopDir = stopDir if stopDir else os.path.join(inDir, "stop")
+    if not os.path.isdir(stopDir):
+        os.makedirs(stopDir)
+    monitor = CampaignMonitor(inDir, stopDir, tunes, tolerance, **kwargs)
+    while True:
+        updated = monitor.update()
+        newlyConverged = monitor.evaluate(updated)
+        monitor.record()
+        for tag in monitor.tunes + [ REF ]:
+            st = monitor.status(tag)
+            unc = "{:.4f}".format(max(st["uncertainty"])) if st["uncertainty"] else "-"
+            print("{:<22} {:>5} jobs {:>12.4g} events  uncertainty {:>8}{}".format(tag, st["jobs"], st["events"], unc, "  converged" if st["converged"] else ""))
+        if newlyConverged:
+            script = monitor.writeCancelScript(cluster)
+            print("Converged: {}, idle jobs can be removed with {}".format(", ".join(newlyConverged), script))
+            if cancel:
+                subprocess.call([ script ])
+        if once or monitor.done():
+            break
+        time.sleep(interval)
+    return monitor
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Merge the job outputs of a running campaign and signal the tunes whose weights have converged')
+    parser.add_argument('input', help='Folder where the job outputs xb_{TAG}_{JOBID}.root appear')
+    parser.add_argument('--stopDir', help='Folder for the stop signals, cancel script and history (default: input/stop)')
+    parser.add_argument('-o', '--output', help='Folder where the merged outputs xb_{TAG}.root are written at every update')
+    parser.add_argument('--tolerance', type=float, default=0.01, help='Largest relative statistical uncertainty of the smoothed weights')
+    parser.add_argument('--replicas', type=int, default=20, help='Number of fluctuated replicas used to estimate the uncertainties')
+    parser.add_argument('--coverage', type=float, default=0.95, help='Fraction of the reference jets below THRES in the xb range considered')
+    parser.add_argument('--minJobs', type=int, default=2, help='Minimal number of merged jobs before a tune can be stopped')
+    parser.add_argument('--interval', type=float, default=600, help='Seconds between two iterations')
+    parser.add_argument('--once', action='store_true', help='Run a single iteration')
+    parser.add_argument('--cancel', action='store_true', help='Run the condor_rm commands when tunes converge')
+    parser.add_argument('--cluster', help='Only remove the jobs of this condor cluster')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of worker processes evaluating the uncertainties')
+    parser.add_argument('--tunes', nargs='+', default=TUNES, help='Tunes to monitor')
+    args = parser.parse_args()
+
+    monitorCampaign(args.input, args.stopDir, args.tunes, args.tolerance, args.interval, args.once, args.cancel, args.cluster,
+                    replicas=args.replicas, coverage=args.coverage, minJobs=args.minJobs, outDir=args.output, jobs=args.jobs)
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+
+"""
+Plan the number of generated events for each tune from a pilot campaign.
+
+The weights of a tune in a pT slice are derived from the ratio of its xb density to the one of the reference tune, so
+the relative statistical uncertainty of the ratio in an xb bin is sqrt(1/N_tune + 1/N_ref), with N the (effective)
+number of jets in the bin. This scales as 1/sqrt(events), so the merged pilot outputs (xb_{TAG}.root, as produced by
+merge_outputs.sh or mergeOutputs.py) give the number of events needed by every tune for a target relative uncertainty
+in all the bins of all the pT slices. The budget is split evenly between the tune and the reference: each of them is
+required to reach target/sqrt(2) on its own, the reference in the bins of all the tunes.
+
+The xb bins are merged in each pT slice as for the weights (PT_SLICE_REBIN), and only the bins holding the central
+`coverage` fraction of the jets below THRES are considered, the far tails of the xb distributions are smoothed anyway. The output is a submission file in the format of condor.sub, with the same
+header and one queue statement per tune:
+
+    ./planCampaign.py -i pilot/ --target 0.02 -o condor_planned.sub
+"""
+
+import argparse
+import math
+import os
+import numpy as np
+
+from bfragConfig import TUNES, REF, THRES, PT_SLICE_REBIN
+from buildWeightFile import inputPath, ptRangeName
+from mergeOutputs import readHists
+from campaign import readSubmitFile, writeSubmitFile
+
+def sliceRates(hists, coverage=0.95, rebin=1):
+    """Return (list of pT slice names, list of arrays with the effective number of jets per pilot event in the xb bins of each slice,
+    list of masks of the central xb bins of each slice); the xb bins are merged as in buildWeightFile.splitPtSlices, and
+    `rebin` more times"""
+    xb = hists["xb_pt_lead_B"]
+    nEvents = float(hists["norm"]["entries"])
+    if nEvents <= 0:
+        raise ValueError("Pilot output has no events")
+    xEdges, ptEdges = xb["xedges"], xb["yedges"]
+    shape = (len(ptEdges) + 1, len(xEdges) + 1)
+    contents, sumw2 = xb["contents"].reshape(shape), xb["sumw2"].reshape(shape)
+    nXb = np.count_nonzero(xEdges[1:] <= THRES)
+
+    names, rates, centrals = [], [], []
+    for i in range(1, len(ptEdges)):
+        # last slice includes the overflow, as in splitPtSlices
+        last = i + 1 if i < len(ptEdges) - 1 else len(ptEdges) + 1
+        c = contents[i:last, 1:nXb + 1].sum(axis=0)
+        w2 = sumw2[i:last, 1:nXb + 1].sum(axis=0)
+        name = ptRangeName(ptEdges, i - 1)
+        nTimes = PT_SLICE_REBIN.get(name, 1) * rebin
+        nRebin = len(c) // nTimes * nTimes
+        c = c[:nRebin].reshape(-1, nTimes).sum(axis=1)
+        w2 = w2[:nRebin].reshape(-1, nTimes).sum(axis=1)
+        nEff = np.where(w2 > 0, c**2 / np.where(w2 > 0, w2, 1.), 0.)
+
+        total = c.sum()
+        if total <= 0:
+            central = np.zeros(len(c), dtype=bool)
+        else:
+            upper = np.cumsum(c) / total
+            lower = upper - c / total
+            tail = 0.5 * (1. - coverage)
+            central = (upper > tail) & (lower < 1. - tail)
+        names.append(name)
+        rates.append(nEff / nEvents)
+        centrals.append(central)
+    return names, rates, centrals
+
+def requiredEvents(rates, centrals, target):
+    """Number of events for a relative uncertainty of target/sqrt(2) in all the central bins, per slice (inf if a bin is empty in the pilot)"""
+    needed = []
+    for rate, central in zip(rates, centrals):
+        r = rate[central]
+        if len(r) == 0 or np.any(r <= 0):
+            needed.append(np.inf)
+        else:
+            needed.append(2. / (target**2 * r.min()))
+    return np.array(needed)
+
+def planCampaign(inDir, template, outPath, target, coverage=0.95, rebin=1, tunes=TUNES, minJobs=1, maxJobs=None):
+    """Compute the number of jobs of each tune of the template submission file, and write the planned submission file"""
+    header, macros, scenarios = readSubmitFile(template)
+    eventsPerJob = int(macros["nevents"])
+
+    needed = {}
+    refRates = None
+    for tag in [ REF ] + [ t for t in tunes if t != REF ]:
+        path = inputPath(inDir, tag)
+        if not os.path.isfile(path):
+            raise IOError("Missing pilot output {}".format(path))
+        slices, rates, centrals = sliceRates(readHists(path), coverage, rebin)
+        needed[tag] = requiredEvents(rates, centrals, target)
+        if tag == REF:
+            refRates = rates
+        else:
+            # the reference has to reach the same precision, with its own rates, in the bins used for this tune
+            needed[REF] = np.maximum(needed[REF], requiredEvents(refRates, centrals, target))
+
+    print("{:<22}{:>14}{:>16}{:>8}{:>8}".format("tag", "limiting", "events", "jobs", "before"))
+    planned, nBefore, nAfter = [], 0, 0
+    for scenario in scenarios:
+        tag = scenario["tag"]
+        nBefore += scenario["jobs"]
+        if tag not in needed:
+            print("{:<22}{:>14}{:>16}{:>8}{:>8}".format(tag, "-", "-", scenario["jobs"], scenario["jobs"]))
+            planned.append(scenario)
+            nAfter += scenario["jobs"]
+            continue
+        iMax = int(np.argmax(needed[tag]))
+        events = needed[tag][iMax]
+        if np.isfinite(events):
+            nJobs = max(minJobs, int(math.ceil(events / eventsPerJob)))
+        else:
+            print("Warning: empty xb bins for {} in {} in the pilot, increase its statistics or the rebinning".format(tag, slices[iMax]))
+            nJobs = maxJobs if maxJobs else scenario["jobs"]
+        if maxJobs:
+            nJobs = min(nJobs, maxJobs)
+        print("{:<22}{:>14}{:>16.3g}{:>8}{:>8}".format(tag, slices[iMax], events, nJobs, scenario["jobs"]))
+        planned.append(dict(scenario, jobs=nJobs))
+        nAfter += nJobs
+
+    print("Total: {} jobs ({:.3g} events), before: {} jobs ({:.3g} events)".format(nAfter, nAfter * eventsPerJob, nBefore, nBefore * eventsPerJob))
+    comments = [ "planned by planCampaign.py from {}: relative uncertainty {} on the xb ratios, {:.0%} coverage, rebin {}".format(inDir, target, coverage, rebin) ]
+    writeSubmitFile(outPath, header, planned, comments)
+    print("Wrote {}".format(outPath))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Plan the number of jobs per tune from the merged outputs of a pilot campaign')
+    parser.add_argument('-i', '--inDir', required=True, help='Folder containing the merged pilot outputs xb_{TAG}.root')
+    parser.add_argument('-t', '--template', default='condor.sub', help='Submission file giving the scenarios and the events per job')
+    parser.add_argument('-o', '--output', default='condor_planned.sub', help='Planned submission file')
+    parser.add_argument('--target', type=float, default=0.02, help='Relative statistical uncertainty on the xb ratios to the reference')
+    parser.add_argument('--coverage', type=float, default=0.95, help='Fraction of the jets below THRES in the xb bins considered, in each pT slice')
+    parser.add_argument('--rebin', type=int, default=1, help='Number of xb bins merged together when computing the uncertainties, on top of the rebinning of each pT slice')
+    parser.add_argument('--minJobs', type=int, default=1, help='Minimal number of jobs per tune')
+    parser.add_argument('--maxJobs', type=int, default=None, help='Maximal number of jobs per tune')
+    parser.add_argument('--tunes', nargs='+', default=TUNES, help='Tunes to plan (others keep the jobs of the template)')
+    args = parser.parse_args()
+
+    planCampaign(args.inDir, args.template, args.output, args.target, args.coverage, args.rebin, args.tunes, args.minJobs, args.maxJobs)
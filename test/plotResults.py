@@ -1,6 +1,7 @@
 #! /bin/env python
 
-import os, sys, argparse
+import os, sys, argparse, fnmatch
+import multiprocessing
 import numpy as np
 
 # to prevent pyroot to hijack argparse we need to go around
@@ -293,107 +294,59 @@ def drawVariations(name, nominal, variations, title, output, logy=False, nominal
     hi_pad.Delete()
     lo_pad.Delete()
 
-# Options
-
-parser = argparse.ArgumentParser(description='Draw systematics')
-parser.add_argument('-o', '--output', type=str, help='Output directory')
-parser.add_argument('-i', '--input', type=str, help='Input directory')
-
-options = parser.parse_args()
-
-if not os.path.isdir(options.output):
-    os.makedirs(options.output)
-
-setTDRStyle()
-
-plotCfg = [
-    { "name": "bFrag", "title": "x_{b} = p_{T}(B)/p_{T}(jet)", "nominal": (options.input + "/xb_CP5BLdefault.root", "bfragAnalysis/xb_lead_B"), "nominalName": "CP5 default", "vars": [("Tuned B-L central (CP5)", options.input + "/xb_CP5BL.root", "bfragAnalysis/xb_lead_B"), ("Tuned B-L up (CP5)", options.input + "/xb_CP5BLup.root", "bfragAnalysis/xb_lead_B"), ("Tuned B-L down (CP5)", options.input + "/xb_CP5BLdown.root", "bfragAnalysis/xb_lead_B"), ("Tuned Peterson central (CP5)", options.input + "/xb_CP5Peterson.root", "bfragAnalysis/xb_lead_B") ], "norm": True, "ratio-range": [0, 2], "nom_to_density": True, "var_to_density": True },
-
-    { "name": "bFrag_smooth", "title": "x_{b} = p_{T}(B)/p_{T}(jet)", "nominal": (options.input + "/xb_CP5BLdefault.root", "bfragAnalysis/xb_lead_B"), "nominalName": "CP5 default", "vars": [("Tuned B-L central (CP5)", options.input + "/xb_CP5BL.root", "bfragAnalysis/xb_lead_B"), ("Tuned B-L up (CP5)", options.input + "/xb_CP5BLup.root", "bfragAnalysis/xb_lead_B"), ("Tuned B-L down (CP5)", options.input + "/xb_CP5BLdown.root", "bfragAnalysis/xb_lead_B"), ("Tuned Peterson central (CP5)", options.input + "/xb_CP5Peterson.root", "bfragAnalysis/xb_lead_B") ], "norm": True, "smooth": 2, "ratio-range": [0, 2], "nom_to_density": True, "var_to_density": True }, # same as above but smooth histograms twice here
-    
-    { "name": "bFrag_Peterson", "title": "x_{b} = p_{T}(B)/p_{T}(jet)", "nominal": (options.input + "/xb_CP5BLdefault.root", "bfragAnalysis/xb_lead_B"), "nominalName": "CP5 default", "vars": [("Tuned Peterson central (CP5)", options.input + "/xb_CP5Peterson.root", "bfragAnalysis/xb_lead_B"), ("Tuned Peterson up (CP5)", options.input + "/xb_CP5Petersonup.root", "bfragAnalysis/xb_lead_B"), ("Tuned Peterson down (CP5)", options.input + "/xb_CP5Petersondown.root", "bfragAnalysis/xb_lead_B") ], "norm": True, "ratio-range": [0, 2], "nom_to_density": True, "var_to_density": True },
-
-    { "name": "bFrag_tunes", "title": "x_{b} = p_{T}(B)/p_{T}(jet)", "nominal": (options.input + "/xb_CP5BLdefault.root", "bfragAnalysis/xb_lead_B"), "nominalName": "CP5 default B-L", "vars": [("CP5 tuned B-L central", options.input + "/xb_CP5BL.root", "bfragAnalysis/xb_lead_B"), ("CUETP8M2T4 default B-L", options.input + "/xb_CUETP8M2T4BLdefault.root", "bfragAnalysis/xb_lead_B"), ("CUETP8M2T4 tuned B-L central", options.input + "/xb_CUETP8M2T4BL.root", "bfragAnalysis/xb_lead_B") ], "norm": True, "ratio-range": [0.2, 1.7], "nom_to_density": True, "var_to_density": True },
-    
-    { "name": "bFrag_old", "title": "x_{b} = p_{T}(B)/p_{T}(jet)", "nominal": (options.input + "/xb_CUETP8M2T4BLdefault.root", "bfragAnalysis/xb_lead_B"), "nominalName": "CUETP8M2T4 default B-L", "vars": [("CUETP8M2T4 tuned B-L central", options.input + "/xb_CUETP8M2T4BL.root", "bfragAnalysis/xb_lead_B"), ("CUETP8M2T4 B-L TOP-18-012", options.input + "/xb_CUETP8M2T4BLLHC.root", "bfragAnalysis/xb_lead_B") ], "norm": True, "ratio-range": [0.7, 1.5], "nom_to_density": True, "var_to_density": True },
-
-    { "name": "bFrag_top-18-012", "title": "x_{b} = p_{T}(B)/p_{T}(jet)", "nominal": (options.input + "/xb_CP5BLdefault.root", "bfragAnalysis/xb_lead_B"), "nominalName": "CP5 default B-L", "vars": [("CUETP8M2T4 B-L TOP-18-012 central", options.input + "/xb_CUETP8M2T4BLLHC.root", "bfragAnalysis/xb_lead_B"), ("CUETP8M2T4 B-L TOP-18-012 up", options.input + "/xb_CUETP8M2T4BLLHCup.root", "bfragAnalysis/xb_lead_B"), ("CUETP8M2T4 B-L TOP-18-012 down", options.input + "/xb_CUETP8M2T4BLLHCdown.root", "bfragAnalysis/xb_lead_B") ], "norm": True, "ratio-range": [0.7, 1.5], "nom_to_density": True, "var_to_density": True },
-
-     { "name": "bFrag_checkBvsInc", "title": "x_{b} = p_{T}(B)/p_{T}(jet)", "nominal": (options.input + "/xb_CP5BLdefault.root", "bfragAnalysis/xb_lead_B"), "nominalName": "CP5 default, leading B", "vars": [("CP5 default, if(leading=B)", options.input + "/xb_CP5BLdefault.root", "bfragAnalysis/xb_lead_inc"), ("Tuned B-L central (CP5), leading B", options.input + "/xb_CP5BL.root", "bfragAnalysis/xb_lead_B"), ("Tuned B-L central (CP5), if(leading=B)", options.input + "/xb_CP5BL.root", "bfragAnalysis/xb_lead_inc") ], "norm": True, "ratio-range": [0.6, 1.4], "nom_to_density": True, "var_to_density": True },
-     
-    { "name": "bFrag_debug_CP5BL", "title": "x_{b} = p_{T}(B)/p_{T}(jet)", "nominal": (options.input + "/xb_CP5BL.root", "bfragAnalysis/xb_lead_B"), "nominalName": "CP5 BL central", "vars": [("CP5 BL default to CP5 BL central", options.input + "/xb_CP5BLdefault_debug.root", "bfragAnalysis/debug_xb_lead_B_fragCP5BL") ], "ratio-range": [0.6, 1.4], "ratio-style": "histE0" },
-    { "name": "bFrag_debug_CP5Peterson", "title": "x_{b} = p_{T}(B)/p_{T}(jet)", "nominal": (options.input + "/xb_CP5Peterson.root", "bfragAnalysis/xb_lead_B"), "nominalName": "CP5 Peterson central", "vars": [("CP5 BL default to CP5 Peterson central", options.input + "/xb_CP5BLdefault_debug.root", "bfragAnalysis/debug_xb_lead_B_fragCP5Peterson") ], "ratio-range": [0.6, 1.4], "ratio-style": "histE0" },
-
-    { "name": "pt_debug_CP5BL", "title": "p_{T}(jet)", "nominal": (options.input + "/bfragweights_vs_pt_debug.root", "pt_CP5BLdefault"), "nominalName": "CP5 B-L default", "vars": [(leg, options.input + "/bfragweights_vs_pt_debug.root" , hist) for (leg, hist) in zip(["CP5 B-L central", "CP5 B-L up", "CP5 B-L down"], ["pt_CP5BL", "pt_CP5BLup", "pt_CP5BLdown"]) ], "ratio-range": [0.98, 1.02], "norm": True, "x-range": [20, 500], "leg-pos": "r", "ratio-style": "histE0" },
-    { "name": "pt_debug_Peterson", "title": "p_{T}(jet)", "nominal": (options.input + "/bfragweights_vs_pt_debug.root", "pt_CP5BLdefault"), "nominalName": "CP5 B-L default", "vars": [(leg, options.input + "/bfragweights_vs_pt_debug.root" , hist) for (leg, hist) in zip(["CP5 Peterson central", "CP5 Peterson up", "CP5 Peterson down"], ["pt_CP5Peterson", "pt_CP5Petersonup", "pt_CP5Petersondown"]) ], "ratio-range": [0.98, 1.02], "norm": True, "x-range": [20, 500], "leg-pos": "r", "ratio-style": "histE0" },
-    { "name": "pt_debug_CUETP", "title": "p_{T}(jet)", "nominal": (options.input + "/bfragweights_vs_pt_debug.root", "pt_CP5BLdefault"), "nominalName": "CP5 B-L default", "vars": [(leg, options.input + "/bfragweights_vs_pt_debug.root" , hist) for (leg, hist) in zip(["CUETP8M2T4 B-L default", "CUETP8M2T4 B-L LHC central", "CUETP8M2T4 B-L LHC up", "CUETP8M2T4 B-L LHC down"], ["pt_CUETP8M2T4BL", "pt_CUETP8M2T4BLLHC", "pt_CUETP8M2T4BLLHCup","pt_CUETP8M2T4BLLHCdown"]) ], "ratio-range": [0.97, 1.03], "norm": True, "x-range": [20, 500], "leg-pos": "r", "ratio-style": "histE0" },
-]
-
-
-for plot in plotCfg:
-    tf = ROOT.TFile.Open(plot["nominal"][0])
-    nominal = tf.Get(plot["nominal"][1])
-    print("Doing ", plot["nominal"][1])
-    try:
-        nominal.SetDirectory(0)
-    except AttributeError as e:
-        print("Could not load {} from {}".format(plot["nominal"][1], plot["nominal"][0]))
-        raise e
-    tf.Close()
-
-    variations = []
-    for var in plot["vars"]:
-        tf = ROOT.TFile.Open(var[1])
-        variations.append((var[0], tf.Get(var[2])))
-        try:
-            variations[-1][1].SetDirectory(0)
-        except AttributeError as e:
-            print("Could not load {} from {}".format(var[2], var[1]))
-            raise e
-        tf.Close()
-
-    drawVariations(plot["name"], nominal, variations, plot["title"], options.output, logy=plot.get("log", False), nominalName=plot.get("nominalName", None), norm=plot.get("norm", False), ratio_range=plot.get("ratio-range", None), x_range=plot.get("x-range", None), smooth=plot.get("smooth", 0), nom_to_density=plot.get("nom_to_density", False), var_to_density=plot.get("var_to_density", False), ratio_style=plot.get("ratio-style", "histL"), leg_pos=plot.get("leg-pos", "l"))
-
-
-#### pT plots
 
 pTbins = [20, 40, 60, 100, 150, 200, 350, 500]
 pTranges = ["pT{}To{}".format(pTbins[i], pTbins[i+1]) for i in range(len(pTbins)-1)]
 pTranges.append("pT{}".format(pTbins[-1]))
 
-pTplots = [
-    { "name": "bFrag_pT_CP5BLdefault", "title": "x_{b} = p_{T}(B)/p_{T}(jet)", "nominal": (options.input + "/xb_CP5BLdefault.root", "bfragAnalysis/xb_lead_B"), "nominalName": "CP5 default, averaged", "vars": [("CP5 default, {pT}".format(pT=pT), options.input + "/bfragweights_vs_pt_debug.root", "xb_CP5BLdefault_{pT}".format(pT=pT)) for pT in pTranges], "norm": True, "ratio-range": [0, 5.], "ratio-style": "hist" },
-    { "name": "bFrag_pT_CP5BL", "title": "x_{b} = p_{T}(B)/p_{T}(jet)", "nominal": (options.input + "/xb_CP5BL.root", "bfragAnalysis/xb_lead_B"), "nominalName": "CP5 default, averaged", "vars": [("CP5 nominal, {pT}".format(pT=pT), options.input + "/bfragweights_vs_pt_debug.root", "xb_CP5BL_{pT}".format(pT=pT)) for pT in pTranges], "norm": True, "ratio-range": [0, 5.], "ratio-style": "hist" },
-    { "name": "bFrag_pT_CP5BLup", "title": "x_{b} = p_{T}(B)/p_{T}(jet)", "nominal": (options.input + "/xb_CP5BLup.root", "bfragAnalysis/xb_lead_B"), "nominalName": "CP5 up, averaged", "vars": [("CP5 up, {pT}".format(pT=pT), options.input + "/bfragweights_vs_pt_debug.root", "xb_CP5BLup_{pT}".format(pT=pT)) for pT in pTranges], "norm": True, "ratio-range": [0, 5.], "ratio-style": "hist" },
-    { "name": "bFrag_pT_CP5BLdown", "title": "x_{b} = p_{T}(B)/p_{T}(jet)", "nominal": (options.input + "/xb_CP5BLdown.root", "bfragAnalysis/xb_lead_B"), "nominalName": "CP5 down, averaged", "vars": [("CP5 down, {pT}".format(pT=pT), options.input + "/bfragweights_vs_pt_debug.root", "xb_CP5BLdown_{pT}".format(pT=pT)) for pT in pTranges], "norm": True, "ratio-range": [0, 5.], "ratio-style": "hist" },
-    { "name": "bFrag_pT_CP5Peterson", "title": "x_{b} = p_{T}(B)/p_{T}(jet)", "nominal": (options.input + "/xb_CP5Peterson.root", "bfragAnalysis/xb_lead_B"), "nominalName": "CP5 Peterson, averaged", "vars": [("CP5 Peterson, {pT}".format(pT=pT), options.input + "/bfragweights_vs_pt_debug.root", "xb_CP5Peterson_{pT}".format(pT=pT)) for pT in pTranges], "norm": True, "ratio-range": [0, 5.], "ratio-style": "hist" },
-    { "name": "bFrag_pT_CP5Petersonup", "title": "x_{b} = p_{T}(B)/p_{T}(jet)", "nominal": (options.input + "/xb_CP5Petersonup.root", "bfragAnalysis/xb_lead_B"), "nominalName": "CP5 Peterson up, averaged", "vars": [("CP5 Peterson up, {pT}".format(pT=pT), options.input + "/bfragweights_vs_pt_debug.root", "xb_CP5Petersonup_{pT}".format(pT=pT)) for pT in pTranges], "norm": True, "ratio-range": [0, 5.], "ratio-style": "hist" },
-    { "name": "bFrag_pT_CP5Petersondown", "title": "x_{b} = p_{T}(B)/p_{T}(jet)", "nominal": (options.input + "/xb_CP5Petersondown.root", "bfragAnalysis/xb_lead_B"), "nominalName": "CP5 Peterson down, averaged", "vars": [("CP5 Peterson down, {pT}".format(pT=pT), options.input + "/bfragweights_vs_pt_debug.root", "xb_CP5Petersondown_{pT}".format(pT=pT)) for pT in pTranges], "norm": True, "ratio-range": [0, 5.], "ratio-style": "hist" },
-]
-
-for plot in pTplots:
-    tf = ROOT.TFile.Open(plot["nominal"][0])
-    nominal = tf.Get(plot["nominal"][1])
+class FileCache(object):
+    """Input files, opened once per process and kept open; objects are returned as copies detached from the files"""
+    def __init__(self):
+        self.files = {}
+
+    def get(self, path, name):
+        tf = self.files.get(path)
+        if tf is None:
+            tf = ROOT.TFile.Open(path)
+            if not tf or tf.IsZombie():
+                raise IOError("Could not open {}".format(path))
+            self.files[path] = tf
+            # opening a file makes it the current directory: go back to gROOT, such that the histograms created
+            # later are not attached to (and deleted with) the input file
+            ROOT.gROOT.cd()
+        obj = tf.Get(name)
+        if not obj:
+            raise KeyError("Could not load {} from {}".format(name, path))
+        obj = obj.Clone()
+        if obj.InheritsFrom("TH1"):
+            obj.SetDirectory(0)
+        return obj
+
+    def close(self):
+        for tf in self.files.values():
+            tf.Close()
+        self.files = {}
+
+# shared by all the plots rendered in a process
+FILES = FileCache()
+
+def plotVariations(plot, output):
+    nominal = FILES.get(*plot["nominal"])
+    print("Doing ", plot["nominal"][1])
+    variations = [ (var[0], FILES.get(var[1], var[2])) for var in plot["vars"] ]
+
+    drawVariations(plot["name"], nominal, variations, plot["title"], output, logy=plot.get("log", False), nominalName=plot.get("nominalName", None), norm=plot.get("norm", False), ratio_range=plot.get("ratio-range", None), x_range=plot.get("x-range", None), smooth=plot.get("smooth", 0), nom_to_density=plot.get("nom_to_density", False), var_to_density=plot.get("var_to_density", False), ratio_style=plot.get("ratio-style", "histL"), leg_pos=plot.get("leg-pos", "l"))
+
+def plotPtVariations(plot, output):
+    nominal = FILES.get(*plot["nominal"])
     print("Doing ", plot["nominal"][1])
-    try:
-        nominal.SetDirectory(0)
-    except AttributeError as e:
-        print("Could not load {} from {}".format(plot["nominal"][1], plot["nominal"][0]))
-        raise e
-    tf.Close()
     toDensity(nominal)
     th1SmoothRange(nominal, 2, 0., 1.)
     orig_bins = np.array(nominal.GetXaxis().GetXbins())
 
     variations = []
     for var in plot["vars"]:
-        tf = ROOT.TFile.Open(var[1])
-        hist = tf.Get(var[2])
-        try:
-            hist.SetDirectory(0)
-        except AttributeError as e:
-            print("Could not load {} from {}".format(var[2], var[1]))
-            raise e
+        hist = FILES.get(var[1], var[2])
         # get the same bins and normalization for the pT ranges
         th1SmoothRange(hist, 2, 0., 1.)
         hist_rebin = ROOT.TH1D(hist.GetName() + "_rebin", "", len(orig_bins) - 1, orig_bins)
@@ -404,32 +357,15 @@ for plot in pTplots:
             n_var = hist.GetBinContent(i_var)
             hist_rebin.SetBinContent(i_orig + 1, n_var / ratio)
         variations.append((var[0], hist_rebin))
-        tf.Close()
-
-    drawVariations(plot["name"], nominal, variations, plot["title"], options.output, logy=plot.get("log", False), nominalName=plot.get("nominalName", None), norm=plot.get("norm", False), ratio_range=plot.get("ratio-range", None), smooth=plot.get("smooth", 0), nom_to_density=plot.get("nom_to_density", False), var_to_density=plot.get("var_to_density", False), ratio_style=plot.get("ratio-style", "histL"), leg_pos=plot.get("leg-pos", "l"))
-
-
-
-
-#### debug: smooth vs. raw weights
-for leg,gr,out in [
-    ("B-L CP5 default to B-L CP5 central", "fragCP5BL", "weights_BL_central.pdf"),
-    ("B-L CP5 default to B-L CP5 up", "fragCP5BLup", "weights_BL_up.pdf"),
-    ("B-L CP5 default to B-L CP5 down", "fragCP5BLdown", "weights_BL_down.pdf"),
-    ("B-L CP5 default to Peterson CP5 central", "fragCP5Peterson", "weights_peterson_central.pdf"),
-    ("B-L CP5 default to Peterson CP5 up", "fragCP5Petersonup", "weights_peterson_up.pdf"),
-    ("B-L CP5 default to Peterson CP5 down", "fragCP5Petersondown", "weights_peterson_down.pdf"),
-    ("B-L CP5 default to B-L CUETP8M2T4 central", "fragCUETP8M2T4BL", "weights_BL_cuetp8m2t4_central.pdf"),
-    ("B-L CP5 default to B-L CUETP8M2T4 TOP-18-012 central", "fragCUETP8M2T4BLLHC", "weights_BL_cuetp8m2t4_top-18-012_central.pdf"),
-    ("B-L CP5 default to B-L CUETP8M2T4 TOP-18-012 up", "fragCUETP8M2T4BLLHCup", "weights_BL_cuetp8m2t4_top-18-012_up.pdf"),
-    ("B-L CP5 default to B-L CUETP8M2T4 TOP-18-012 down", "fragCUETP8M2T4BLLHCdown", "weights_BL_cuetp8m2t4_top-18-012_down.pdf"),
-                  ]:
-    tf = ROOT.TFile.Open(options.input + "/bfragweights.root")
-    notSmooth = tf.Get(gr)
-    smooth = tf.Get(gr + "_smooth")
-    tf.Close()
+
+    drawVariations(plot["name"], nominal, variations, plot["title"], output, logy=plot.get("log", False), nominalName=plot.get("nominalName", None), norm=plot.get("norm", False), ratio_range=plot.get("ratio-range", None), smooth=plot.get("smooth", 0), nom_to_density=plot.get("nom_to_density", False), var_to_density=plot.get("var_to_density", False), ratio_style=plot.get("ratio-style", "histL"), leg_pos=plot.get("leg-pos", "l"))
+
+def plotWeights(leg, gr, out, inDir, output):
+    """debug: smooth vs. raw weights"""
+    notSmooth = FILES.get(inDir + "/bfragweights.root", gr)
+    smooth = FILES.get(inDir + "/bfragweights.root", gr + "_smooth")
     c = ROOT.TCanvas("c", "c")
-    
+
     c.SetTopMargin(0.05)
     c.SetLeftMargin(0.1)
     c.SetRightMargin(0.05)
@@ -459,24 +395,10 @@ for leg,gr,out in [
     text.SetTextSize(0.03)
     text.Draw("same")
 
-    c.SaveAs(os.path.join(options.output, out))
-
-
-
-### debug: smooth in pT bins
-for leg,gr,out in [
-    ("B-L CP5 default to B-L CP5 central", "fragCP5BL", "weights_pT_BL_central.pdf"),
-    ("B-L CP5 default to B-L CP5 up", "fragCP5BLup", "weights_pT_BL_up.pdf"),
-    ("B-L CP5 default to B-L CP5 down", "fragCP5BLdown", "weights_pT_BL_down.pdf"),
-    ("B-L CP5 default to Peterson CP5 central", "fragCP5Peterson", "weights_pT_peterson_central.pdf"),
-    ("B-L CP5 default to Peterson CP5 up", "fragCP5Petersonup", "weights_pT_peterson_up.pdf"),
-    ("B-L CP5 default to Peterson CP5 down", "fragCP5Petersondown", "weights_pT_peterson_down.pdf"),
-    ("B-L CP5 default to B-L CUETP8M2T4 central", "fragCUETP8M2T4BL", "weights_pT_BL_cuetp8m2t4_central.pdf"),
-    ("B-L CP5 default to B-L CUETP8M2T4 TOP-18-012 central", "fragCUETP8M2T4BLLHC", "weights_pT_BL_cuetp8m2t4_top-18-012_central.pdf"),
-    ("B-L CP5 default to B-L CUETP8M2T4 TOP-18-012 up", "fragCUETP8M2T4BLLHCup", "weights_pT_BL_cuetp8m2t4_top-18-012_up.pdf"),
-    ("B-L CP5 default to B-L CUETP8M2T4 TOP-18-012 down", "fragCUETP8M2T4BLLHCdown", "weights_pT_BL_cuetp8m2t4_top-18-012_down.pdf"),
-                  ]:
+    c.SaveAs(os.path.join(output, out))
 
+def plotPtWeights(leg, gr, out, inDir, output):
+    """debug: smooth in pT bins"""
     c = ROOT.TCanvas("c", "c")
     
     c.SetTopMargin(0.05)
@@ -492,14 +414,13 @@ for leg,gr,out in [
     l.SetBorderSize(0)
     l.SetTextSize(0.023)
     
-    tf = ROOT.TFile.Open(options.input + "/bfragweights.root")
-    nominal = tf.Get(gr + "_smooth")
+    nominal = FILES.get(inDir + "/bfragweights.root", gr + "_smooth")
     l.AddEntry(nominal, "averaged")
-    tf.Close()
 
-    tf = ROOT.TFile.Open(options.input + "/bfragweights_vs_pt_debug.root")
+    graphs = []
     for ipT,pT in enumerate(pTranges):
-        graph = tf.Get(gr + "_" + pT + "_smooth")
+        graph = FILES.get(inDir + "/bfragweights_vs_pt_debug.root", gr + "_" + pT + "_smooth")
+        graphs.append(graph)
         
         l.AddEntry(graph, pT)
 
@@ -521,8 +442,6 @@ for leg,gr,out in [
             graph.Draw("AL")
         else:
             graph.Draw("Lsame")
-        
-    tf.Close()
 
     nominal.SetLineColor(nominal_color)
     nominal.SetLineWidth(3)
@@ -537,6 +456,110 @@ for leg,gr,out in [
     
     l.Draw("same")
 
-    c.SaveAs(os.path.join(options.output, out))
-
-
+    c.SaveAs(os.path.join(output, out))
+
+def plotTasks(inDir, output):
+    """Return the list of (name, function, arguments) of all the plots, which can be rendered independently"""
+    plotCfg = [
+        { "name": "bFrag", "title": "x_{b} = p_{T}(B)/p_{T}(jet)", "nominal": (inDir + "/xb_CP5BLdefault.root", "bfragAnalysis/xb_lead_B"), "nominalName": "CP5 default", "vars": [("Tuned B-L central (CP5)", inDir + "/xb_CP5BL.root", "bfragAnalysis/xb_lead_B"), ("Tuned B-L up (CP5)", inDir + "/xb_CP5BLup.root", "bfragAnalysis/xb_lead_B"), ("Tuned B-L down (CP5)", inDir + "/xb_CP5BLdown.root", "bfragAnalysis/xb_lead_B"), ("Tuned Peterson central (CP5)", inDir + "/xb_CP5Peterson.root", "bfragAnalysis/xb_lead_B") ], "norm": True, "ratio-range": [0, 2], "nom_to_density": True, "var_to_density": True },
+
+        { "name": "bFrag_smooth", "title": "x_{b} = p_{T}(B)/p_{T}(jet)", "nominal": (inDir + "/xb_CP5BLdefault.root", "bfragAnalysis/xb_lead_B"), "nominalName": "CP5 default", "vars": [("Tuned B-L central (CP5)", inDir + "/xb_CP5BL.root", "bfragAnalysis/xb_lead_B"), ("Tuned B-L up (CP5)", inDir + "/xb_CP5BLup.root", "bfragAnalysis/xb_lead_B"), ("Tuned B-L down (CP5)", inDir + "/xb_CP5BLdown.root", "bfragAnalysis/xb_lead_B"), ("Tuned Peterson central (CP5)", inDir + "/xb_CP5Peterson.root", "bfragAnalysis/xb_lead_B") ], "norm": True, "smooth": 2, "ratio-range": [0, 2], "nom_to_density": True, "var_to_density": True }, # same as above but smooth histograms twice here
+
+        { "name": "bFrag_Peterson", "title": "x_{b} = p_{T}(B)/p_{T}(jet)", "nominal": (inDir + "/xb_CP5BLdefault.root", "bfragAnalysis/xb_lead_B"), "nominalName": "CP5 default", "vars": [("Tuned Peterson central (CP5)", inDir + "/xb_CP5Peterson.root", "bfragAnalysis/xb_lead_B"), ("Tuned Peterson up (CP5)", inDir + "/xb_CP5Petersonup.root", "bfragAnalysis/xb_lead_B"), ("Tuned Peterson down (CP5)", inDir + "/xb_CP5Petersondown.root", "bfragAnalysis/xb_lead_B") ], "norm": True, "ratio-range": [0, 2], "nom_to_density": True, "var_to_density": True },
+
+        { "name": "bFrag_tunes", "title": "x_{b} = p_{T}(B)/p_{T}(jet)", "nominal": (inDir + "/xb_CP5BLdefault.root", "bfragAnalysis/xb_lead_B"), "nominalName": "CP5 default B-L", "vars": [("CP5 tuned B-L central", inDir + "/xb_CP5BL.root", "bfragAnalysis/xb_lead_B"), ("CUETP8M2T4 default B-L", inDir + "/xb_CUETP8M2T4BLdefault.root", "bfragAnalysis/xb_lead_B"), ("CUETP8M2T4 tuned B-L central", inDir + "/xb_CUETP8M2T4BL.root", "bfragAnalysis/xb_lead_B") ], "norm": True, "ratio-range": [0.2, 1.7], "nom_to_density": True, "var_to_density": True },
+
+        { "name": "bFrag_old", "title": "x_{b} = p_{T}(B)/p_{T}(jet)", "nominal": (inDir + "/xb_CUETP8M2T4BLdefault.root", "bfragAnalysis/xb_lead_B"), "nominalName": "CUETP8M2T4 default B-L", "vars": [("CUETP8M2T4 tuned B-L central", inDir + "/xb_CUETP8M2T4BL.root", "bfragAnalysis/xb_lead_B"), ("CUETP8M2T4 B-L TOP-18-012", inDir + "/xb_CUETP8M2T4BLLHC.root", "bfragAnalysis/xb_lead_B") ], "norm": True, "ratio-range": [0.7, 1.5], "nom_to_density": True, "var_to_density": True },
+
+        { "name": "bFrag_top-18-012", "title": "x_{b} = p_{T}(B)/p_{T}(jet)", "nominal": (inDir + "/xb_CP5BLdefault.root", "bfragAnalysis/xb_lead_B"), "nominalName": "CP5 default B-L", "vars": [("CUETP8M2T4 B-L TOP-18-012 central", inDir + "/xb_CUETP8M2T4BLLHC.root", "bfragAnalysis/xb_lead_B"), ("CUETP8M2T4 B-L TOP-18-012 up", inDir + "/xb_CUETP8M2T4BLLHCup.root", "bfragAnalysis/xb_lead_B"), ("CUETP8M2T4 B-L TOP-18-012 down", inDir + "/xb_CUETP8M2T4BLLHCdown.root", "bfragAnalysis/xb_lead_B") ], "norm": True, "ratio-range": [0.7, 1.5], "nom_to_density": True, "var_to_density": True },
+
+         { "name": "bFrag_checkBvsInc", "title": "x_{b} = p_{T}(B)/p_{T}(jet)", "nominal": (inDir + "/xb_CP5BLdefault.root", "bfragAnalysis/xb_lead_B"), "nominalName": "CP5 default, leading B", "vars": [("CP5 default, if(leading=B)", inDir + "/xb_CP5BLdefault.root", "bfragAnalysis/xb_lead_inc"), ("Tuned B-L central (CP5), leading B", inDir + "/xb_CP5BL.root", "bfragAnalysis/xb_lead_B"), ("Tuned B-L central (CP5), if(leading=B)", inDir + "/xb_CP5BL.root", "bfragAnalysis/xb_lead_inc") ], "norm": True, "ratio-range": [0.6, 1.4], "nom_to_density": True, "var_to_density": True },
+
+        { "name": "bFrag_debug_CP5BL", "title": "x_{b} = p_{T}(B)/p_{T}(jet)", "nominal": (inDir + "/xb_CP5BL.root", "bfragAnalysis/xb_lead_B"), "nominalName": "CP5 BL central", "vars": [("CP5 BL default to CP5 BL central", inDir + "/xb_CP5BLdefault_debug.root", "bfragAnalysis/debug_xb_lead_B_fragCP5BL") ], "ratio-range": [0.6, 1.4], "ratio-style": "histE0" },
+        { "name": "bFrag_debug_CP5Peterson", "title": "x_{b} = p_{T}(B)/p_{T}(jet)", "nominal": (inDir + "/xb_CP5Peterson.root", "bfragAnalysis/xb_lead_B"), "nominalName": "CP5 Peterson central", "vars": [("CP5 BL default to CP5 Peterson central", inDir + "/xb_CP5BLdefault_debug.root", "bfragAnalysis/debug_xb_lead_B_fragCP5Peterson") ], "ratio-range": [0.6, 1.4], "ratio-style": "histE0" },
+
+        { "name": "pt_debug_CP5BL", "title": "p_{T}(jet)", "nominal": (inDir + "/bfragweights_vs_pt_debug.root", "pt_CP5BLdefault"), "nominalName": "CP5 B-L default", "vars": [(leg, inDir + "/bfragweights_vs_pt_debug.root" , hist) for (leg, hist) in zip(["CP5 B-L central", "CP5 B-L up", "CP5 B-L down"], ["pt_CP5BL", "pt_CP5BLup", "pt_CP5BLdown"]) ], "ratio-range": [0.98, 1.02], "norm": True, "x-range": [20, 500], "leg-pos": "r", "ratio-style": "histE0" },
+        { "name": "pt_debug_Peterson", "title": "p_{T}(jet)", "nominal": (inDir + "/bfragweights_vs_pt_debug.root", "pt_CP5BLdefault"), "nominalName": "CP5 B-L default", "vars": [(leg, inDir + "/bfragweights_vs_pt_debug.root" , hist) for (leg, hist) in zip(["CP5 Peterson central", "CP5 Peterson up", "CP5 Peterson down"], ["pt_CP5Peterson", "pt_CP5Petersonup", "pt_CP5Petersondown"]) ], "ratio-range": [0.98, 1.02], "norm": True, "x-range": [20, 500], "leg-pos": "r", "ratio-style": "histE0" },
+        { "name": "pt_debug_CUETP", "title": "p_{T}(jet)", "nominal": (inDir + "/bfragweights_vs_pt_debug.root", "pt_CP5BLdefault"), "nominalName": "CP5 B-L default", "vars": [(leg, inDir + "/bfragweights_vs_pt_debug.root" , hist) for (leg, hist) in zip(["CUETP8M2T4 B-L default", "CUETP8M2T4 B-L LHC central", "CUETP8M2T4 B-L LHC up", "CUETP8M2T4 B-L LHC down"], ["pt_CUETP8M2T4BL", "pt_CUETP8M2T4BLLHC", "pt_CUETP8M2T4BLLHCup","pt_CUETP8M2T4BLLHCdown"]) ], "ratio-range": [0.97, 1.03], "norm": True, "x-range": [20, 500], "leg-pos": "r", "ratio-style": "histE0" },
+    ]
+
+    pTplots = [
+        { "name": "bFrag_pT_CP5BLdefault", "title": "x_{b} = p_{T}(B)/p_{T}(jet)", "nominal": (inDir + "/xb_CP5BLdefault.root", "bfragAnalysis/xb_lead_B"), "nominalName": "CP5 default, averaged", "vars": [("CP5 default, {pT}".format(pT=pT), inDir + "/bfragweights_vs_pt_debug.root", "xb_CP5BLdefault_{pT}".format(pT=pT)) for pT in pTranges], "norm": True, "ratio-range": [0, 5.], "ratio-style": "hist" },
+        { "name": "bFrag_pT_CP5BL", "title": "x_{b} = p_{T}(B)/p_{T}(jet)", "nominal": (inDir + "/xb_CP5BL.root", "bfragAnalysis/xb_lead_B"), "nominalName": "CP5 default, averaged", "vars": [("CP5 nominal, {pT}".format(pT=pT), inDir + "/bfragweights_vs_pt_debug.root", "xb_CP5BL_{pT}".format(pT=pT)) for pT in pTranges], "norm": True, "ratio-range": [0, 5.], "ratio-style": "hist" },
+        { "name": "bFrag_pT_CP5BLup", "title": "x_{b} = p_{T}(B)/p_{T}(jet)", "nominal": (inDir + "/xb_CP5BLup.root", "bfragAnalysis/xb_lead_B"), "nominalName": "CP5 up, averaged", "vars": [("CP5 up, {pT}".format(pT=pT), inDir + "/bfragweights_vs_pt_debug.root", "xb_CP5BLup_{pT}".format(pT=pT)) for pT in pTranges], "norm": True, "ratio-range": [0, 5.], "ratio-style": "hist" },
+        { "name": "bFrag_pT_CP5BLdown", "title": "x_{b} = p_{T}(B)/p_{T}(jet)", "nominal": (inDir + "/xb_CP5BLdown.root", "bfragAnalysis/xb_lead_B"), "nominalName": "CP5 down, averaged", "vars": [("CP5 down, {pT}".format(pT=pT), inDir + "/bfragweights_vs_pt_debug.root", "xb_CP5BLdown_{pT}".format(pT=pT)) for pT in pTranges], "norm": True, "ratio-range": [0, 5.], "ratio-style": "hist" },
+        { "name": "bFrag_pT_CP5Peterson", "title": "x_{b} = p_{T}(B)/p_{T}(jet)", "nominal": (inDir + "/xb_CP5Peterson.root", "bfragAnalysis/xb_lead_B"), "nominalName": "CP5 Peterson, averaged", "vars": [("CP5 Peterson, {pT}".format(pT=pT), inDir + "/bfragweights_vs_pt_debug.root", "xb_CP5Peterson_{pT}".format(pT=pT)) for pT in pTranges], "norm": True, "ratio-range": [0, 5.], "ratio-style": "hist" },
+        { "name": "bFrag_pT_CP5Petersonup", "title": "x_{b} = p_{T}(B)/p_{T}(jet)", "nominal": (inDir + "/xb_CP5Petersonup.root", "bfragAnalysis/xb_lead_B"), "nominalName": "CP5 Peterson up, averaged", "vars": [("CP5 Peterson up, {pT}".format(pT=pT), inDir + "/bfragweights_vs_pt_debug.root", "xb_CP5Petersonup_{pT}".format(pT=pT)) for pT in pTranges], "norm": True, "ratio-range": [0, 5.], "ratio-style": "hist" },
+        { "name": "bFrag_pT_CP5Petersondown", "title": "x_{b} = p_{T}(B)/p_{T}(jet)", "nominal": (inDir + "/xb_CP5Petersondown.root", "bfragAnalysis/xb_lead_B"), "nominalName": "CP5 Peterson down, averaged", "vars": [("CP5 Peterson down, {pT}".format(pT=pT), inDir + "/bfragweights_vs_pt_debug.root", "xb_CP5Petersondown_{pT}".format(pT=pT)) for pT in pTranges], "norm": True, "ratio-range": [0, 5.], "ratio-style": "hist" },
+    ]
+
+    weights = [
+        ("B-L CP5 default to B-L CP5 central", "fragCP5BL", "weights_BL_central.pdf"),
+        ("B-L CP5 default to B-L CP5 up", "fragCP5BLup", "weights_BL_up.pdf"),
+        ("B-L CP5 default to B-L CP5 down", "fragCP5BLdown", "weights_BL_down.pdf"),
+        ("B-L CP5 default to Peterson CP5 central", "fragCP5Peterson", "weights_peterson_central.pdf"),
+        ("B-L CP5 default to Peterson CP5 up", "fragCP5Petersonup", "weights_peterson_up.pdf"),
+        ("B-L CP5 default to Peterson CP5 down", "fragCP5Petersondown", "weights_peterson_down.pdf"),
+        ("B-L CP5 default to B-L CUETP8M2T4 central", "fragCUETP8M2T4BL", "weights_BL_cuetp8m2t4_central.pdf"),
+        ("B-L CP5 default to B-L CUETP8M2T4 TOP-18-012 central", "fragCUETP8M2T4BLLHC", "weights_BL_cuetp8m2t4_top-18-012_central.pdf"),
+        ("B-L CP5 default to B-L CUETP8M2T4 TOP-18-012 up", "fragCUETP8M2T4BLLHCup", "weights_BL_cuetp8m2t4_top-18-012_up.pdf"),
+        ("B-L CP5 default to B-L CUETP8M2T4 TOP-18-012 down", "fragCUETP8M2T4BLLHCdown", "weights_BL_cuetp8m2t4_top-18-012_down.pdf"),
+    ]
+
+    pTweights = [
+        ("B-L CP5 default to B-L CP5 central", "fragCP5BL", "weights_pT_BL_central.pdf"),
+        ("B-L CP5 default to B-L CP5 up", "fragCP5BLup", "weights_pT_BL_up.pdf"),
+        ("B-L CP5 default to B-L CP5 down", "fragCP5BLdown", "weights_pT_BL_down.pdf"),
+        ("B-L CP5 default to Peterson CP5 central", "fragCP5Peterson", "weights_pT_peterson_central.pdf"),
+        ("B-L CP5 default to Peterson CP5 up", "fragCP5Petersonup", "weights_pT_peterson_up.pdf"),
+        ("B-L CP5 default to Peterson CP5 down", "fragCP5Petersondown", "weights_pT_peterson_down.pdf"),
+        ("B-L CP5 default to B-L CUETP8M2T4 central", "fragCUETP8M2T4BL", "weights_pT_BL_cuetp8m2t4_central.pdf"),
+        ("B-L CP5 default to B-L CUETP8M2T4 TOP-18-012 central", "fragCUETP8M2T4BLLHC", "weights_pT_BL_cuetp8m2t4_top-18-012_central.pdf"),
+        ("B-L CP5 default to B-L CUETP8M2T4 TOP-18-012 up", "fragCUETP8M2T4BLLHCup", "weights_pT_BL_cuetp8m2t4_top-18-012_up.pdf"),
+        ("B-L CP5 default to B-L CUETP8M2T4 TOP-18-012 down", "fragCUETP8M2T4BLLHCdown", "weights_pT_BL_cuetp8m2t4_top-18-012_down.pdf"),
+    ]
+
+    tasks = [ (plot["name"], plotVariations, (plot, output)) for plot in plotCfg ]
+    tasks += [ (plot["name"], plotPtVariations, (plot, output)) for plot in pTplots ]
+    tasks += [ (os.path.splitext(out)[0], plotWeights, (leg, gr, out, inDir, output)) for leg,gr,out in weights ]
+    tasks += [ (os.path.splitext(out)[0], plotPtWeights, (leg, gr, out, inDir, output)) for leg,gr,out in pTweights ]
+    return tasks
+
+def renderTask(task):
+    name, func, args = task
+    func(*args)
+    return name
+
+if __name__ == "__main__":
+    # Options
+
+    parser = argparse.ArgumentParser(description='Draw systematics')
+    parser.add_argument('-o', '--output', type=str, help='Output directory')
+    parser.add_argument('-i', '--input', type=str, help='Input directory')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of worker processes rendering the plots')
+    parser.add_argument('--only', nargs='+', help='Only draw the plots with these names (shell-style wildcards allowed, e.g. "bFrag_pT_*")')
+
+    options = parser.parse_args()
+
+    if not os.path.isdir(options.output):
+        os.makedirs(options.output)
+
+    setTDRStyle()
+
+    tasks = plotTasks(options.input, options.output)
+    if options.only:
+        tasks = [ t for t in tasks if any(fnmatch.fnmatch(t[0], pattern) for pattern in options.only) ]
+        if not tasks:
+            parser.error("No plot matches {}, available: {}".format(" ".join(options.only), " ".join(t[0] for t in plotTasks(options.input, options.output))))
+
+    if options.jobs > 1 and len(tasks) > 1:
+        pool = multiprocessing.Pool(min(options.jobs, len(tasks)), initializer=setTDRStyle)
+        try:
+            pool.map(renderTask, tasks, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        for task in tasks:
+            renderTask(task)
+    FILES.close()
@@ -0,0 +1,214 @@
+#!/usr/bin/env python
+
+"""
+Offline replay of the debug histograms of BFragmentationAnalyzer.
+
+The analyzer can write a compact per-jet ntuple (`ntuple=True` in runBFragmentationAnalyzer_cfg.py) with, for every jet
+containing a B hadron, the event number, the number of jets in the event, xb_lead_B, the jet pT, leadTagId_B and the
+semileptonic decay flags. This script applies candidate weight files to these records, following the rules of
+BFragmentationWeightProducer, and writes the same debug_* histograms as a debug run of the analyzer, together with the
+summed histograms of the inputs, such that the output can be used instead of xb_{REF}_debug.root by
+fixWeightNormalization.py and plotResults.py:
+
+    ./replayWeights.py ntuple_output/ -w results/ -o results/xb_CP5BLdefault_debug.root -j 8
+
+The records are read and evaluated in chunks of whole events; jets without a B hadron have weight 1, so the per-event
+histograms (debug_nJets_*, debug_norm_*) are obtained from the unweighted ones by adding the difference between the
+product of the jet weights and 1 for the events with B jets.
+"""
+
+import argparse
+import os
+import multiprocessing
+import numpy as np
+
+from bfragConfig import DEBUG_TUNES
+from weightEvaluator import WeightEvaluator, bufferToArray, findBin
+from mergeOutputs import DIRECTORY, readHists, treeReduce, writeHists
+
+TREE = DIRECTORY + "/jets"
+# columns of the ntuple, read in two groups since TTree::Draw only returns up to four columns
+COLUMNS = [ ("event", "nJets", "xb_lead_B", "pt"), ("leadTagId_B", "hasSemiLepDecay", "hasTauSemiLepDecay") ]
+
+def findInputs(inputs):
+    """Return the list of ROOT files given directly or contained in the given folders"""
+    paths = []
+    for path in inputs:
+        if os.path.isdir(path):
+            paths += [ os.path.join(path, f) for f in sorted(os.listdir(path)) if f.endswith(".root") ]
+        else:
+            paths.append(path)
+    return paths
+
+def readChunk(tree, first, n):
+    """Return dictionary: column->array for n entries of the ntuple, starting at first"""
+    tree.SetEstimate(n + 1)
+    columns = {}
+    for group in COLUMNS:
+        nSel = tree.Draw(":".join(group), "", "goff", n, first)
+        for i, name in enumerate(group):
+            columns[name] = bufferToArray(getattr(tree, "GetV{}".format(i + 1))(), nSel)
+    columns["event"] = columns["event"].astype(np.uint64)
+    columns["nJets"] = columns["nJets"].astype(np.int64)
+    columns["leadTagId_B"] = columns["leadTagId_B"].astype(np.int64)
+    for name in "hasSemiLepDecay", "hasTauSemiLepDecay":
+        columns[name] = columns[name].astype(bool)
+    # the analyzer stores the values as floats
+    for name in "xb_lead_B", "pt":
+        columns[name] = columns[name].astype(np.float32)
+    return columns
+
+def iterEvents(path, chunkSize):
+    """Yield the ntuple of a file in chunks of about chunkSize jets, never splitting the jets of an event"""
+    import ROOT
+    fIn = ROOT.TFile.Open(path)
+    if not fIn or fIn.IsZombie():
+        raise IOError("Could not open {}".format(path))
+    tree = fIn.Get(TREE)
+    if not tree:
+        raise KeyError("No ntuple {} in {}, run the analyzer with ntuple=True".format(TREE, path))
+    nEntries = tree.GetEntries()
+    carry = None
+    for first in range(0, nEntries, chunkSize):
+        chunk = readChunk(tree, first, min(chunkSize, nEntries - first))
+        if carry is not None:
+            chunk = dict((name, np.concatenate([ carry[name], values ])) for name, values in chunk.items())
+        if first + chunkSize < nEntries:
+            # keep the last event for the next chunk, it might continue there
+            events = chunk["event"]
+            last = len(events) - np.argmax(events[::-1] != events[-1]) if np.any(events != events[-1]) else 0
+            carry = dict((name, values[last:]) for name, values in chunk.items())
+            chunk = dict((name, values[:last]) for name, values in chunk.items())
+        if len(chunk["event"]):
+            yield chunk
+    fIn.Close()
+
+def eventStarts(events):
+    """Indices of the first jet of each event, in an array where the jets of an event are contiguous"""
+    return np.flatnonzero(np.concatenate([ [ True ], events[1:] != events[:-1] ]))
+
+def fillCells(cells, nCells, weights):
+    """Return the sum of weights and of squared weights in each cell (global bin including under/overflows)"""
+    return np.bincount(cells, weights, nCells), np.bincount(cells, weights**2, nCells)
+
+class Binning(object):
+    """Edges of the analyzer histograms, read from the (unweighted) histograms of the inputs"""
+    def __init__(self, hists):
+        self.xb = hists["xb_lead_B"]["xedges"]
+        self.pt = hists["pt"]["xedges"]
+        self.ptXb = hists["xb_pt_lead_B"]["yedges"]
+        self.nJets = hists["nJets"]["xedges"]
+
+def replayFile(args):
+    """Evaluate the weights for all the jets of a file, return (dictionary: weight name->summed arrays, number of jets)"""
+    path, weightFiles, tunes, binning, chunkSize = args
+    fragVsPtFile, fragFile = weightFiles
+    wgtNames = [ "frag" + tune for tune in tunes ]
+    evaluator = WeightEvaluator(fragVsPtFile, fragFile, None, fragWeightsVsPt=wgtNames, fragWeights=wgtNames)
+
+    nXb, nPt, nXbPt, nNJets = len(binning.xb) + 1, len(binning.pt) + 1, (len(binning.xb) + 1) * (len(binning.ptXb) + 1), len(binning.nJets) + 1
+    sums = dict((name, {
+        "xb": [ np.zeros(nXb), np.zeros(nXb) ],
+        "xb_pt": [ np.zeros(nXbPt), np.zeros(nXbPt) ],
+        "pt": [ np.zeros(nPt), np.zeros(nPt) ],
+        "nJets": [ np.zeros(nNJets), np.zeros(nNJets) ],
+        "norm": [ 0., 0. ],
+    }) for name in evaluator.names())
+    nJetRecords = 0
+
+    for chunk in iterEvents(path, chunkSize):
+        xb, pt = chunk["xb_lead_B"], chunk["pt"]
+        starts = eventStarts(chunk["event"])
+        # bins are computed once for all weights, same as TAxis::FindBin
+        xbCells = findBin(binning.xb, xb)
+        ptCells = findBin(binning.pt, pt)
+        xbPtCells = findBin(binning.ptXb, pt) * nXb + xbCells
+        nJetsCells = findBin(binning.nJets, chunk["nJets"][starts])
+        nJetRecords += len(xb)
+
+        weights = evaluator.evaluate(xb, pt, chunk["leadTagId_B"], chunk["hasSemiLepDecay"])
+        for name, w in weights.items():
+            s = sums[name]
+            w64 = w.astype(np.float64)
+            for key, cells, n in ("xb", xbCells, nXb), ("xb_pt", xbPtCells, nXbPt), ("pt", ptCells, nPt):
+                sumw, sumw2 = fillCells(cells, n, w64)
+                s[key][0] += sumw
+                s[key][1] += sumw2
+            # product of the jet weights per event, accumulated in single precision as in the analyzer
+            prod = np.multiply.reduceat(w, starts).astype(np.float64)
+            s["nJets"][0] += np.bincount(nJetsCells, prod - 1., nNJets)
+            s["nJets"][1] += np.bincount(nJetsCells, prod**2 - 1., nNJets)
+            s["norm"][0] += np.sum(prod - 1.)
+            s["norm"][1] += np.sum(prod**2 - 1.)
+    return sums, nJetRecords
+
+def debugHists(base, sums, nJetRecords):
+    """Build the debug histograms (as arrays, see mergeOutputs.readHists) from the summed weights and the unweighted histograms"""
+    hists = {}
+    nEvents = base["norm"]["entries"]
+    for name, s in sums.items():
+        for key, template, title, entries in [
+                ("xb", "xb_lead_B", [ "B", "x_{b}=p_{T}(B)/p_{T}(jet)", " Jets" ], nJetRecords),
+                ("xb_pt", "xb_pt_lead_B", [ "B", "x_{b}=p_{T}(B)/p_{T}(jet)", "p_{T}(jet)" ], nJetRecords),
+                ("pt", "pt", [ "pt", "Events" ], nJetRecords) ]:
+            arrays = dict((k, v) for k, v in base[template].items() if k.endswith("edges"))
+            arrays.update({ "contents": s[key][0], "sumw2": s[key][1], "entries": np.array(float(entries)),
+                            "name": np.array("debug_{}_{}".format(template, name)), "titles": np.array(title) })
+            hists["debug_{}_{}".format(template, name)] = arrays
+        # events without B jets have weight 1: start from the unweighted histograms
+        for key, title in ("nJets", [ "#nGenJets", "Events" ]), ("norm", [ "#norm", "Events" ]):
+            arrays = dict((k, np.copy(v)) for k, v in base[key].items() if k in ("xedges", "contents", "sumw2"))
+            if key == "nJets":
+                arrays["contents"] += s[key][0]
+                arrays["sumw2"] += s[key][1]
+            else:
+                arrays["contents"][1] += s[key][0]
+                arrays["sumw2"][1] += s[key][1]
+            arrays.update({ "entries": np.array(float(nEvents)), "name": np.array("debug_{}_{}".format(key, name)), "titles": np.array(title) })
+            hists["debug_{}_{}".format(key, name)] = arrays
+    return hists
+
+def replayWeights(inputs, fragVsPtFile, fragFile, outPath, tunes=DEBUG_TUNES, jobs=1, chunkSize=1000000):
+    """Replay the debug histograms for the ntuples in the inputs (files or folders) with the given weight files, write them to outPath"""
+    paths = findInputs(inputs)
+    if not paths:
+        raise RuntimeError("No input files found in {}".format(", ".join(inputs)))
+
+    # unweighted histograms, summed over the inputs (any debug histograms already there are replaced)
+    base = treeReduce([ readHists(path) for path in paths ])
+    base = dict((name, arrays) for name, arrays in base.items() if not name.startswith("debug_"))
+    binning = Binning(base)
+
+    tasks = [ (path, (fragVsPtFile, fragFile), tunes, binning, chunkSize) for path in paths ]
+    if jobs > 1:
+        pool = multiprocessing.Pool(min(jobs, len(tasks)))
+        try:
+            results = pool.map(replayFile, tasks)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [ replayFile(task) for task in tasks ]
+
+    sums, nJetRecords = results[0]
+    for other, n in results[1:]:
+        nJetRecords += n
+        for name, s in sums.items():
+            for key in s:
+                s[key] = [ s[key][0] + other[name][key][0], s[key][1] + other[name][key][1] ]
+    print("Replayed {} weights on {} jets from {} files".format(len(sums), nJetRecords, len(paths)))
+
+    base.update(debugHists(base, sums, nJetRecords))
+    writeHists(outPath, base)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Replay the debug histograms of BFragmentationAnalyzer from its per-jet ntuples, with candidate weight files')
+    parser.add_argument('input', nargs='+', help='Analyzer outputs with ntuples (files or folders)')
+    parser.add_argument('-w', '--weights', required=True, help='Folder containing the bfragweights.root and bfragweights_vs_pt.root files to apply')
+    parser.add_argument('-o', '--output', required=True, help='Output file, to be used as debug input of fixWeightNormalization.py and plotResults.py')
+    parser.add_argument('-j', '--jobs', type=int, default=1, help='Number of worker processes (one input file per task)')
+    parser.add_argument('--chunk', type=int, default=1000000, help='Number of jets read and evaluated at once')
+    parser.add_argument('--tunes', nargs='+', default=DEBUG_TUNES, help='Weights to replay (default: same as the analyzer)')
+    args = parser.parse_args()
+
+    replayWeights(args.input, os.path.join(args.weights, "bfragweights_vs_pt.root"), os.path.join(args.weights, "bfragweights.root"), args.output, args.tunes, args.jobs, args.chunk)
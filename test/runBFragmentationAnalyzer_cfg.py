@@ -27,6 +27,16 @@ options.register('debug',
 		 VarParsing.multiplicity.singleton,
                  VarParsing.varType.string,
 		 "Produce xb histograms where the weights from a previous run are applied")
+options.register('ntuple',
+		 'False',
+		 VarParsing.multiplicity.singleton,
+                 VarParsing.varType.string,
+		 "Also write a per-jet ntuple, for replaying the debug histograms offline with replayWeights.py")
+options.register('nThreads',
+		 1,
+		 VarParsing.multiplicity.singleton,
+                 VarParsing.varType.int,
+		 "Number of threads (and streams) of the job")
 options.parseArguments()
 print(options.outputFile)
 
@@ -67,7 +77,9 @@ process.RandomNumberGeneratorService.externalLHEProducer.initialSeed = options.s
 # )
 
 process.options = cms.untracked.PSet(
- wantSummary = cms.untracked.bool(True)
+ wantSummary = cms.untracked.bool(True),
+ numberOfThreads = cms.untracked.uint32(options.nThreads),
+ numberOfStreams = cms.untracked.uint32(0)
 )
 
 process.source = cms.Source("EmptySource")
@@ -158,6 +170,8 @@ if options.debug.lower() == "true":
     process.bfragAnalysis = bfragAnalysis.clone(debug=cms.untracked.bool(True))
 else:
     process.bfragAnalysis = bfragAnalysis
+if options.ntuple.lower() == "true":
+    process.bfragAnalysis = process.bfragAnalysis.clone(ntuple=cms.untracked.bool(True))
 
 # Path and EndPath definitions
 process.ProductionFilterSequence = cms.Sequence(process.generator)
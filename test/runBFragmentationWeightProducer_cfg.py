@@ -8,6 +8,26 @@ options.register('inputFile',
                  VarParsing.varType.string,
                  "input file to process"
                  )
+options.register('nThreads', 1,
+                 VarParsing.multiplicity.singleton,
+                 VarParsing.varType.int,
+                 "number of threads (and streams)"
+                 )
+options.register('weights', True,
+                 VarParsing.multiplicity.singleton,
+                 VarParsing.varType.bool,
+                 "run the weight producer (disable to measure the memory used without it)"
+                 )
+options.register('packed', False,
+                 VarParsing.multiplicity.singleton,
+                 VarParsing.varType.bool,
+                 "put all the weights in a single product instead of one ValueMap per variation"
+                 )
+options.register('memoryCheck', False,
+                 VarParsing.multiplicity.singleton,
+                 VarParsing.varType.bool,
+                 "report the memory usage with SimpleMemoryCheck"
+                 )
 options.parseArguments()
 
 process = cms.Process("Analysis")
@@ -17,6 +37,12 @@ process.load("FWCore.MessageService.MessageLogger_cfi")
 process.MessageLogger.cerr.threshold = ''
 process.MessageLogger.cerr.FwkReport.reportEvery = 1000
 
+process.options = cms.untracked.PSet(
+    numberOfThreads = cms.untracked.uint32(options.nThreads),
+    numberOfStreams = cms.untracked.uint32(options.nThreads),
+)
+if options.memoryCheck:
+    process.SimpleMemoryCheck = cms.Service("SimpleMemoryCheck", ignoreTotal = cms.untracked.int32(1))
 
 # set input to process
 process.maxEvents = cms.untracked.PSet( input = cms.untracked.int32(options.maxEvents) )
@@ -40,8 +66,11 @@ process.particleLevel.excludeNeutrinosFromJetClustering = False
 
 # b-frag weight producer
 process.load('TopQuarkAnalysis.BFragmentationAnalyzer.bfragWgtProducer_cfi')
+process.bfragWgtProducer.packed = options.packed
 
-process.p = cms.Path(process.mergedGenParticles*process.genParticles2HepMC*process.particleLevel*process.bfragWgtProducer)
+process.p = cms.Path(process.mergedGenParticles*process.genParticles2HepMC*process.particleLevel)
+if options.weights:
+    process.p += process.bfragWgtProducer
 
 process.out = cms.OutputModule("PoolOutputModule",
     fileName = cms.untracked.string("bfragWgtProducer.root"),
@@ -0,0 +1,153 @@
+#!/usr/bin/env python
+
+"""
+Run a campaign on the local machine instead of condor.
+
+The scenarios of a submission file (condor.sub, or a planned one from planCampaign.py) are expanded into jobs numbered
+as the condor ProcId, with the same seeds (1000+JOBID) and output names (xb_{TAG}_{JOBID}.root) as condor_script.sh.
+The jobs run in a pool of `--jobs` parallel processes (each using `--threads` threads), failed jobs are retried, and
+the outputs of each tag are merged into xb_{TAG}.root as soon as all its jobs are done, while the other tags are still
+running. Job outputs which already exist are kept, such that an interrupted campaign can be resumed, and the jobs of
+the tags with a stop signal from monitorCampaign.py are not started:
+
+    ./runCampaign.py local_output condor.sub --jobs 16 --threads 4
+
+The command of each job is a format string with the fields {cfg}, {nevents}, {tune}, {frag}, {param}, {tag},
+{debug}, {ntuple}, {seed}, {jobId}, {output} and {threads}, and runs in the output folder (see CMSRUN_COMMAND for the default).
+"""
+
+import argparse
+import multiprocessing
+import multiprocessing.pool
+import os
+import shlex
+import subprocess
+import time
+
+from campaign import readSubmitFile
+from mergeOutputs import JOB_OUTPUT, BR_OUTPUT, sumChunk, treeReduce, writeHists
+
+CFG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "runBFragmentationAnalyzer_cfg.py")
+# same as condor_script.sh
+CMSRUN_COMMAND = "cmsRun {cfg} maxEvents={nevents} frag={frag} param={param} tune={tune} outputFile={output} seed={seed} debug={debug} ntuple={ntuple} nThreads={threads}"
+
+def expandJobs(scenarios, nEvents):
+    """List of job dictionaries for all the scenarios, numbered in the same order as the condor ProcId"""
+    jobs = []
+    for scenario in scenarios:
+        for i in range(scenario["jobs"]):
+            jobId = len(jobs)
+            job = dict(scenario, jobId=jobId, seed=1000 + jobId, nevents=nEvents, output="xb_{}_{}.root".format(scenario["tag"], jobId))
+            jobs.append(job)
+    return jobs
+
+def jobOutputs(outDir, job):
+    """Output files of a job (cmsRun may append a suffix to the name)"""
+    matches = [ (f, JOB_OUTPUT.match(f)) for f in os.listdir(outDir) ]
+    return [ os.path.join(outDir, f) for f, m in matches if m and m.group("tag") == job["tag"] and int(m.group("job")) == job["jobId"] ]
+
+def runJob(args):
+    """Run a job, retrying on failure, return (job, status, number of attempts)"""
+    job, outDir, command, threads, retries, stopDir = args
+    if jobOutputs(outDir, job):
+        return job, "existing", 0
+    if stopDir and os.path.exists(os.path.join(stopDir, "{}.stop".format(job["tag"]))):
+        return job, "stopped", 0
+    cmd = command.format(cfg=CFG, threads=threads, **dict(job, debug=str(job["debug"]), ntuple=str(job.get("ntuple", False))))
+    logPath = os.path.join(outDir, "log", "{}_{}.log".format(job["tag"], job["jobId"]))
+    for attempt in range(1, retries + 2):
+        # append, to keep the output of the previous attempts
+        with open(logPath, "a") as log:
+            log.write("attempt {} of {}: {}\n".format(attempt, retries + 1, cmd))
+            log.flush()
+            ret = subprocess.call(shlex.split(cmd), cwd=outDir, stdout=log, stderr=subprocess.STDOUT)
+        if ret == 0 and jobOutputs(outDir, job):
+            return job, "done", attempt
+        # do not merge partial outputs of failed attempts
+        for path in jobOutputs(outDir, job):
+            os.remove(path)
+    return job, "failed", retries + 1
+
+def mergeTag(args):
+    """Merge the outputs of a tag into xb_{TAG}.root, return (tag, sum, number of merged files, list of (file, problem))"""
+    tag, paths, outDir = args
+    tag, total, nMerged, bad = sumChunk((tag, paths))
+    if total is not None:
+        writeHists(os.path.join(outDir, "xb_{}.root".format(tag)), total)
+    return tag, total, nMerged, bad
+
+def runCampaign(outDir, submitFile, jobs=1, threads=1, retries=2, command=CMSRUN_COMMAND, merge=True, stopDir=None, tags=None):
+    """Run all the jobs of a submission file locally, merge each tag when its jobs are done, return the list of failed jobs"""
+    _, macros, scenarios = readSubmitFile(submitFile)
+    # number the jobs of all the scenarios before selecting the tags, to keep the ProcId numbering and seeds of the full campaign
+    allJobs = expandJobs(scenarios, int(macros["nevents"]))
+    if tags:
+        scenarios = [ sc for sc in scenarios if sc["tag"] in tags ]
+        allJobs = [ job for job in allJobs if job["tag"] in tags ]
+    outDir = os.path.abspath(outDir)
+    if not os.path.isdir(os.path.join(outDir, "log")):
+        os.makedirs(os.path.join(outDir, "log"))
+    stopDir = stopDir if stopDir else os.path.join(outDir, "stop")
+    print("Running {} jobs for {} scenarios, {} in parallel with {} threads each".format(len(allJobs), len(scenarios), jobs, threads))
+
+    remaining = {}
+    for job in allJobs:
+        remaining[job["tag"]] = remaining.get(job["tag"], 0) + 1
+    finished = dict((tag, []) for tag in remaining)
+
+    # the jobs are separate processes, threads are enough to drive them; the merging needs its own process
+    mergePool = multiprocessing.Pool(1) if merge else None
+    pool = multiprocessing.pool.ThreadPool(jobs)
+    merges, failed = [], []
+    start = time.time()
+    try:
+        tasks = [ (job, outDir, command, threads, retries, stopDir) for job in allJobs ]
+        for i, (job, status, attempts) in enumerate(pool.imap_unordered(runJob, tasks)):
+            print("[{}/{}, {:.0f}s] {} job {}: {}{}".format(i + 1, len(tasks), time.time() - start, job["tag"], job["jobId"], status,
+                                                            " after {} attempts".format(attempts) if attempts > 1 else ""))
+            if status == "failed":
+                failed.append(job)
+            else:
+                finished[job["tag"]] += jobOutputs(outDir, job)
+            remaining[job["tag"]] -= 1
+            if remaining[job["tag"]] == 0 and merge and finished[job["tag"]]:
+                merges.append(mergePool.apply_async(mergeTag, ((job["tag"], sorted(finished[job["tag"]]), outDir),)))
+    finally:
+        pool.close()
+        pool.join()
+        if mergePool:
+            mergePool.close()
+
+    if merge:
+        tagSums = []
+        for result in merges:
+            tag, total, nMerged, bad = result.get()
+            print("{}: merged {} of {} files".format(tag, nMerged, len(finished[tag])))
+            for path, problem in sorted(bad):
+                print("    skipped {}: {}".format(path, problem))
+            tagSums.append(total)
+        mergePool.join()
+        summed = treeReduce(tagSums)
+        if summed is not None:
+            writeHists(os.path.join(outDir, BR_OUTPUT), summed)
+
+    for job in failed:
+        print("Failed: {} job {}, see {}".format(job["tag"], job["jobId"], os.path.join(outDir, "log", "{}_{}.log".format(job["tag"], job["jobId"]))))
+    return failed
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Run the jobs of a condor submission file on the local machine, and merge their outputs')
+    parser.add_argument('output', help='Output folder (same role as the condor output folder)')
+    parser.add_argument('submitFile', nargs='?', default='condor.sub', help='Submission file giving the scenarios and their number of jobs')
+    parser.add_argument('-j', '--jobs', type=int, default=multiprocessing.cpu_count(), help='Number of jobs running in parallel')
+    parser.add_argument('-t', '--threads', type=int, default=1, help='Number of threads of each job')
+    parser.add_argument('--retries', type=int, default=2, help='Number of times a failed job is retried')
+    parser.add_argument('--command', default=CMSRUN_COMMAND, help='Command of each job, format string with the fields listed in the module documentation')
+    parser.add_argument('--noMerge', action='store_true', help='Do not merge the outputs')
+    parser.add_argument('--stopDir', help='Folder with the stop signals of monitorCampaign.py (default: output/stop)')
+    parser.add_argument('--tags', nargs='+', help='Only run the scenarios with these tags')
+    args = parser.parse_args()
+
+    failed = runCampaign(args.output, args.submitFile, args.jobs, args.threads, args.retries, args.command, not args.noMerge, args.stopDir, args.tags)
+    if failed:
+        raise SystemExit(1)
@@ -0,0 +1,168 @@
+#!/usr/bin/env python
+
+"""
+Batched NumPy versions of the smoothing steps of buildWeightFile.py, working on stacks of histograms.
+
+All the functions take arrays of bin contents (without under/overflows) along the last axis, with the same binning
+for the whole stack, e.g. (tunes, pT slices, xb bins), and process the stack in one vectorised pass:
+
+- smoothArray and smoothRange reproduce TH1::SmoothArray ("353QH twice") and th1SmoothRange,
+- akimaSlopes and evalHermite reproduce scipy.interpolate.Akima1DInterpolator,
+- akimaWeights and smoothedWeights reproduce smoothWeightsAkima, and the density smoothing and ratio of deriveWeights,
+  returning the points of the smoothed weight graphs.
+
+The results agree with the ROOT/SciPy ones up to rounding (see checkSmoothing in benchmarkWeights.py):
+
+    x, weights = smoothedWeights(densities, refDensities, edges) # densities (tunes, slices, bins), refDensities (slices, bins)
+"""
+
+import numpy as np
+
+from bfragConfig import THRES, MAX
+
+def median3(a, b, c):
+    return np.maximum(np.minimum(a, b), np.minimum(np.maximum(a, b), c))
+
+def median5(values):
+    """Median of 5 arrays"""
+    return np.sort(np.stack(values), axis=0)[2]
+
+def smoothArray(xx, nTimes=1):
+    """Same as TH1::SmoothArray ("353QH twice") along the last axis of xx (at least 3 points), return a new array"""
+    xx = np.array(xx, dtype=np.float64)
+    nn = xx.shape[-1]
+    if nn < 3:
+        raise ValueError("Need at least 3 points for smoothing: n = {}".format(nn))
+    for _ in range(nTimes):
+        zz = xx.copy()
+        for noent in range(2): # run algorithm two times
+            # running median 3, 5 and 3
+            yy = zz.copy()
+            zz[...,1:-1] = median3(yy[...,:-2], yy[...,1:-1], yy[...,2:])
+            zz[...,0] = median3(zz[...,1], zz[...,0], 3 * zz[...,1] - 2 * zz[...,2])
+            zz[...,-1] = median3(zz[...,-2], zz[...,-1], 3 * zz[...,-2] - 2 * zz[...,-3])
+            yy = zz.copy()
+            if nn > 4:
+                zz[...,2:-2] = median5([ yy[...,i:nn - 4 + i] for i in range(5) ])
+            zz[...,1] = median3(yy[...,0], yy[...,1], yy[...,2])
+            zz[...,-2] = median3(yy[...,-3], yy[...,-2], yy[...,-1])
+            yy = zz.copy()
+            zz[...,1:-1] = median3(yy[...,:-2], yy[...,1:-1], yy[...,2:])
+
+            # quadratic interpolation for flat segments
+            yy = zz.copy()
+            if nn > 4:
+                ii = np.arange(2, nn - 2)
+                z, zLow, zHigh = zz[...,ii], zz[...,ii - 2], zz[...,ii + 2]
+                h0, h1 = zLow - z, zHigh - z
+                flat = (zz[...,ii - 1] == z) & (z == zz[...,ii + 1]) & (h0 * h1 > 0)
+                up = np.abs(h1) <= np.abs(h0) # jk = +1, -1 otherwise
+                zFar, zNear = np.where(up, zHigh, zLow), np.where(up, zLow, zHigh)
+                atI = -0.5 * zNear + z / 0.75 + zFar / 6.
+                atNext = 0.5 * (zFar - zNear) + z
+                # the points are processed in order in ROOT, and the later ones win: replay the three kinds of writes
+                # to a bin (from the previous point, the point itself and the next point) in the same order
+                target = np.zeros(zz.shape, dtype=bool)
+                values = np.zeros(zz.shape)
+                target[...,ii + 1] = flat & up
+                values[...,ii + 1] = atNext
+                yy = np.where(target, values, yy)
+                yy[...,ii] = np.where(flat, atI, yy[...,ii])
+                target[...] = False
+                target[...,ii - 1] = flat & ~up
+                values[...,ii - 1] = atNext
+                yy = np.where(target, values, yy)
+
+            # running means
+            zz[...,1:-1] = 0.25 * yy[...,:-2] + 0.5 * yy[...,1:-1] + 0.25 * yy[...,2:]
+            zz[...,0] = yy[...,0]
+            zz[...,-1] = yy[...,-1]
+
+            if noent == 0:
+                rr = zz.copy()
+                zz = xx - zz # residuals
+
+        smoothed = rr + zz
+        # only defined positive if the input is
+        xx = np.where(xx.min(axis=-1, keepdims=True) < 0, smoothed, np.maximum(smoothed, 0.))
+    return xx
+
+def rangeBins(edges, xMin, xMax):
+    """Slice of the bins (without under/overflow) within [xMin,xMax], as selected by th1SmoothRange"""
+    first = np.searchsorted(edges, xMin, side="right")
+    last = np.searchsorted(edges, xMax, side="right")
+    if last > 0 and xMax == edges[last - 1]:
+        last -= 1
+    # clamped to the axis range
+    return slice(max(first, 1) - 1, min(last, len(edges) - 1))
+
+def smoothRange(contents, edges, nTimes, xMin, xMax):
+    """Same as th1SmoothRange for a stack of contents (..., bins), return a new array"""
+    contents = np.array(contents, dtype=np.float64)
+    bins = rangeBins(edges, xMin, xMax)
+    contents[...,bins] = smoothArray(contents[...,bins], nTimes)
+    return contents
+
+def akimaSlopes(x, y):
+    """Slopes at the points x of the Akima sub-splines through y (..., points), same as Akima1DInterpolator"""
+    m = np.empty(y.shape[:-1] + (len(x) + 3,))
+    m[...,2:-2] = np.diff(y, axis=-1) / np.diff(x)
+    # two additional points on each side
+    m[...,1] = 2. * m[...,2] - m[...,3]
+    m[...,0] = 2. * m[...,1] - m[...,2]
+    m[...,-2] = 2. * m[...,-3] - m[...,-4]
+    m[...,-1] = 2. * m[...,-2] - m[...,-3]
+    # if m1 == m2 != m3 == m4, the slope is not defined: use the average
+    t = 0.5 * (m[...,3:] + m[...,:-3])
+    dm = np.abs(np.diff(m, axis=-1))
+    f1, f2 = dm[...,2:], dm[...,:-2]
+    f12 = f1 + f2
+    # same threshold as SciPy for a single curve
+    defined = f12 > 1e-9 * f12.max(axis=-1, keepdims=True)
+    return np.where(defined, (f1 * m[...,1:-2] + f2 * m[...,2:-1]) / np.where(defined, f12, 1.), t)
+
+def evalHermite(x, y, slopes, xNew):
+    """Evaluate the cubic Hermite splines through (x, y (..., points)) with slopes at the points xNew within [x[0], x[-1]]"""
+    i = np.clip(np.searchsorted(x, xNew, side="right") - 1, 0, len(x) - 2)
+    h = x[i + 1] - x[i]
+    d = xNew - x[i]
+    y0, y1, t0, t1 = y[...,i], y[...,i + 1], slopes[...,i], slopes[...,i + 1]
+    # same coefficients and order of the operations as CubicHermiteSpline
+    slope = (y1 - y0) / h
+    t = (t0 + t1 - 2. * slope) / h
+    c0 = t / h
+    c1 = (slope - t0) / h - t
+    return y0 + t0 * d + c1 * (d * d) + c0 * (d * d * d)
+
+def akimaWeights(ratios, edges, to1AboveThres=False, numPoints=300):
+    """Same as smoothWeightsAkima for a stack of ratios (..., bins): return (x, y (..., points)) of the smoothed weight graphs"""
+    ratios = np.asarray(ratios, dtype=np.float64)
+    centers = 0.5 * (edges[:-1] + edges[1:])
+    below = centers < THRES
+    x = np.concatenate(([ 0. ], centers[below], [ THRES ]))
+    yBelow = ratios[...,below]
+    y = np.concatenate((yBelow[...,:1], yBelow, yBelow[...,-1:]), axis=-1)
+
+    xDetail = np.linspace(0., THRES, numPoints)
+    yDetail = evalHermite(x, y, akimaSlopes(x, y), xDetail)
+
+    xAbove = np.linspace(THRES, MAX, numPoints)[1:]
+    if to1AboveThres:
+        yAbove = np.ones(ratios.shape[:-1] + xAbove.shape)
+    else:
+        # bin content at each point, TAxis::FindBin being searchsorted on the right (points are within the axis range)
+        yAbove = ratios[...,np.searchsorted(edges, xAbove[:-1], side="right") - 1]
+        yAbove = np.concatenate((yAbove, yAbove[...,-1:]), axis=-1)
+    return np.concatenate((xDetail, xAbove)), np.concatenate((yDetail, yAbove), axis=-1)
+
+def divide(num, den):
+    """Same as TH1::Divide for the contents: 0 where the denominator is 0"""
+    return np.where(den != 0, num / np.where(den != 0, den, 1.), 0.)
+
+def smoothedWeights(densities, refDensities, edges, nTimes=2, xMin=0., xMax=THRES, to1AboveThres=False, numPoints=300):
+    """Smoothed weights of a stack of densities (..., bins) with respect to reference densities (broadcastable to them):
+    smooth both within [xMin,xMax], divide, and interpolate with Akima sub-splines as in deriveWeights and derive2DWeights.
+    Return (x, y (..., points)) of the smoothed weight graphs"""
+    smooth = smoothRange(densities, edges, nTimes, xMin, xMax)
+    refSmooth = smoothRange(refDensities, edges, nTimes, xMin, xMax)
+    return akimaWeights(divide(smooth, refSmooth), edges, to1AboveThres, numPoints)
@@ -0,0 +1,237 @@
+#!/usr/bin/env python
+
+"""
+ROOT-free export of the weight files (bfragweights.root, bfragweights_vs_pt.root, bdecayweights.root).
+
+An archive holds the same graphs and histograms as the ROOT file it was exported from, as raw little-endian arrays
+that can be memory-mapped. The file starts with a small JSON header describing the axes, the variations and the
+provenance of the weights:
+
+    MAGIC | version, header size (2 x uint32) | JSON header | data, each array aligned to ALIGN bytes
+
+Array offsets in the header are relative to the start of the data, i.e. the first multiple of ALIGN after the header.
+Graphs are stored sorted along x, histogram contents (including under/overflows) are indexed as [x] or [x,y], i.e. in
+the same layout as graphToArrays and th2ToArrays of weightEvaluator.py. Opening an archive only reads the header, and
+loading a variation only maps the pages of its arrays. Reading only needs NumPy and the standard library:
+
+    archive = WeightArchive("bfragweights_vs_pt.bfw")
+    xEdges, yEdges, contents = archive.load("fragCP5BL_smooth")
+
+The archives are written next to the ROOT files by buildWeightFile.py, buildBRweights.py and fixWeightNormalization.py,
+existing ROOT files can be exported with
+
+    ./weightArchive.py bfragweights.root bdecayweights.root
+"""
+
+import argparse
+import json
+import os
+import struct
+import sys
+import time
+import numpy as np
+
+MAGIC = b"BFRAGWGT"
+VERSION = 1
+ALIGN = 64
+EXTENSION = ".bfw"
+PREAMBLE = struct.Struct("<II")
+
+def aligned(n):
+    return (n + ALIGN - 1) // ALIGN * ALIGN
+
+def archivePath(path):
+    """Name of the archive exported from a ROOT file"""
+    return os.path.splitext(path)[0] + EXTENSION
+
+def isArchive(path):
+    """True if path is an existing weight archive"""
+    if not os.path.isfile(path):
+        return False
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+def writeArchive(path, variations, provenance=None):
+    """Write a weight archive
+
+    variations: list of (name, kind, axes, arrays), with kind "graph", "hist1d" or "hist2d", axes a list of
+    (role, suggested axis name, array) and arrays a dictionary of data arrays. Identical axes are only stored once.
+    """
+    blocks = [] # (offset, array)
+
+    def addBlock(array):
+        array = np.ascontiguousarray(array)
+        array = array.astype(array.dtype.newbyteorder("<"), copy=False)
+        offset = aligned(blocks[-1][0] + blocks[-1][1].nbytes) if blocks else 0
+        blocks.append((offset, array))
+        return { "offset": offset, "dtype": array.dtype.str, "shape": list(array.shape) }
+
+    axes, axisArrays, entries = {}, {}, {}
+    for name, kind, varAxes, arrays in variations:
+        if name in entries:
+            raise ValueError("Duplicate variation {} in {}".format(name, path))
+        roles = {}
+        for role, axisName, values in varAxes:
+            values = np.asarray(values, dtype=np.float64)
+            # reuse an identical axis, otherwise find a free name
+            match = [ n for n, a in axisArrays.items() if a.shape == values.shape and np.array_equal(a, values) ]
+            if match:
+                axisName = match[0]
+            else:
+                base, i = axisName, 0
+                while axisName in axes:
+                    i += 1
+                    axisName = "{}_{}".format(base, i)
+                axisArrays[axisName] = values
+                axes[axisName] = addBlock(values)
+            roles[role] = axisName
+        entries[name] = { "kind": kind, "axes": roles, "arrays": dict((key, addBlock(values)) for key, values in arrays.items()) }
+
+    header = {
+        "format": "bfragweights",
+        "version": VERSION,
+        "align": ALIGN,
+        "provenance": provenance if provenance else {},
+        "axes": axes,
+        "variations": entries,
+    }
+    headerBytes = json.dumps(header, sort_keys=True).encode("utf-8")
+    dataStart = aligned(len(MAGIC) + PREAMBLE.size + len(headerBytes))
+    with open(path, "wb") as f:
+        f.write(MAGIC)
+        f.write(PREAMBLE.pack(VERSION, len(headerBytes)))
+        f.write(headerBytes)
+        for offset, array in blocks:
+            f.write(b"\0" * (dataStart + offset - f.tell()))
+            f.write(array.tobytes())
+
+class WeightArchive(object):
+    """Read-only access to a weight archive: opening it only reads the header, arrays are memory-mapped on demand"""
+
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise IOError("{} is not a weight archive".format(path))
+            version, headerSize = PREAMBLE.unpack(f.read(PREAMBLE.size))
+            if version > VERSION:
+                raise IOError("{} has version {}, only up to {} is supported".format(path, version, VERSION))
+            self.header = json.loads(f.read(headerSize).decode("utf-8"))
+        self.dataStart = aligned(len(MAGIC) + PREAMBLE.size + headerSize)
+
+    def names(self):
+        return sorted(self.header["variations"])
+
+    def provenance(self):
+        return self.header["provenance"]
+
+    def kind(self, name):
+        return self._entry(name)["kind"]
+
+    def _entry(self, name):
+        entry = self.header["variations"].get(name)
+        if entry is None:
+            raise KeyError("Could not load variation {} from {}".format(name, self.path))
+        return entry
+
+    def _map(self, block):
+        shape = tuple(block["shape"])
+        if not np.prod(shape, dtype=np.int64):
+            return np.zeros(shape, dtype=np.dtype(block["dtype"]))
+        return np.memmap(self.path, dtype=np.dtype(block["dtype"]), mode="r", offset=self.dataStart + block["offset"], shape=shape)
+
+    def axis(self, axisName):
+        return self._map(self.header["axes"][axisName])
+
+    def arrays(self, name):
+        """Return dictionary with the (read-only, memory-mapped) axes and data arrays of a variation"""
+        entry = self._entry(name)
+        arrays = dict((role, self.axis(axisName)) for role, axisName in entry["axes"].items())
+        arrays.update((key, self._map(block)) for key, block in entry["arrays"].items())
+        return arrays
+
+    def load(self, name):
+        """Return (x,y) for a graph, (xEdges, contents) for a TH1, (xEdges, yEdges, contents) for a TH2"""
+        kind, arrays = self.kind(name), self.arrays(name)
+        if kind == "graph":
+            return arrays["x"], arrays["y"]
+        if kind == "hist1d":
+            return arrays["xedges"], arrays["contents"]
+        return arrays["xedges"], arrays["yedges"], arrays["contents"]
+
+def exportRootFile(inPath, outPath=None, provenance=None):
+    """Export all the graphs and histograms of a ROOT weight file to an archive, return the archive path"""
+    import ROOT
+    from histCache import fileHash, graphToDict, histToDict
+
+    outPath = outPath if outPath else archivePath(inPath)
+    fIn = ROOT.TFile.Open(inPath)
+    if not fIn or fIn.IsZombie():
+        raise IOError("Could not open {}".format(inPath))
+
+    variations, seen = [], set()
+    for key in fIn.GetListOfKeys():
+        name = key.GetName()
+        # only the highest cycle of each object, which is listed first
+        if name in seen:
+            continue
+        seen.add(name)
+        obj = key.ReadObj()
+        if obj.InheritsFrom("TGraph"):
+            arrays = graphToDict(obj)
+            order = np.argsort(arrays["x"], kind="stable")
+            data = dict((k, arrays[k][order]) for k in ("y", "ex", "ey") if k in arrays)
+            variations.append((name, "graph", [ ("x", "x", arrays["x"][order]) ], data))
+        elif obj.InheritsFrom("TH1") and obj.GetDimension() <= 2:
+            arrays = histToDict(obj)
+            dtype = np.float32 if obj.InheritsFrom("TArrayF") else np.float64
+            shape = [ len(arrays[ax + "edges"]) + 1 for ax in "yx"[2 - obj.GetDimension():] ]
+            # stored as [x] or [x,y], as histToDict follows the ROOT layout [y,x]
+            data = { "contents": arrays["contents"].reshape(shape).T.astype(dtype) }
+            if obj.GetSumw2N():
+                data["errors"] = arrays["errors"].reshape(shape).T
+            if obj.GetDimension() == 1:
+                variations.append((name, "hist1d", [ ("xedges", "xb", arrays["xedges"]) ], data))
+            else:
+                variations.append((name, "hist2d", [ ("xedges", "xb", arrays["xedges"]), ("yedges", "pt", arrays["yedges"]) ], data))
+        else:
+            print("Skipping {} ({}) in {}".format(name, obj.ClassName(), inPath))
+    fIn.Close()
+
+    info = {
+        "source": os.path.basename(inPath),
+        "sha1": fileHash(inPath),
+        "created": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "script": os.path.basename(sys.argv[0]),
+        "arguments": sys.argv[1:],
+        "cmssw": os.getenv("CMSSW_VERSION", ""),
+    }
+    if provenance:
+        info.update(provenance)
+    writeArchive(outPath, variations, info)
+    return outPath
+
+def describe(path):
+    """Print the provenance and variations of an archive"""
+    archive = WeightArchive(path)
+    print(path)
+    for key, value in sorted(archive.provenance().items()):
+        print("  {}: {}".format(key, value))
+    for name in archive.names():
+        arrays = archive.arrays(name)
+        print("  {:<32}{:<8}{}".format(name, archive.kind(name), ", ".join("{}{}".format(k, list(a.shape)) for k, a in sorted(arrays.items()))))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Export ROOT weight files to memory-mappable archives, or list the contents of archives')
+    parser.add_argument('inputs', nargs='+', help='ROOT weight files to export, or archives to list')
+    parser.add_argument('-o', '--outDir', help='Folder for the archives (default: next to the ROOT files)')
+    args = parser.parse_args()
+
+    for path in args.inputs:
+        if isArchive(path):
+            describe(path)
+            continue
+        outPath = archivePath(path)
+        if args.outDir:
+            outPath = os.path.join(args.outDir, os.path.basename(outPath))
+        print("Exported {} to {}".format(path, exportRootFile(path, outPath)))
@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+
+"""
+Vectorized evaluation of the fragmentation and BR weights, following the rules of BFragmentationWeightProducer.
+
+The weight files are read once into dense NumPy lookup tables, after which whole arrays of jets can be evaluated:
+
+    evaluator = WeightEvaluator("bfragweights_vs_pt.root", "bfragweights.root", "bdecayweights.root")
+    weights = evaluator.evaluate(xb_lead_B, jet_pt, leadTagId_B, hasSemiLepDecay)
+    weights["fragCP5BLVsPt"] # one weight per jet, same names as the producer outputs
+
+The archives exported by weightArchive.py (.bfw) can be given instead of the ROOT files, in which case ROOT is not loaded.
+"""
+
+import numpy as np
+
+from bfragConfig import FRAG_WEIGHTS_VS_PT, FRAG_WEIGHTS, BR_WEIGHTS, BR_HADRONS, MIN_PT
+from weightArchive import WeightArchive, isArchive
+
+def bufferToArray(buf, n, dtype=np.float64):
+    """Copy the first n entries of a C array returned by ROOT into a NumPy array"""
+    if hasattr(buf, "SetSize"): # legacy PyROOT buffers don't know their size
+        buf.SetSize(n)
+    return np.frombuffer(buf, dtype=dtype, count=n).copy()
+
+def bufferView(buf, n, dtype=np.float64):
+    """NumPy view on the first n entries of a C array returned by ROOT: modifying it modifies the ROOT object"""
+    if hasattr(buf, "SetSize"):
+        buf.SetSize(n)
+    view = np.frombuffer(buf, dtype=dtype, count=n)
+    if not view.flags.writeable:
+        raise TypeError("Buffer of type {} is read-only".format(type(buf).__name__))
+    return view
+
+def graphToArrays(gr):
+    """Return the (x,y) points of a TGraph as NumPy arrays, sorted along x"""
+    n = gr.GetN()
+    x = bufferToArray(gr.GetX(), n)
+    y = bufferToArray(gr.GetY(), n)
+    order = np.argsort(x, kind="stable")
+    return x[order], y[order]
+
+def th2ToArrays(hist):
+    """Return the x and y bin edges and the contents (including under/overflows, indexed as [x,y]) of a TH2"""
+    xAxis, yAxis = hist.GetXaxis(), hist.GetYaxis()
+    xEdges = np.array([ xAxis.GetBinLowEdge(i) for i in range(1, xAxis.GetNbins() + 2) ], dtype=np.float64)
+    yEdges = np.array([ yAxis.GetBinLowEdge(i) for i in range(1, yAxis.GetNbins() + 2) ], dtype=np.float64)
+    contents = np.array([ [ hist.GetBinContent(i, j) for j in range(len(yEdges) + 1) ] for i in range(len(xEdges) + 1) ], dtype=np.float32)
+    return xEdges, yEdges, contents
+
+def findBin(edges, x):
+    """Same as TAxis::FindBin on an array: 0 for underflow, len(edges) for overflow"""
+    return np.searchsorted(edges, x, side="right")
+
+def evalGraph(gx, gy, x):
+    """Same as TGraph::Eval (linear interpolation, linear extrapolation from the two closest points outside the range)"""
+    x = np.asarray(x, dtype=np.float64)
+    if len(gx) == 0:
+        return np.zeros(x.shape)
+    if len(gx) == 1:
+        return np.full(x.shape, gy[0])
+    up = np.clip(np.searchsorted(gx, x, side="right"), 1, len(gx) - 1)
+    low = up - 1
+    y = (x * (gy[low] - gy[up]) + gx[low] * gy[up] - gx[up] * gy[low]) / (gx[low] - gx[up])
+    # exact matches are returned without interpolation
+    exact = np.searchsorted(gx, x, side="left")
+    isExact = (exact < len(gx)) & (gx[np.minimum(exact, len(gx) - 1)] == x)
+    y[isExact] = gy[exact[isExact]]
+    return y
+
+def evalGraphs(graphs, x):
+    """Same as evalGraph for a list of graphs ((x,y) arrays sorted along x, at least 2 points each) at common points x, in one pass: return array (graphs, x)"""
+    x = np.asarray(x, dtype=np.float64)
+    nPts = np.array([ len(gx) for gx,_ in graphs ])
+    if np.any(nPts < 2):
+        raise ValueError("Graphs need at least 2 points to be evaluated together")
+    # pad the graphs with points at infinity, which are never used as neighbours
+    gxs = np.full((len(graphs), nPts.max()), np.inf)
+    gys = np.zeros(gxs.shape)
+    for i,(gx,gy) in enumerate(graphs):
+        gxs[i,:len(gx)] = gx
+        gys[i,:len(gy)] = gy
+    rows = np.arange(len(graphs))[:,None]
+    nBelow = np.sum(gxs[:,:,None] <= x[None,None,:], axis=1)
+    up = np.clip(nBelow, 1, (nPts - 1)[:,None])
+    low = up - 1
+    xLow, xUp, yLow, yUp = gxs[rows,low], gxs[rows,up], gys[rows,low], gys[rows,up]
+    y = (x * (yLow - yUp) + xLow * yUp - xUp * yLow) / (xLow - xUp)
+    # exact matches are returned without interpolation
+    last = np.maximum(nBelow - 1, 0)
+    isExact = (nBelow > 0) & (gxs[rows,last] == x)
+    y[isExact] = gys[rows,last][isExact]
+    return y
+
+class WeightEvaluator(object):
+    """Load the weight files once and evaluate all configured variations on arrays of jets"""
+
+    def __init__(self, fragVsPtFile=None, fragFile=None, brFile=None, fragWeightsVsPt=FRAG_WEIGHTS_VS_PT, fragWeights=FRAG_WEIGHTS, brWeights=BR_WEIGHTS):
+        self.fragWeightsVsPt = list(fragWeightsVsPt) if fragVsPtFile else []
+        self.fragWeights = list(fragWeights) if fragFile else []
+        self.brWeights = list(brWeights) if brFile else []
+
+        self.fragVsPtTables = {}
+        if self.fragWeightsVsPt:
+            tables = self._load(fragVsPtFile, [ wgt + "_smooth" for wgt in self.fragWeightsVsPt ], th2ToArrays)
+            self.fragVsPtTables = dict((wgt, tables[wgt + "_smooth"]) for wgt in self.fragWeightsVsPt)
+
+        self.fragGraphs = {}
+        if self.fragWeights:
+            graphs = self._load(fragFile, [ wgt + "_smooth" for wgt in self.fragWeights ], graphToArrays)
+            self.fragGraphs = dict((wgt, graphs[wgt + "_smooth"]) for wgt in self.fragWeights)
+
+        # BR weights only depend on the (signed) hadron ID: tabulate them once
+        self.brTables = {}
+        if self.brWeights:
+            bids = np.array([ -b for b in BR_HADRONS ] + BR_HADRONS, dtype=np.float64)
+            for wgt, (gx, gy) in self._load(brFile, self.brWeights, graphToArrays).items():
+                self.brTables[wgt] = dict(zip(bids.astype(int), evalGraph(gx, gy, bids).astype(np.float32)))
+
+    @classmethod
+    def _load(cls, path, names, convert):
+        """Return dictionary: name->arrays for objects of a ROOT weight file (converted to arrays) or of an exported archive"""
+        if isArchive(path):
+            archive = WeightArchive(path)
+            return dict((name, archive.load(name)) for name in names)
+        fIn = cls._open(path)
+        objs = dict((name, convert(cls._get(fIn, path, name))) for name in names)
+        fIn.Close()
+        return objs
+
+    @staticmethod
+    def _open(path):
+        import ROOT
+        fIn = ROOT.TFile.Open(path)
+        if not fIn or fIn.IsZombie():
+            raise IOError("Could not open {}".format(path))
+        return fIn
+
+    @staticmethod
+    def _get(fIn, path, name):
+        obj = fIn.Get(name)
+        if not obj:
+            raise KeyError("Could not load object {} from {}".format(name, path))
+        return obj
+
+    def names(self):
+        """Names of the weights returned by evaluate, as produced by BFragmentationWeightProducer"""
+        return self.brWeights + self.fragWeights + [ wgt + "VsPt" for wgt in self.fragWeightsVsPt ]
+
+    def evaluate(self, xb, pt, bId, semiLep):
+        """Return dictionary: weight name->array of per-jet weights, for arrays of xb_lead_B, jet pt, leadTagId_B and hasSemiLepDecay"""
+        xb = np.asarray(xb, dtype=np.float32).astype(np.float64)
+        pt = np.asarray(pt, dtype=np.float64)
+        bId = np.asarray(bId, dtype=np.int64)
+        semiLep = np.asarray(semiLep, dtype=bool)
+        hasB = bId != 0
+
+        weights = {}
+
+        # pt-averaged weights: here we can use the bins above xb=1
+        for wgt in self.fragWeights:
+            w = np.ones(xb.shape, dtype=np.float32)
+            w[hasB] = evalGraph(*self.fragGraphs[wgt], x=xb[hasB])
+            weights[wgt] = w
+
+        # pt-dependent weights: always use weight=1 if xb>1 or if outside of pT range
+        inRange = hasB & (xb < 1.) & (pt >= MIN_PT)
+        for wgt in self.fragWeightsVsPt:
+            xEdges, yEdges, contents = self.fragVsPtTables[wgt]
+            w = np.ones(xb.shape, dtype=np.float32)
+            w[inRange] = contents[findBin(xEdges, xb[inRange]), findBin(yEdges, pt[inRange])]
+            weights[wgt + "VsPt"] = w
+
+        # BR weights: only for the listed hadrons, depending on the presence of a semileptonic decay
+        absBid = np.abs(bId)
+        signedBid = np.where(semiLep, absBid, -absBid)
+        for wgt in self.brWeights:
+            w = np.ones(xb.shape, dtype=np.float32)
+            for bid, value in self.brTables[wgt].items():
+                w[signedBid == bid] = value
+            weights[wgt] = w
+
+        return weights